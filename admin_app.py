@@ -1,11 +1,11 @@
 import streamlit as st
-import firebase_admin
-from firebase_admin import credentials, firestore
-import json
-import datetime
 import pandas as pd
 import altair as alt
-import time
+
+import admin_data
+import admin_stats
+import clients
+import instrumentation
 
 # -----------------------
 # 1. CONFIGURATION & INITIAL SETUP
@@ -42,19 +42,36 @@ if not st.session_state["admin_authenticated"]:
 # -----------------------
 # 3. FIREBASE INITIALIZATION
 # -----------------------
-# Load Firebase service account credentials from secrets (stored as JSON string)
-firebase_creds_str = st.secrets["firebase"]["credentials_json"]
-if isinstance(firebase_creds_str, str):
-    firebase_creds = json.loads(firebase_creds_str)
-else:
-    firebase_creds = firebase_creds_str
+# Firebase Admin is initialised once per process from the credentials in secrets (see clients.py)
+clients.configure(st.secrets)
+db = clients.get_firestore()
+
+# Firestore loader timings; separate export paths from the user app's (optional [instrumentation] section).
+instrumentation_config = st.secrets.get("instrumentation", {})
+instrumentation.configure(
+    prometheus_path=instrumentation_config.get("admin_prometheus_path", ""),
+    metrics_path=instrumentation_config.get("admin_metrics_path", "")
+)
 
-# Initialize Firebase Admin if not already initialized
-if firebase_creds and not firebase_admin._apps:
-    cred = credentials.Certificate(firebase_creds)
-    firebase_admin.initialize_app(cred)
+@st.cache_resource
+def get_live_data() -> admin_data.LiveAdminData:
+    # Shared by all admin sessions; snapshot listeners keep it current after the first load.
+    return admin_data.LiveAdminData(clients.get_firestore(),
+                                    users_refresh=float(st.secrets.get("admin", {}).get("users_refresh_seconds", 60)))
 
-db = firestore.client()
+live_data = None
+live_health = None
+if st.secrets.get("admin", {}).get("live_data", True):
+    with st.spinner("Loading admin data..."):
+        live_data = get_live_data()
+        live_data.check_watches()
+        live_health = live_data.health()
+        if not live_data.wait_ready(timeout=float(st.secrets.get("admin", {}).get("live_data_timeout", 30))):
+            st.warning("Live admin data is still loading; reading Firestore directly for now.")
+            live_data = None
+        elif not live_data.healthy():
+            st.warning("Live admin data is reconnecting; reading Firestore directly for now.")
+            live_data = None
 
 # -----------------------
 # 4. SIDEBAR NAVIGATION
@@ -62,6 +79,35 @@ db = firestore.client()
 st.sidebar.title("Admin Navigation")
 page = st.sidebar.radio("Select Page", ["Dashboard", "Users", "Learning Plans", "Reported Issues"])
 
+if live_health is not None:
+    with st.sidebar.expander("Live data status"):
+        st.dataframe(pd.DataFrame.from_dict(live_health["tables"], orient="index"))
+        st.caption(f"Changes applied: {live_health['changes_applied']}")
+        for error in live_health["errors"]:
+            st.text(error)
+
+def show_paged_table(table_key: str, fetch_page, search_term: str, spinner_text: str):
+    # Cursor pagination: the session keeps the stack of page-start cursors for this listing.
+    page_size = st.selectbox("Rows per page", [10, 25, 50, 100], index=1, key=f"{table_key}_page_size")
+    query_key = (search_term.strip().lower(), page_size, fetch_page.__qualname__)
+    if st.session_state.get(f"{table_key}_query") != query_key:
+        st.session_state[f"{table_key}_query"] = query_key
+        st.session_state[f"{table_key}_cursors"] = [None]
+    cursors = st.session_state[f"{table_key}_cursors"]
+
+    with st.spinner(spinner_text):
+        rows, next_cursor, has_more = fetch_page(db, search_term, page_size, cursors[-1])
+    st.dataframe(pd.DataFrame(rows))
+
+    col1, col2, col3 = st.columns([1, 1, 4])
+    col3.write(f"Page {len(cursors)}")
+    if col1.button("Previous", key=f"{table_key}_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        rerun()
+    if col2.button("Next", key=f"{table_key}_next", disabled=not has_more):
+        cursors.append(next_cursor)
+        rerun()
+
 # -----------------------
 # 5. DASHBOARD PAGE
 # -----------------------
@@ -69,31 +115,15 @@ if page == "Dashboard":
     st.title("Admin Dashboard")
     
     with st.spinner("Loading dashboard data..."):
-        time.sleep(1)  # Simulate loading delay
-
-        user_docs = list(db.collection("users").stream())
-        total_users = len(user_docs)
-        total_plans = 0
-        all_ratings = []
-        signup_dates = []
-        for user_doc in user_docs:
-            user_data = user_doc.to_dict()
-            created_at = user_data.get("created_at")
-            if created_at:
-                try:
-                    dt = datetime.datetime.fromisoformat(created_at)
-                    signup_dates.append({"date": dt.date()})
-                except Exception:
-                    pass
-            # Count learning plans for each user
-            plans = list(db.collection("users").document(user_doc.id).collection("learning_plans").stream())
-            total_plans += len(plans)
-            for plan in plans:
-                rating = plan.to_dict().get("rating")
-                if rating is not None:
-                    all_ratings.append(rating)
-        
-        avg_rating = sum(all_ratings)/len(all_ratings) if all_ratings else None
+        # Materialized stats first (a handful of reads); the tables only if they are missing.
+        metrics = admin_stats.read_stats(db)
+        if metrics is None:
+            st.info("Statistics have not been materialized yet; run `python migrations.py rebuild-admin-stats`. Computing them live for now.")
+            metrics = live_data.dashboard_metrics() if live_data else admin_data.load_dashboard_metrics(db)
+        total_users = metrics["total_users"]
+        total_plans = metrics["total_plans"]
+        avg_rating = metrics["avg_rating"]
+        signup_counts = metrics["signups"]
 
     # Display key metrics
     col1, col2, col3 = st.columns(3)
@@ -102,11 +132,11 @@ if page == "Dashboard":
     col3.metric("Average Rating", f"{avg_rating:.2f}" if avg_rating is not None else "N/A")
     
     # Bar chart of user signup dates
-    if signup_dates:
-        df_signup = pd.DataFrame(signup_dates)
+    if signup_counts:
+        df_signup = pd.DataFrame(signup_counts)
         chart = alt.Chart(df_signup).mark_bar().encode(
             x=alt.X("date:T", title="Signup Date"),
-            y=alt.Y("count()", title="Number of Users")
+            y=alt.Y("count:Q", title="Number of Users")
         )
         st.altair_chart(chart, use_container_width=True)
 
@@ -116,22 +146,8 @@ if page == "Dashboard":
 elif page == "Users":
     st.title("User Details")
     
-    with st.spinner("Loading user data..."):
-        user_list = []
-        for user_doc in db.collection("users").stream():
-            data = user_doc.to_dict()
-            email = data.get("email", "")
-            phone = data.get("phone", "")
-            # Count learning plans for each user
-            plans = list(db.collection("users").document(user_doc.id).collection("learning_plans").stream())
-            num_plans = len(plans)
-            user_list.append({"Email": email, "Phone": phone, "Learning Plans": num_plans})
-        df_users = pd.DataFrame(user_list)
-    
-    search_term = st.text_input("Search by Email")
-    if search_term:
-        df_users = df_users[df_users["Email"].str.contains(search_term, case=False, na=False)]
-    st.dataframe(df_users)
+    search_term = st.text_input("Search by Email (prefix)")
+    show_paged_table("users", live_data.users_page if live_data else admin_data.fetch_users_page, search_term, "Loading user data...")
 
 # -----------------------
 # 7. LEARNING PLANS PAGE
@@ -139,21 +155,8 @@ elif page == "Users":
 elif page == "Learning Plans":
     st.title("Learning Plans Overview")
     
-    with st.spinner("Loading learning plan data..."):
-        plans_list = []
-        for user_doc in db.collection("users").stream():
-            user_email = user_doc.to_dict().get("email", "")
-            for plan_doc in db.collection("users").document(user_doc.id).collection("learning_plans").stream():
-                plan_data = plan_doc.to_dict()
-                title = plan_data.get("title", "Untitled")
-                rating = plan_data.get("rating")
-                plans_list.append({"User Email": user_email, "Plan Title": title, "Rating": rating})
-        df_plans = pd.DataFrame(plans_list)
-    
-    search_term = st.text_input("Search Learning Plans by Title")
-    if search_term:
-        df_plans = df_plans[df_plans["Plan Title"].str.contains(search_term, case=False, na=False)]
-    st.dataframe(df_plans)
+    search_term = st.text_input("Search Learning Plans by Title (prefix)")
+    show_paged_table("plans", live_data.plans_page if live_data else admin_data.fetch_plans_page, search_term, "Loading learning plan data...")
 
 # -----------------------
 # 8. REPORTED ISSUES PAGE
@@ -161,13 +164,7 @@ elif page == "Learning Plans":
 elif page == "Reported Issues":
     st.title("Reported Issues")
     with st.spinner("Loading reported issues..."):
-        issues_list = []
-        for report in db.collection("reports").stream():
-            data = report.to_dict()
-            issues_list.append({
-                "User Email": data.get("email", ""),
-                "Description": data.get("description", ""),
-                "Timestamp": data.get("timestamp", "")
-            })
-        df_issues = pd.DataFrame(issues_list)
+        df_issues = pd.DataFrame(live_data.reports_rows() if live_data else admin_data.fetch_reports(db))
     st.dataframe(df_issues)
+
+instrumentation.export_metrics()
@@ -0,0 +1,418 @@
+import datetime
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import instrumentation
+
+# -----------------------
+# 1. AGGREGATION HELPERS
+# -----------------------
+def aggregate(aggregation_query) -> Dict[str, Any]:
+    # Runs a Firestore aggregation query and returns {alias: value}.
+    values = {}
+    for result in aggregation_query.get():
+        for item in result:
+            values[item.alias] = item.value
+    return values
+
+def signup_counts(created_at_values) -> List[Dict[str, Any]]:
+    # [{"date": date, "count": n}] for ISO-format created_at values, oldest first.
+    counts = Counter()
+    for created_at in created_at_values:
+        if not created_at:
+            continue
+        try:
+            counts[datetime.datetime.fromisoformat(created_at).date()] += 1
+        except Exception:
+            pass
+    return [{"date": day, "count": counts[day]} for day in sorted(counts)]
+
+# -----------------------
+# 2. DASHBOARD
+# -----------------------
+@instrumentation.timed("admin_dashboard", "firestore")
+def load_dashboard_metrics(db) -> Dict[str, Any]:
+    # Counts and the rating average are computed server-side; only created_at is pulled per user.
+    users = aggregate(db.collection("users").count(alias="total_users"))
+    plans = aggregate(
+        db.collection_group("learning_plans").count(alias="total_plans").avg("rating", alias="avg_rating")
+    )
+    created_at_values = (
+        (doc.to_dict() or {}).get("created_at")
+        for doc in db.collection("users").select(["created_at"]).stream()
+    )
+    return {
+        "total_users": int(users.get("total_users") or 0),
+        "total_plans": int(plans.get("total_plans") or 0),
+        "avg_rating": plans.get("avg_rating"),
+        "signups": signup_counts(created_at_values),
+    }
+
+# -----------------------
+# 3. PAGINATED, SERVER-SIDE SEARCHABLE LISTINGS
+# -----------------------
+# Both listings order by a lowercase copy of the searched field (written when the
+# document is created, backfilled by `python migrations.py lowercase-search-fields`),
+# so a search is a prefix range on that field and pages are walked with start_after.
+PREFIX_RANGE_END = "\uf8ff"  # sorts after any character users type
+
+def prefix_query(query, field: str, prefix: str):
+    prefix = prefix.strip().lower()
+    query = query.order_by(field)
+    if prefix:
+        query = query.where(filter=_field_filter(field, ">=", prefix)).where(
+            filter=_field_filter(field, "<", prefix + PREFIX_RANGE_END)
+        )
+    return query
+
+def fetch_page(query, page_size: int, start_after=None) -> Tuple[List[Any], Any, bool]:
+    # Returns (snapshots, next_cursor, has_more); pass next_cursor back as start_after for the next page.
+    if start_after is not None:
+        query = query.start_after(start_after)
+    docs = list(query.limit(page_size + 1).stream())
+    docs, has_more = docs[:page_size], len(docs) > page_size
+    return docs, (docs[-1] if docs else None), has_more
+
+@instrumentation.timed("admin_user_plan_count", "firestore")
+def count_user_plans(db, user_id: str) -> int:
+    result = aggregate(db.collection("users").document(user_id).collection("learning_plans").count(alias="plans"))
+    return int(result.get("plans") or 0)
+
+@instrumentation.timed("admin_users_page", "firestore")
+def fetch_users_page(db, search: str = "", page_size: int = 25, start_after=None) -> Tuple[List[Dict[str, Any]], Any, bool]:
+    query = prefix_query(db.collection("users").select(["email", "phone", "email_lower"]), "email_lower", search)
+    docs, next_cursor, has_more = fetch_page(query, page_size, start_after)
+    plan_counts = count_plans_for(db, [doc.id for doc in docs])
+    rows = []
+    for doc, plan_count in zip(docs, plan_counts):
+        data = doc.to_dict() or {}
+        rows.append({
+            "Email": data.get("email", ""),
+            "Phone": data.get("phone", ""),
+            "Learning Plans": plan_count,
+        })
+    return rows, next_cursor, has_more
+
+def count_plans_for(db, user_ids: List[str], max_workers: int = 16) -> List[int]:
+    # One count aggregation per user, run concurrently so a page costs about one round trip.
+    if not user_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(user_ids))) as executor:
+        return list(executor.map(instrumentation.bind(lambda user_id: count_user_plans(db, user_id)), user_ids))
+
+@instrumentation.timed("admin_plans_page", "firestore")
+def fetch_plans_page(db, search: str = "", page_size: int = 25, start_after=None) -> Tuple[List[Dict[str, Any]], Any, bool]:
+    query = prefix_query(
+        db.collection_group("learning_plans").select(["title", "rating", "title_lower"]), "title_lower", search
+    )
+    docs, next_cursor, has_more = fetch_page(query, page_size, start_after)
+    rows = []
+    for doc in docs:
+        data = doc.to_dict() or {}
+        rows.append({
+            # User documents are keyed by email, so the owner comes from the path without another read.
+            "User Email": doc.reference.parent.parent.id,
+            "Plan Title": data.get("title", "Untitled"),
+            "Rating": data.get("rating"),
+        })
+    return rows, next_cursor, has_more
+
+@instrumentation.timed("admin_reports", "firestore")
+def fetch_reports(db) -> List[Dict[str, Any]]:
+    rows = []
+    for report in db.collection("reports").stream():
+        data = report.to_dict() or {}
+        rows.append({
+            "User Email": data.get("email", ""),
+            "Description": data.get("description", ""),
+            "Timestamp": data.get("timestamp", "")
+        })
+    return rows
+
+def _field_filter(field: str, op: str, value: Any):
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    return FieldFilter(field, op, value)
+
+# -----------------------
+# 4. LIVE, PROCESS-WIDE ADMIN TABLES
+# -----------------------
+class LiveAdminData:
+    """In-memory users, plans and reports tables kept current from Firestore.
+
+    One instance serves every admin session in the process. Plans and reports are kept
+    current by snapshot listeners: the first snapshot is the initial load, after that only
+    changed documents arrive and are applied as deltas. Users are loaded once with a
+    projected query; after that, every `users_refresh` seconds only users created since the
+    newest `created_at` seen are read (user documents are never edited or deleted by the
+    apps, so new signups are the only change). Totals come from admin_stats, not this table.
+
+    Trade-offs: listeners cannot project fields, so every field of every watched document
+    is streamed into this process (only the displayed fields are kept). That is why users,
+    whose documents hold the password, are polled by cursor rather than watched. Plans created before
+    the week split still carry their full `plan` blob until migrated. A watch that closes
+    (network, permissions, server restart) is detected by check_watches(), recorded in
+    health() and re-subscribed; healthy() is False until it has delivered a fresh initial
+    snapshot, and the admin app reads Firestore directly meanwhile. The page methods mirror
+    the Firestore-backed functions above (cursors are row offsets here).
+    """
+
+    WATCHED = ("plans", "reports")
+    MAX_ERRORS = 50
+
+    def __init__(self, db, users_refresh: float = 60.0):
+        self.db = db
+        self.users_refresh = users_refresh
+        self._lock = threading.Lock()
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.plans: Dict[str, Dict[str, Any]] = {}
+        self.reports: Dict[str, Dict[str, Any]] = {}
+        self.changes_applied = 0
+        self.errors: List[str] = []
+        self._ready = {name: threading.Event() for name in ("users",) + self.WATCHED}
+        self._sorted_cache: Dict[str, Tuple[int, List[Dict[str, Any]]]] = {}
+        self._version = 0
+        self._users_loaded_at = 0.0
+        self._users_loading = False
+        self._users_cursor: Optional[str] = None
+        self._health: Dict[str, Dict[str, Any]] = {
+            name: {"read_time": None, "updated_at": None, "subscriptions": 0, "active": False}
+            for name in ("users",) + self.WATCHED
+        }
+        self._watches: Dict[str, Any] = {}
+        self._closed = False
+        self.refresh_users(wait=False)
+        for name in self.WATCHED:
+            self._subscribe(name)
+
+    # -----------------------
+    # LOADING AND WATCH HEALTH
+    # -----------------------
+    def _query(self, name: str):
+        if name == "plans":
+            return self.db.collection_group("learning_plans"), self.plans, _plan_row
+        return self.db.collection("reports"), self.reports, _report_row
+
+    def _subscribe(self, name: str):
+        query, table, to_row = self._query(name)
+        self._ready[name].clear()
+        with self._lock:
+            self._health[name]["subscriptions"] += 1
+            self._health[name]["active"] = True
+        try:
+            self._watches[name] = query.on_snapshot(self._listener(name, table, to_row))
+        except Exception as e:
+            self._record_error(name, f"could not subscribe: {e}")
+            with self._lock:
+                self._health[name]["active"] = False
+
+    def check_watches(self):
+        # Re-subscribes any listener whose stream has closed; cheap enough to call on every rerun.
+        for name in self.WATCHED:
+            watch = self._watches.get(name)
+            with self._lock:
+                active = self._health[name]["active"]
+            if self._closed or (watch is not None and active and getattr(watch, "is_active", True)):
+                continue
+            self._record_error(name, "watch closed or failed; re-subscribing")
+            if watch is not None:
+                try:
+                    watch.unsubscribe()
+                except Exception:
+                    pass
+            self._subscribe(name)
+        if time.monotonic() - self._users_loaded_at > self.users_refresh:
+            self.refresh_users(wait=False)
+
+    def refresh_users(self, wait: bool = True, full: bool = False):
+        # Projected queries, so passwords never leave Firestore. The first load (or full=True)
+        # replaces the table; later loads read only users at or after the created_at cursor.
+        with self._lock:
+            if self._users_loading:
+                return
+            self._users_loading = True
+            cursor = None if full else self._users_cursor
+
+        def load():
+            try:
+                query = self.db.collection("users").select(["email", "email_lower", "phone", "created_at"])
+                if cursor is not None:
+                    query = query.where(filter=_field_filter("created_at", ">=", cursor)).order_by("created_at")
+                users = {doc.reference.path: _user_row(doc) for doc in query.stream()}
+                with self._lock:
+                    changed = cursor is None or bool(users.keys() - self.users.keys())
+                    if cursor is None:
+                        self.users.clear()
+                    self.users.update(users)
+                    created = [user["created_at"] for user in users.values() if isinstance(user["created_at"], str)]
+                    if created:
+                        self._users_cursor = max(created + ([self._users_cursor] if self._users_cursor else []))
+                    if changed:
+                        self._version += 1
+                    self._health["users"].update(read_time=_timestamp(), updated_at=_timestamp(), active=True)
+                self._ready["users"].set()
+            except Exception as e:
+                self._record_error("users", f"reload failed: {e}")
+            finally:
+                with self._lock:
+                    self._users_loading = False
+                    self._users_loaded_at = time.monotonic()
+
+        if wait:
+            load()
+        else:
+            threading.Thread(target=load, name="admin-users-load", daemon=True).start()
+
+    def wait_ready(self, timeout: float = 30.0) -> bool:
+        # Listeners that close before their first snapshot are re-subscribed while waiting.
+        deadline = time.monotonic() + timeout
+        while True:
+            pending = [event for event in self._ready.values() if not event.is_set()]
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                return not pending
+            self.check_watches()
+            pending[0].wait(min(0.5, remaining))
+
+    def healthy(self) -> bool:
+        with self._lock:
+            active = all(health["active"] for health in self._health.values())
+        return active and all(event.is_set() for event in self._ready.values())
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tables": {name: dict(health, ready=self._ready[name].is_set()) for name, health in self._health.items()},
+                "changes_applied": self.changes_applied,
+                "errors": list(self.errors[-10:]),
+            }
+
+    def _record_error(self, name: str, message: str):
+        with self._lock:
+            self.errors.append(f"{_timestamp()} {name}: {message}")
+            del self.errors[:-self.MAX_ERRORS]
+            if name in self.WATCHED:
+                self._health[name]["active"] = False
+
+    def close(self):
+        self._closed = True
+        for watch in self._watches.values():
+            watch.unsubscribe()
+
+    def _listener(self, name: str, table: Dict[str, Dict[str, Any]], to_row):
+        ready = self._ready[name]
+
+        def on_snapshot(snapshots, changes, read_time):
+            try:
+                with self._lock:
+                    if not ready.is_set():
+                        # First snapshot of a (re)subscription: the full result set, so rebuild.
+                        table.clear()
+                        table.update((doc.reference.path, to_row(doc)) for doc in snapshots)
+                    else:
+                        for change in changes:
+                            key = change.document.reference.path
+                            if change.type.name == "REMOVED":
+                                table.pop(key, None)
+                            else:
+                                table[key] = to_row(change.document)
+                    self.changes_applied += len(changes)
+                    self._version += 1
+                    self._health[name].update(read_time=_timestamp(read_time), updated_at=_timestamp(), active=True)
+            except Exception as e:
+                self._record_error(name, f"could not apply snapshot: {e}")
+            ready.set()
+        return on_snapshot
+
+    def _sorted(self, name: str, table: Dict[str, Dict[str, Any]], sort_field: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            cached = self._sorted_cache.get(name)
+            if cached is not None and cached[0] == self._version:
+                return cached[1]
+            rows = sorted(table.values(), key=lambda row: row.get(sort_field) or "")
+            self._sorted_cache[name] = (self._version, rows)
+            return rows
+
+    def _page(self, rows: List[Dict[str, Any]], field: str, search: str, page_size: int,
+              start_after) -> Tuple[List[Dict[str, Any]], int, bool]:
+        prefix = search.strip().lower()
+        if prefix:
+            rows = [row for row in rows if (row.get(field) or "").startswith(prefix)]
+        offset = start_after or 0
+        return rows[offset:offset + page_size], offset + page_size, len(rows) > offset + page_size
+
+    def users_page(self, db, search: str = "", page_size: int = 25, start_after=None) -> Tuple[List[Dict[str, Any]], Any, bool]:
+        users, next_cursor, has_more = self._page(self._sorted("users", self.users, "email_lower"),
+                                                  "email_lower", search, page_size, start_after)
+        with self._lock:
+            plan_counts = Counter(plan["user"] for plan in self.plans.values())
+        rows = [
+            {"Email": user["email"], "Phone": user["phone"], "Learning Plans": plan_counts.get(user["id"], 0)}
+            for user in users
+        ]
+        return rows, next_cursor, has_more
+
+    def plans_page(self, db, search: str = "", page_size: int = 25, start_after=None) -> Tuple[List[Dict[str, Any]], Any, bool]:
+        plans, next_cursor, has_more = self._page(self._sorted("plans", self.plans, "title_lower"),
+                                                  "title_lower", search, page_size, start_after)
+        rows = [{"User Email": plan["user"], "Plan Title": plan["title"], "Rating": plan["rating"]} for plan in plans]
+        return rows, next_cursor, has_more
+
+    def reports_rows(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            reports = list(self.reports.values())
+        return [
+            {"User Email": r["email"], "Description": r["description"], "Timestamp": r["timestamp"]}
+            for r in sorted(reports, key=lambda r: r["timestamp"] or "")
+        ]
+
+    def dashboard_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            created_at_values = [user["created_at"] for user in self.users.values()]
+            ratings = [plan["rating"] for plan in self.plans.values()
+                       if isinstance(plan["rating"], (int, float)) and not isinstance(plan["rating"], bool)]
+            total_users, total_plans = len(self.users), len(self.plans)
+        return {
+            "total_users": total_users,
+            "total_plans": total_plans,
+            "avg_rating": sum(ratings) / len(ratings) if ratings else None,
+            "signups": signup_counts(created_at_values),
+        }
+
+def _timestamp(read_time: Any = None) -> str:
+    # ISO time (UTC) of a snapshot's read_time, which is a datetime from Firestore; now if not given.
+    if isinstance(read_time, datetime.datetime):
+        return read_time.isoformat(timespec="seconds")
+    seconds = read_time if isinstance(read_time, (int, float)) else time.time()
+    return datetime.datetime.utcfromtimestamp(seconds).isoformat(timespec="seconds")
+
+def _user_row(doc) -> Dict[str, Any]:
+    data = doc.to_dict() or {}
+    email = data.get("email", "")
+    return {
+        "id": doc.id,
+        "email": email,
+        "email_lower": data.get("email_lower") or email.lower(),
+        "phone": data.get("phone", ""),
+        "created_at": data.get("created_at"),
+    }
+
+def _plan_row(doc) -> Dict[str, Any]:
+    data = doc.to_dict() or {}
+    title = data.get("title", "Untitled")
+    return {
+        "user": doc.reference.parent.parent.id,
+        "title": title,
+        "title_lower": data.get("title_lower") or title.lower(),
+        "rating": data.get("rating"),
+    }
+
+def _report_row(doc) -> Dict[str, Any]:
+    data = doc.to_dict() or {}
+    return {
+        "email": data.get("email", ""),
+        "description": data.get("description", ""),
+        "timestamp": data.get("timestamp", ""),
+    }
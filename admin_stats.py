@@ -0,0 +1,197 @@
+import datetime
+import random
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import instrumentation
+
+# -----------------------
+# MATERIALIZED ADMIN STATISTICS
+# -----------------------
+# admin_stats/global                          {built_at, schema, shards}
+# admin_stats/global/shards/<n>               {total_users, total_plans, rating_sum, rating_count}
+# admin_stats/global/signups/<date>.<n>       {date, count}
+#
+# The user app keeps these current inside the same transaction or batch as the write
+# they describe, so the admin dashboard reads O(days) small documents instead of
+# scanning users and plans. Each write increments one of COUNTER_SHARDS randomly chosen
+# shard documents (Firestore throttles sustained writes to a single document); reads sum
+# the shards. The global document is written only by rebuild(), which recomputes
+# everything from the raw collections: until it has run, read_stats() returns None.
+
+STATS_COLLECTION = "admin_stats"
+GLOBAL_DOC = "global"
+SHARDS_COLLECTION = "shards"
+SIGNUPS_COLLECTION = "signups"
+COUNTER_SHARDS = 10
+STATS_SCHEMA = 2
+
+def global_ref(db):
+    return db.collection(STATS_COLLECTION).document(GLOBAL_DOC)
+
+def shard_ref(db, shard: Optional[int] = None):
+    shard = random.randrange(COUNTER_SHARDS) if shard is None else shard
+    return global_ref(db).collection(SHARDS_COLLECTION).document(str(shard))
+
+def signup_day_ref(db, day: str, shard: Optional[int] = None):
+    shard = random.randrange(COUNTER_SHARDS) if shard is None else shard
+    return global_ref(db).collection(SIGNUPS_COLLECTION).document(f"{day}.{shard}")
+
+def signup_day(created_at: str) -> Optional[str]:
+    try:
+        return datetime.datetime.fromisoformat(created_at).date().isoformat()
+    except Exception:
+        return None
+
+def _rating_value(rating: Any) -> Optional[float]:
+    return float(rating) if isinstance(rating, (int, float)) and not isinstance(rating, bool) else None
+
+# -----------------------
+# 1. WRITE PATHS (USED BY user_app.py)
+# -----------------------
+@instrumentation.timed("create_user", "firestore")
+def create_user(db, user_ref, user_data: Dict[str, Any]) -> bool:
+    # Creates the user and counts the signup atomically; returns False if the user already exists.
+    from firebase_admin import firestore
+
+    @firestore.transactional
+    def run(transaction) -> bool:
+        if user_ref.get(transaction=transaction).exists:
+            return False
+        transaction.set(user_ref, user_data)
+        transaction.set(shard_ref(db), {"total_users": firestore.Increment(1)}, merge=True)
+        day = signup_day(user_data.get("created_at", ""))
+        if day:
+            transaction.set(signup_day_ref(db, day), {"date": day, "count": firestore.Increment(1)}, merge=True)
+        return True
+
+    return run(db.transaction())
+
+@instrumentation.timed("create_plan", "firestore")
+def create_plan(db, plan_ref, plan_data: Dict[str, Any],
+                child_docs: Sequence[Tuple[Any, Dict[str, Any]]] = (), transaction=None):
+    # child_docs are (ref, data) pairs written in the same batch (e.g. the plan's week documents).
+    # With a transaction, the writes join it instead and the caller's commit applies them.
+    from firebase_admin import firestore
+    batch = transaction if transaction is not None else db.batch()
+    batch.set(plan_ref, plan_data)
+    for child_ref, child_data in child_docs:
+        batch.set(child_ref, child_data)
+    stats = {"total_plans": firestore.Increment(1)}
+    rating = _rating_value(plan_data.get("rating"))
+    if rating is not None:
+        stats["rating_sum"] = firestore.Increment(rating)
+        stats["rating_count"] = firestore.Increment(1)
+    batch.set(shard_ref(db), stats, merge=True)
+    if transaction is None:
+        batch.commit()
+
+@instrumentation.timed("delete_plan", "firestore")
+def delete_plan(db, plan_ref, child_refs: Optional[Callable[[Dict[str, Any]], List[Any]]] = None):
+    # child_refs maps the plan document to the subdocuments that must go with it.
+    from firebase_admin import firestore
+
+    @firestore.transactional
+    def run(transaction):
+        snapshot = plan_ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return
+        for child_ref in (child_refs(snapshot.to_dict() or {}) if child_refs else []):
+            transaction.delete(child_ref)
+        transaction.delete(plan_ref)
+        stats = {"total_plans": firestore.Increment(-1)}
+        rating = _rating_value((snapshot.to_dict() or {}).get("rating"))
+        if rating is not None:
+            stats["rating_sum"] = firestore.Increment(-rating)
+            stats["rating_count"] = firestore.Increment(-1)
+        transaction.set(shard_ref(db), stats, merge=True)
+
+    run(db.transaction())
+
+@instrumentation.timed("submit_rating", "firestore")
+def submit_rating(db, plan_ref, rating: int, extra_fields: Optional[Dict[str, Any]] = None):
+    from firebase_admin import firestore
+
+    @firestore.transactional
+    def run(transaction):
+        snapshot = plan_ref.get(transaction=transaction)
+        old_rating = _rating_value((snapshot.to_dict() or {}).get("rating"))
+        transaction.update(plan_ref, dict(extra_fields or {}, rating=rating))
+        stats = {"rating_sum": firestore.Increment(float(rating) - (old_rating or 0.0))}
+        if old_rating is None:
+            stats["rating_count"] = firestore.Increment(1)
+        transaction.set(shard_ref(db), stats, merge=True)
+
+    run(db.transaction())
+
+# -----------------------
+# 2. READ PATH (USED BY admin_app.py)
+# -----------------------
+@instrumentation.timed("admin_stats", "firestore")
+def read_stats(db) -> Optional[Dict[str, Any]]:
+    # Returns None if the stats have never been built (run `python migrations.py rebuild-admin-stats`);
+    # counters written by the app before the first rebuild are incomplete.
+    snapshot = global_ref(db).get()
+    if not snapshot.exists or not (snapshot.to_dict() or {}).get("built_at"):
+        return None
+    totals = {"total_users": 0, "total_plans": 0, "rating_sum": 0.0, "rating_count": 0}
+    for doc in global_ref(db).collection(SHARDS_COLLECTION).stream():
+        data = doc.to_dict() or {}
+        for name in totals:
+            totals[name] += data.get(name) or 0
+    counts: Dict[str, int] = {}
+    for doc in global_ref(db).collection(SIGNUPS_COLLECTION).stream():
+        data = doc.to_dict() or {}
+        if data.get("date"):
+            counts[data["date"]] = counts.get(data["date"], 0) + (data.get("count") or 0)
+    rating_count = totals["rating_count"]
+    return {
+        "total_users": int(totals["total_users"]),
+        "total_plans": int(totals["total_plans"]),
+        "avg_rating": totals["rating_sum"] / rating_count if rating_count else None,
+        "signups": sorted(({"date": datetime.date.fromisoformat(day), "count": count}
+                           for day, count in counts.items() if count), key=lambda s: s["date"]),
+    }
+
+# -----------------------
+# 3. BACKFILL / REBUILD
+# -----------------------
+def rebuild(db, dry_run: bool = False) -> Dict[str, int]:
+    # One pass over plan ratings and user signup dates (projected), then a full overwrite.
+    from admin_data import aggregate, signup_counts
+    from migrations import BatchWriter
+
+    users = aggregate(db.collection("users").count(alias="total_users"))
+    total_plans, rating_sum, rating_count = 0, 0.0, 0
+    for doc in db.collection_group("learning_plans").select(["rating"]).stream():
+        total_plans += 1
+        rating = _rating_value((doc.to_dict() or {}).get("rating"))
+        if rating is not None:
+            rating_sum += rating
+            rating_count += 1
+    signups: List[Dict[str, Any]] = signup_counts(
+        (doc.to_dict() or {}).get("created_at") for doc in db.collection("users").select(["created_at"]).stream()
+    )
+    stats = {
+        "total_users": int(users.get("total_users") or 0),
+        "total_plans": total_plans,
+        "rating_sum": rating_sum,
+        "rating_count": rating_count,
+    }
+    writer = BatchWriter(db, dry_run)
+    # Totals go to shard 0 and the other shards are cleared, so the sum is the rebuilt value.
+    writer.set(shard_ref(db, 0), stats)
+    for doc in global_ref(db).collection(SHARDS_COLLECTION).stream():
+        if doc.id != "0":
+            writer.delete(doc.reference)
+    days = set()
+    for signup in signups:
+        day = signup["date"].isoformat()
+        days.add(f"{day}.0")
+        writer.set(signup_day_ref(db, day, 0), {"date": day, "count": signup["count"]})
+    for doc in global_ref(db).collection(SIGNUPS_COLLECTION).stream():
+        if doc.id not in days:
+            writer.delete(doc.reference)
+    writer.set(global_ref(db), {"built_at": datetime.datetime.utcnow().isoformat(), "schema": STATS_SCHEMA,
+                                "shards": COUNTER_SHARDS})
+    writer.commit()
+    return dict(stats, signup_days=len(signups), writes=writer.written)
@@ -0,0 +1,735 @@
+"""In-process stand-ins for OpenAI, SerpAPI, YouTube, Pinecone and Firestore.
+
+Used by the offline benchmarks to drive the real code paths (PlanPipeline, admin_data,
+admin_stats, plan_storage) without network access. Every fake draws its latency from a
+lognormal LatencyModel (median, p95, per-item cost, error rate), builds payloads of a
+configurable size and counts each call, so a benchmark can report how many outbound calls
+and Firestore operations a code path made.
+
+    fakes = Fakes(DEFAULT_PROFILE)
+    fakes.install()          # OpenAI + vector store via clients.override, HTTP via the shared session
+    db = fakes.firestore     # pass wherever the app passes clients.get_firestore()
+"""
+import copy
+import io
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import types
+import uuid
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Latencies are in real-world milliseconds; time_scale shrinks every simulated wait so a run
+# finishes quickly while keeping the services' relative costs. Timeouts are not scaled.
+DEFAULT_PROFILE: Dict[str, Any] = {
+    "time_scale": 0.05,
+    "seed": 7,
+    "openai": {"median_ms": 600, "p95_ms": 1500, "per_item_ms": 15, "error_rate": 0.0,
+               "chunk_chars": 80, "truncate_rate": 0.0, "rate_limit_rate": 0.0, "resources_per_week": 3,
+               "action_items_per_week": 3, "overview_chars": 600,
+               # Account limits for openai_limiter, per simulated minute.
+               "requests_per_minute": 10000, "tokens_per_minute": 2000000},
+    "serpapi": {"median_ms": 900, "p95_ms": 2500, "error_rate": 0.0, "snippet_chars": 160},
+    "youtube": {"median_ms": 250, "p95_ms": 700, "error_rate": 0.0},
+    "links": {"median_ms": 150, "p95_ms": 800, "error_rate": 0.0, "broken_rate": 0.05},
+    "pinecone": {"median_ms": 120, "p95_ms": 400, "error_rate": 0.0, "doc_chars": 1500},
+    "firestore": {"median_ms": 20, "p95_ms": 60, "per_item_ms": 0.1, "error_rate": 0.0},
+}
+
+class FakeServiceError(RuntimeError):
+    pass
+
+class FakeRateLimitError(FakeServiceError):
+    # Looks like openai.RateLimitError to openai_limiter: status 429 plus Retry-After.
+    status_code = 429
+
+    def __init__(self, retry_after_ms: float):
+        super().__init__("openai: simulated 429 Too Many Requests")
+        self.response = types.SimpleNamespace(headers={"retry-after-ms": str(retry_after_ms)})
+
+def merge_profile(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(profile.get(key), dict):
+            profile[key].update(value)
+        else:
+            profile[key] = value
+    return profile
+
+# -----------------------
+# LATENCY AND CALL ACCOUNTING
+# -----------------------
+class LatencyModel:
+    """Lognormal latency with the given median and p95, a per-item cost and an error rate."""
+
+    def __init__(self, median_ms: float = 50.0, p95_ms: Optional[float] = None, per_item_ms: float = 0.0,
+                 error_rate: float = 0.0, time_scale: float = 1.0, seed: int = 0, **_payload):
+        self.median = median_ms / 1000.0
+        # p95 of a lognormal is median * exp(1.645 * sigma).
+        self.sigma = math.log(p95_ms / median_ms) / 1.645 if p95_ms and median_ms and p95_ms > median_ms else 0.0
+        self.per_item = per_item_ms / 1000.0
+        self.error_rate = error_rate
+        self.time_scale = time_scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, items: int = 0) -> float:
+        # Simulated seconds, already scaled.
+        with self._lock:
+            base = self.median * math.exp(self._rng.gauss(0.0, self.sigma)) if self.sigma else self.median
+        return (base + self.per_item * items) * self.time_scale
+
+    def fails(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def wait(self, items: int = 0) -> float:
+        delay = self.sample(items)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+class CallCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+
+    def add(self, name: str, n: int = 1):
+        with self._lock:
+            self.counts[name] += n
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+def stable_fraction(key: str) -> float:
+    # Deterministic in [0, 1), so the same link is broken on every run regardless of thread order.
+    return (zlib.crc32(key.encode("utf-8")) % 10000) / 10000.0
+
+# -----------------------
+# OPENAI
+# -----------------------
+_TIMELINE_WEEKS = re.compile(r"timeline of (\d+)\s*weeks?", re.IGNORECASE)
+_WANTED_WEEKS = re.compile(r"Write ONLY weeks ([\d,\s]+)")
+_REMAINING_FROM = re.compile(r"starting at week (\d+)")
+_URL = re.compile(r"https?://[^\s]+")
+
+class FakeOpenAI:
+    """chat.completions.create() for the plan stream, continuations and video scoring.
+
+    Plans have as many weeks as the prompt's "timeline of N weeks"; a streamed response is
+    cut short (finish_reason "length") at truncate_rate, and continuations return the weeks
+    the prompt asks for. Calls are rejected with a 429 at rate_limit_rate.
+    """
+
+    def __init__(self, config: Dict[str, Any], latency: LatencyModel, calls: CallCounter):
+        self.config = config
+        self.latency = latency
+        self.calls = calls
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self.create))
+
+    def create(self, model: str = "", messages: Sequence[Dict[str, str]] = (), stream: bool = False,
+               response_format: Optional[Dict[str, Any]] = None, **_kwargs):
+        prompt = messages[-1]["content"] if messages else ""
+        schema = ((response_format or {}).get("json_schema") or {}).get("name", "text")
+        self.calls.add("openai")
+        self.calls.add(f"openai:{schema}")
+        if self.latency.fails():
+            self.latency.wait()
+            self.calls.add("openai_errors")
+            raise FakeServiceError("openai: simulated 503 Service Unavailable")
+        if self._chance("rate_limit_rate"):
+            self.calls.add("openai_rate_limited")
+            raise FakeRateLimitError(1000 * self.latency.time_scale)
+        if not stream:
+            match = _URL.search(prompt)
+            content = match.group(0) if match else "No suitable video."
+            self.latency.wait(len(content) // 4)
+            return types.SimpleNamespace(
+                choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content), finish_reason="stop")],
+                usage=_usage(prompt, content),
+            )
+        if schema == "learning_plan_weeks":
+            text, finish_reason = json.dumps({"weeks": [self.week(n, prompt) for n in _continuation_weeks(prompt)]}), "stop"
+        else:
+            text, finish_reason = json.dumps(self.plan(prompt)), "stop"
+            if self._chance("truncate_rate"):
+                text, finish_reason = text[:len(text) * 2 // 3], "length"
+        return _FakeStream(text, finish_reason, prompt, int(self.config.get("chunk_chars", 80)), self.latency)
+
+    def _chance(self, name: str) -> bool:
+        rate = float(self.config.get(name, 0.0))
+        if not rate:
+            return False
+        with self.latency._lock:
+            return self.latency._rng.random() < rate
+
+    def plan(self, prompt: str) -> Dict[str, Any]:
+        match = _TIMELINE_WEEKS.search(prompt)
+        week_count = int(match.group(1)) if match else 4
+        return {
+            "goal": "benchmark goal",
+            "timeline": f"{week_count} weeks",
+            "background_level": "beginner",
+            "weekly_time": 5,
+            "weeks": [self.week(n, prompt) for n in range(1, week_count + 1)],
+        }
+
+    def week(self, number: int, prompt: str) -> Dict[str, Any]:
+        config = self.config
+        topic = f"topic-{zlib.crc32(prompt[:200].encode('utf-8')) % 1000}"
+        resources = []
+        for j in range(int(config.get("resources_per_week", 3))):
+            kind = ("article", "video", "book")[j % 3]
+            link = (f"https://www.youtube.com/watch?v={topic}-{number}-{j}" if kind == "video"
+                    else f"https://site{(number + j) % 8}.example.org/{topic}/week-{number}/{j}")
+            resources.append({"name": f"{kind.title()} {j + 1} for week {number}", "link": link, "type": kind})
+        return {
+            "week_number": number,
+            "objective": f"Week {number} objective for {topic}",
+            "detailed_overview": _filler(int(config.get("overview_chars", 600))),
+            "outcomes": _filler(160),
+            "gamified_insights": "Better than 80% of your peers.",
+            "resources": resources,
+            "action_items": [{"description": _filler(80), "due_by": f"Day {d + 1}"}
+                             for d in range(int(config.get("action_items_per_week", 3)))],
+        }
+
+class _FakeStream:
+    def __init__(self, text: str, finish_reason: str, prompt: str, chunk_chars: int, latency: LatencyModel):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.prompt = prompt
+        self.chunk_chars = max(1, chunk_chars)
+        self.latency = latency
+        self.closed = False
+
+    def __iter__(self) -> Iterator[Any]:
+        self.latency.wait()  # time to first token
+        for start in range(0, len(self.text), self.chunk_chars):
+            if self.closed:
+                return
+            piece = self.text[start:start + self.chunk_chars]
+            delay = self.latency.per_item * (len(piece) / 4) * self.latency.time_scale
+            if delay > 0:
+                time.sleep(delay)
+            yield _chunk(piece, None)
+        yield _chunk("", self.finish_reason)
+        yield types.SimpleNamespace(choices=[], usage=_usage(self.prompt, self.text))
+
+    def close(self):
+        self.closed = True
+
+def _chunk(content: str, finish_reason: Optional[str]):
+    delta = types.SimpleNamespace(content=content or None)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta, finish_reason=finish_reason)], usage=None)
+
+def _usage(prompt: str, completion: str):
+    return types.SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(completion) // 4)
+
+def _continuation_weeks(prompt: str) -> List[int]:
+    match = _WANTED_WEEKS.search(prompt)
+    if match:
+        return [int(n) for n in re.findall(r"\d+", match.group(1))]
+    match = _REMAINING_FROM.search(prompt)
+    start = int(match.group(1)) if match else 1
+    timeline = _TIMELINE_WEEKS.search(prompt)
+    return list(range(start, (int(timeline.group(1)) if timeline else start) + 1))
+
+_WORDS = ("practice", "concepts", "project", "review", "exercise", "build", "explore", "apply", "notes", "quiz")
+
+def _filler(chars: int) -> str:
+    words = itertools.cycle(_WORDS)
+    text = ""
+    while len(text) < chars:
+        text += next(words) + " "
+    return text[:chars].strip()
+
+# -----------------------
+# VECTOR STORE (PINECONE)
+# -----------------------
+class FakeVectorStore:
+    def __init__(self, config: Dict[str, Any], latency: LatencyModel, calls: CallCounter):
+        self.config = config
+        self.latency = latency
+        self.calls = calls
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Any]:
+        self.calls.add("pinecone")
+        self.latency.wait(k)
+        if self.latency.fails():
+            self.calls.add("pinecone_errors")
+            raise FakeServiceError("pinecone: simulated query failure")
+        return [types.SimpleNamespace(page_content=_filler(int(self.config.get("doc_chars", 1500))), metadata={"rank": i})
+                for i in range(k)]
+
+# -----------------------
+# HTTP (SERPAPI, YOUTUBE, LINK CHECKS)
+# -----------------------
+class FakeHTTPAdapter(BaseAdapter):
+    """Transport adapter mounted on http_client's shared session.
+
+    Requests still go through http_client's retries, deadlines and per-host limits; only
+    the wire is replaced. serpapi.com and googleapis.com get search payloads, every other
+    host is a link check (404 for a stable broken_rate fraction of URLs). Failures are 503s.
+    """
+
+    def __init__(self, fakes: "Fakes"):
+        super().__init__()
+        self.fakes = fakes
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        parts = urlsplit(request.url)
+        host = (parts.hostname or "").lower()
+        service = "serpapi" if host == "serpapi.com" else "youtube" if host.endswith("googleapis.com") else "links"
+        self.fakes.calls.add(service)
+        latency = self.fakes.latency[service]
+        delay = latency.sample()
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            self.fakes.calls.add(f"{service}_timeouts")
+            raise requests.ReadTimeout(f"{service}: simulated read timeout")
+        time.sleep(delay)
+        if latency.fails():
+            self.fakes.calls.add(f"{service}_errors")
+            return _response(request, 503, {"error": "simulated outage"})
+        params = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        if service == "serpapi":
+            return _response(request, 200, self._serpapi(params))
+        if service == "youtube":
+            return _response(request, 200, self._youtube(params))
+        broken = stable_fraction(request.url) < float(self.fakes.profile["links"].get("broken_rate", 0.0))
+        return _response(request, 404 if broken else 200, b"" if request.method == "HEAD" else b"<html></html>")
+
+    def close(self):
+        pass
+
+    def _serpapi(self, params: Dict[str, str]) -> Dict[str, Any]:
+        query = params.get("q", "")
+        slug = "-".join(query.split())[:60]
+        snippet = _filler(int(self.fakes.profile["serpapi"].get("snippet_chars", 160)))
+        return {"organic_results": [
+            {"position": i + 1, "title": f"{query[:50]} result {i + 1}",
+             "link": f"https://result{i}.example.net/{slug}", "snippet": snippet}
+            for i in range(int(params.get("num", 10)))
+        ]}
+
+    def _youtube(self, params: Dict[str, str]) -> Dict[str, Any]:
+        query = params.get("q", "")
+        return {"items": [
+            {"id": {"videoId": f"v{zlib.crc32(query.encode('utf-8')) % 100000}-{i}"},
+             "snippet": {"title": f"{query[:50]} video {i + 1}"}}
+            for i in range(int(params.get("maxResults", 10)))
+        ]}
+
+def _response(request, status: int, body: Any) -> requests.Response:
+    content = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+    response = requests.Response()
+    response.status_code = status
+    response._content = content
+    response._content_consumed = True
+    response.raw = io.BytesIO(content)
+    response.headers = CaseInsensitiveDict({"Content-Type": "application/json", "Content-Length": str(len(content))})
+    response.encoding = "utf-8"
+    response.url = request.url
+    response.request = request
+    return response
+
+# -----------------------
+# FIRESTORE
+# -----------------------
+class FakeFirestore:
+    """In-memory Firestore covering what the app's data loaders use.
+
+    Documents, subcollections, collection groups, select/where/order_by/limit/start_after,
+    count/avg aggregations, get_all, write batches and snapshot listeners (delivered
+    synchronously). `ops` counts RPCs, documents read (aggregations bill one read per 1000
+    index entries, as Firestore does), writes and deletes; every RPC waits on the latency
+    model, with per_item_ms charged per document returned.
+    """
+
+    def __init__(self, latency: LatencyModel, calls: Optional[CallCounter] = None):
+        self.latency = latency
+        self.ops = calls or CallCounter()
+        self._lock = threading.RLock()
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._by_parent: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._version = 0
+        self._sorted: Dict[Tuple[Any, ...], Tuple[int, List[Tuple[str, Dict[str, Any]]]]] = {}
+
+    # Direct access for seeding; not counted.
+    def load(self, path: str, data: Dict[str, Any]):
+        with self._lock:
+            self._store(path, data)
+            self._version += 1
+
+    def _store(self, path: str, data: Optional[Dict[str, Any]]):
+        parent = path.rpartition("/")[0]
+        if data is None:
+            self._docs.pop(path, None)
+            self._by_parent.get(parent, {}).pop(path, None)
+        else:
+            self._docs[path] = data
+            self._by_parent.setdefault(parent, {})[path] = data
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self, name)
+
+    def collection_group(self, name: str) -> "FakeQuery":
+        return FakeQuery(self, name, group=True)
+
+    def document(self, path: str) -> "FakeDocument":
+        return FakeDocument(self, path)
+
+    def batch(self) -> "FakeWriteBatch":
+        return FakeWriteBatch(self)
+
+    def get_all(self, refs: Sequence["FakeDocument"], field_paths=None) -> Iterator["FakeSnapshot"]:
+        refs = list(refs)
+        self._rpc("get_all", len(refs))
+        with self._lock:
+            snapshots = [FakeSnapshot(ref, self._docs.get(ref.path), field_paths) for ref in refs]
+        return iter(snapshots)
+
+    def _rpc(self, kind: str, reads: int = 0, writes: int = 0, deletes: int = 0):
+        self.ops.add("rpcs")
+        self.ops.add(kind)
+        if reads:
+            self.ops.add("reads", reads)
+        if writes:
+            self.ops.add("writes", writes)
+        if deletes:
+            self.ops.add("deletes", deletes)
+        self.latency.wait(reads)
+        if self.latency.fails():
+            self.ops.add("errors")
+            raise FakeServiceError(f"firestore: simulated {kind} failure")
+
+    def _apply(self, op: str, path: str, data: Optional[Dict[str, Any]] = None, merge: bool = False):
+        from google.cloud.firestore_v1.transforms import Increment, Sentinel
+        with self._lock:
+            if op == "delete":
+                self._store(path, None)
+            else:
+                current = dict(self._docs.get(path) or {}) if (merge or op == "update") else {}
+                for key, value in (data or {}).items():
+                    if isinstance(value, Increment):
+                        current[key] = (current.get(key) or 0) + value.value
+                    elif isinstance(value, Sentinel):  # DELETE_FIELD
+                        current.pop(key, None)
+                    else:
+                        current[key] = copy.deepcopy(value)
+                self._store(path, current)
+            self._version += 1
+
+    def _matching(self, query: "FakeQuery") -> List[Tuple[str, Dict[str, Any]]]:
+        # Filtered, ordered (path, data) pairs; cached until the next write.
+        key = (query.source, query.group, tuple(query.filters), tuple(query.orders))
+        with self._lock:
+            cached = self._sorted.get(key)
+            if cached is not None and cached[0] == self._version:
+                return cached[1]
+            if query.group:
+                rows = [(path, data) for parent, docs in self._by_parent.items()
+                        if parent.rsplit("/", 1)[-1] == query.source for path, data in docs.items()]
+            else:
+                rows = list(self._by_parent.get(query.source, {}).items())
+            for field, op, value in query.filters:
+                rows = [(path, data) for path, data in rows if field in data and _compare(data[field], op, value)]
+            for field, _direction in query.orders:
+                rows = [(path, data) for path, data in rows if field in data]
+            rows.sort(key=lambda row: tuple(_sort_key(row[1].get(f)) for f, _ in query.orders) + (row[0],))
+            if any(direction == "DESCENDING" for _, direction in query.orders[:1]):
+                rows.reverse()
+            self._sorted[key] = (self._version, rows)
+            return rows
+
+def _sort_key(value: Any) -> Tuple[int, Any]:
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    return (2, str(value))
+
+def _compare(left: Any, op: str, right: Any) -> bool:
+    try:
+        return {"==": left == right, "!=": left != right, "<": left < right, "<=": left <= right,
+                ">": left > right, ">=": left >= right}[op]
+    except TypeError:
+        return False
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocument", data: Optional[Dict[str, Any]], field_paths=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        if data is not None and field_paths:
+            data = {f: data[f] for f in field_paths if f in data}
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        # A fresh top-level dict, like a real snapshot; nested values are shared for speed.
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        return (self._data or {}).get(field)
+
+class FakeDocument:
+    def __init__(self, db: FakeFirestore, path: str):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> "FakeCollection":
+        return FakeCollection(self._db, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction=None) -> FakeSnapshot:
+        self._db._rpc("get", 1)
+        with self._db._lock:
+            return FakeSnapshot(self, self._db._docs.get(self.path), field_paths)
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        self._db._rpc("commit", writes=1)
+        self._db._apply("set", self.path, data, merge)
+
+    def update(self, data: Dict[str, Any]):
+        self._db._rpc("commit", writes=1)
+        self._db._apply("update", self.path, data)
+
+    def delete(self):
+        self._db._rpc("commit", deletes=1)
+        self._db._apply("delete", self.path)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FakeDocument) and other.path == self.path
+
+    def __hash__(self) -> int:
+        return hash(self.path)
+
+class FakeQuery:
+    def __init__(self, db: FakeFirestore, source: str, group: bool = False, fields: Optional[Tuple[str, ...]] = None,
+                 filters: Tuple[Tuple[str, str, Any], ...] = (), orders: Tuple[Tuple[str, str], ...] = (),
+                 limit: Optional[int] = None, start_after: Optional[Tuple[Any, ...]] = None):
+        self._db = db
+        self.source = source
+        self.group = group
+        self.fields = fields
+        self.filters = filters
+        self.orders = orders
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes) -> "FakeQuery":
+        state = dict(source=self.source, group=self.group, fields=self.fields, filters=self.filters,
+                     orders=self.orders, limit=self._limit, start_after=self._start_after)
+        state.update(changes)
+        return FakeQuery(self._db, **state)
+
+    def select(self, field_paths: Sequence[str]) -> "FakeQuery":
+        return self._copy(fields=tuple(field_paths))
+
+    def where(self, field_path: Optional[str] = None, op_string: Optional[str] = None, value: Any = None,
+              filter=None) -> "FakeQuery":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self.filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(orders=self.orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit=count)
+
+    def start_after(self, snapshot: FakeSnapshot) -> "FakeQuery":
+        return self._copy(start_after=(snapshot.reference.path,))
+
+    def stream(self) -> Iterator[FakeSnapshot]:
+        rows = self._db._matching(self)
+        if self._start_after is not None:
+            paths = [path for path, _ in rows]
+            rows = rows[paths.index(self._start_after[0]) + 1:] if self._start_after[0] in paths else []
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        # Empty queries still bill one read.
+        self._db._rpc("query", max(1, len(rows)))
+        return iter([FakeSnapshot(FakeDocument(self._db, path), data, self.fields) for path, data in rows])
+
+    def get(self) -> List[FakeSnapshot]:
+        return list(self.stream())
+
+    def count(self, alias: Optional[str] = None) -> "FakeAggregation":
+        return FakeAggregation(self, [("count", None, alias or "count")])
+
+    def avg(self, field_path: str, alias: Optional[str] = None) -> "FakeAggregation":
+        return FakeAggregation(self, [("avg", field_path, alias or "avg")])
+
+    def on_snapshot(self, callback) -> Any:
+        rows = self._db._matching(self)
+        self._db._rpc("listen", len(rows))
+        snapshots = [FakeSnapshot(FakeDocument(self._db, path), data, self.fields) for path, data in rows]
+        changes = [_Change(snapshot) for snapshot in snapshots]
+        callback(snapshots, changes, time.time())
+        return types.SimpleNamespace(unsubscribe=lambda: None)
+
+class _Change:
+    __slots__ = ("document",)
+    type = types.SimpleNamespace(name="ADDED")
+
+    def __init__(self, document: FakeSnapshot):
+        self.document = document
+
+class FakeCollection(FakeQuery):
+    def __init__(self, db: FakeFirestore, path: str):
+        super().__init__(db, path)
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> Optional[FakeDocument]:
+        return FakeDocument(self._db, self.path.rsplit("/", 1)[0]) if "/" in self.path else None
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocument:
+        return FakeDocument(self._db, f"{self.path}/{document_id or uuid.uuid4().hex[:20]}")
+
+class FakeAggregation:
+    def __init__(self, query: FakeQuery, aggregations: List[Tuple[str, Optional[str], str]]):
+        self.query = query
+        self.aggregations = aggregations
+
+    def count(self, alias: Optional[str] = None) -> "FakeAggregation":
+        return FakeAggregation(self.query, self.aggregations + [("count", None, alias or "count")])
+
+    def avg(self, field_path: str, alias: Optional[str] = None) -> "FakeAggregation":
+        return FakeAggregation(self.query, self.aggregations + [("avg", field_path, alias or "avg")])
+
+    def get(self) -> List[List[Any]]:
+        rows = self.query._db._matching(self.query)
+        self.query._db._rpc("aggregation", max(1, math.ceil(len(rows) / 1000)))
+        results = []
+        for kind, field, alias in self.aggregations:
+            if kind == "count":
+                value: Any = len(rows)
+            else:
+                numbers = [data[field] for _, data in rows
+                           if isinstance(data.get(field), (int, float)) and not isinstance(data.get(field), bool)]
+                value = sum(numbers) / len(numbers) if numbers else None
+            results.append(types.SimpleNamespace(alias=alias, value=value))
+        return [results]
+
+class FakeWriteBatch:
+    def __init__(self, db: FakeFirestore):
+        self._db = db
+        self._ops: List[Tuple[str, str, Optional[Dict[str, Any]], bool]] = []
+
+    def set(self, ref: FakeDocument, data: Dict[str, Any], merge: bool = False):
+        self._ops.append(("set", ref.path, data, merge))
+
+    def update(self, ref: FakeDocument, data: Dict[str, Any]):
+        self._ops.append(("update", ref.path, data, False))
+
+    def delete(self, ref: FakeDocument):
+        self._ops.append(("delete", ref.path, None, False))
+
+    def commit(self):
+        deletes = sum(1 for op in self._ops if op[0] == "delete")
+        self._db._rpc("commit", writes=len(self._ops) - deletes, deletes=deletes)
+        for op, path, data, merge in self._ops:
+            self._db._apply(op, path, data, merge)
+        self._ops = []
+
+# -----------------------
+# WIRING
+# -----------------------
+SERVICES = ("openai", "serpapi", "youtube", "links", "pinecone", "firestore")
+
+class Fakes:
+    """Builds every fake from one profile and installs them into the app's client hooks."""
+
+    def __init__(self, profile: Optional[Dict[str, Any]] = None):
+        self.profile = merge_profile(profile)
+        scale, seed = float(self.profile["time_scale"]), int(self.profile["seed"])
+        self.latency = {name: LatencyModel(time_scale=scale, seed=seed + i, **self.profile[name])
+                        for i, name in enumerate(SERVICES)}
+        self.calls = CallCounter()
+        self.openai = FakeOpenAI(self.profile["openai"], self.latency["openai"], self.calls)
+        self.vectorstore = FakeVectorStore(self.profile["pinecone"], self.latency["pinecone"], self.calls)
+        self.firestore = FakeFirestore(self.latency["firestore"])
+        self.http_adapter = FakeHTTPAdapter(self)
+
+    def install(self):
+        import clients
+        import http_client
+        import openai_limiter
+        clients.override("openai", self.openai)
+        clients.override("vectorstore", self.vectorstore)
+        clients.override("firestore", self.firestore)
+        # Backoff sleeps are real time too, so scale them with the simulated latencies.
+        scale = float(self.profile["time_scale"])
+        http_client.configure(backoff_base=0.25 * scale, backoff_max=4.0 * scale)
+        # The limiter's buckets refill in real time: a simulated minute lasts 60 * scale seconds
+        # (floored, so a zero-latency profile doesn't divide by zero).
+        openai_config = self.profile["openai"]
+        limiter_scale = max(scale, 0.001)
+        openai_limiter.configure(rpm=float(openai_config["requests_per_minute"]) / limiter_scale,
+                                 tpm=float(openai_config["tokens_per_minute"]) / limiter_scale,
+                                 latency_target=10.0 * limiter_scale, adjust_interval=5.0 * limiter_scale)
+        session = http_client.get_session()
+        session.mount("https://", self.http_adapter)
+        session.mount("http://", self.http_adapter)
+
+    def new_firestore(self) -> FakeFirestore:
+        import clients
+        self.firestore = FakeFirestore(self.latency["firestore"])
+        clients.override("firestore", self.firestore)
+        return self.firestore
+
+    def reset_counts(self):
+        self.calls.reset()
+        self.firestore.ops.reset()
+
+# -----------------------
+# SEED DATA
+# -----------------------
+def seed_admin_data(db: FakeFirestore, users: int, plans_per_user: float = 2.0, seed: int = 7) -> Dict[str, int]:
+    # Users keyed by email with 0..2*plans_per_user plans each, a report per 100 users.
+    rng = random.Random(seed)
+    start = 1700000000
+    plans = reports = 0
+    for i in range(users):
+        email = f"user{i:06d}@example.com"
+        created_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(start + rng.randrange(365 * 86400)))
+        db.load(f"users/{email}", {"email": email, "email_lower": email, "phone": f"+1555{i:07d}",
+                                   "created_at": created_at})
+        for j in range(rng.randint(0, int(2 * plans_per_user))):
+            title = f"Learn topic {rng.randrange(500)}"
+            db.load(f"users/{email}/learning_plans/p{i}-{j}", {
+                "title": title, "title_lower": title.lower(),
+                "rating": rng.choice([None, 1, 2, 3, 4, 5]), "week_count": 0, "storage_version": 2,
+            })
+            plans += 1
+        if i % 100 == 0:
+            db.load(f"reports/r{i}", {"email": email, "description": _filler(120), "timestamp": created_at})
+            reports += 1
+    return {"users": users, "plans": plans, "reports": reports}
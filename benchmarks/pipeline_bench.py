@@ -0,0 +1,254 @@
+"""Offline end-to-end benchmark for plan generation and the admin data loaders.
+
+Drives the real PlanPipeline (plus saving and reopening the plan through admin_stats and
+plan_storage) and the admin page loaders against the in-process fakes in fakes.py, so no
+network access or credentials are needed. Reports p50/p95/p99 wall time, outbound calls
+per service and Firestore operations per run, for each plan length and user count.
+
+    python benchmarks/pipeline_bench.py --weeks 1,4,12 --users 100,10000,100000 --runs 5
+    python benchmarks/pipeline_bench.py --save-baseline          # write .cache/pipeline_baseline.json
+    python benchmarks/pipeline_bench.py --compare --tolerance 0.25
+
+Latencies come from fakes.DEFAULT_PROFILE, overridable with --profile (a JSON file with the
+same shape). Wall times are in scaled milliseconds, so only compare runs made with the same
+profile. --compare exits with code 1 when a p50/p95 wall time or a call count grew by more
+than the tolerance.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import fakes  # noqa: E402  (benchmarks/ is the script directory)
+
+DEFAULT_BASELINE = os.path.join(ROOT, ".cache", "pipeline_baseline.json")
+RESOURCE_TYPES = ["Videos", "Articles", "Books"]
+
+def percentile(values: List[float], q: float) -> float:
+    # Nearest rank, so small samples report an observed value.
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+def summarize(wall_ms: List[float], counts: List[Dict[str, int]], failures: int = 0) -> Dict[str, Any]:
+    keys = sorted({key for run in counts for key in run})
+    return {
+        "runs": len(wall_ms),
+        "failures": failures,
+        "p50_ms": round(percentile(wall_ms, 0.50), 1),
+        "p95_ms": round(percentile(wall_ms, 0.95), 1),
+        "p99_ms": round(percentile(wall_ms, 0.99), 1),
+        # Mean per run; the fakes are deterministic apart from sampled errors and truncation.
+        "calls": {key: round(sum(run.get(key, 0) for run in counts) / max(1, len(counts)), 2) for key in keys},
+    }
+
+# -----------------------
+# PLAN PIPELINE
+# -----------------------
+def bench_pipeline(service_fakes: fakes.Fakes, weeks: int, runs: int, workers: int) -> Dict[str, Any]:
+    import admin_stats
+    import plan_storage
+    from caching import CoalescingCache
+    from plan_pipeline import PlanPipeline
+
+    db = service_fakes.new_firestore()
+    wall_ms, first_week_ms, counts, failures, errors = [], [], [], 0, []
+    for run in range(runs):
+        service_fakes.reset_counts()
+        # Fresh search cache per run: every run is a cold request, like a new goal.
+        pipeline = PlanPipeline("serpapi-benchmark", "youtube-benchmark", CoalescingCache(), max_workers=workers,
+                                on_error=errors.append)
+        first_week: List[float] = []
+        start = time.perf_counter()
+        plan = pipeline.generate(f"benchmark goal {run}", "beginner", 5, f"{weeks} weeks", RESOURCE_TYPES,
+                                 on_week=lambda week: first_week or first_week.append(time.perf_counter() - start))
+        if plan.get("weeks"):
+            plan_ref = db.collection("users").document("bench@example.com").collection("learning_plans").document()
+            plan_doc, week_docs = plan_storage.plan_documents(plan_ref, plan, {
+                "title": plan["goal"], "title_lower": plan["goal"].lower(), "rating": None,
+                "updated_at": f"run-{run}-{time.time()}",
+            })
+            admin_stats.create_plan(db, plan_ref, plan_doc, child_docs=week_docs)
+            # Reopen it the way the plan viewer does: metadata first, then the first page of weeks.
+            stored = plan_storage.load_plan(db, plan_ref)
+            stored.weeks(0, 4)
+        else:
+            failures += 1
+        wall_ms.append((time.perf_counter() - start) * 1000)
+        first_week_ms.extend(ms * 1000 for ms in first_week)
+        counts.append(dict(service_fakes.calls.snapshot(), **{f"firestore.{k}": v
+                                                              for k, v in service_fakes.firestore.ops.snapshot().items()}))
+    result = summarize(wall_ms, counts, failures)
+    result["first_week_p50_ms"] = round(percentile(first_week_ms, 0.50), 1)
+    result["errors"] = len(errors)
+    return result
+
+# -----------------------
+# ADMIN LOADERS
+# -----------------------
+def admin_loaders(db) -> Dict[str, Callable[[], Any]]:
+    import admin_data
+    import admin_stats
+
+    def live():
+        live_data = admin_data.LiveAdminData(db)
+        live_data.wait_ready(timeout=60)
+        live_data.dashboard_metrics()
+        live_data.users_page(db)
+        live_data.plans_page(db)
+        live_data.close()
+
+    def users_second_page():
+        _, cursor, _ = admin_data.fetch_users_page(db)
+        admin_data.fetch_users_page(db, start_after=cursor)
+
+    return {
+        "dashboard_scan": lambda: admin_data.load_dashboard_metrics(db),
+        "dashboard_stats": lambda: admin_stats.read_stats(db),
+        "users_page": lambda: admin_data.fetch_users_page(db),
+        "users_next_page": users_second_page,
+        "users_search": lambda: admin_data.fetch_users_page(db, search="user0001"),
+        "plans_page": lambda: admin_data.fetch_plans_page(db),
+        "plans_search": lambda: admin_data.fetch_plans_page(db, search="learn topic 4"),
+        "reports": lambda: admin_data.fetch_reports(db),
+        "live_initial_load": live,
+    }
+
+def bench_admin(service_fakes: fakes.Fakes, users: int, runs: int, seed: int) -> Dict[str, Any]:
+    import admin_stats
+
+    db = service_fakes.new_firestore()
+    dataset = fakes.seed_admin_data(db, users, seed=seed)
+    admin_stats.rebuild(db)
+    results: Dict[str, Any] = {"dataset": dataset}
+    for name, load in admin_loaders(db).items():
+        # One untimed warm-up, so the fake's own first-query indexing isn't charged to the loader.
+        load()
+        wall_ms, counts = [], []
+        for _ in range(runs):
+            db.ops.reset()
+            start = time.perf_counter()
+            load()
+            wall_ms.append((time.perf_counter() - start) * 1000)
+            counts.append({f"firestore.{k}": v for k, v in db.ops.snapshot().items()})
+        results[name] = summarize(wall_ms, counts)
+    return results
+
+# -----------------------
+# REPORTING AND BASELINES
+# -----------------------
+def print_result(name: str, result: Dict[str, Any]):
+    calls = ", ".join(f"{k}={v:g}" for k, v in result["calls"].items() if ":" not in k)
+    extra = f", first week p50 {result['first_week_p50_ms']:.0f}" if "first_week_p50_ms" in result else ""
+    failed = f", {result['failures']} failed" if result.get("failures") else ""
+    print(f"  {name:<28} p50 {result['p50_ms']:>8.1f}  p95 {result['p95_ms']:>8.1f}  p99 {result['p99_ms']:>8.1f} ms"
+          f"{extra}{failed}")
+    print(f"  {'':<28} {calls}")
+
+def flatten(results: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    # {"pipeline/4w": {...}, "admin/10000/users_page": {...}} for comparisons.
+    flat = {}
+    for weeks, result in results.get("pipeline", {}).items():
+        flat[f"pipeline/{weeks}"] = result
+    for users, loaders in results.get("admin", {}).items():
+        for name, result in loaders.items():
+            if name != "dataset":
+                flat[f"admin/{users}/{name}"] = result
+    return flat
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    regressions = []
+    if current.get("profile") != baseline.get("profile"):
+        print("warning: the baseline was recorded with a different service profile")
+    base = flatten(baseline)
+    for key, result in sorted(flatten(current).items()):
+        old = base.get(key)
+        if old is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            # The absolute floor keeps scheduler noise on the fast loaders from failing the run.
+            if result[metric] > old[metric] * (1 + tolerance) and result[metric] - old[metric] > min_delta_ms:
+                regressions.append(f"{key} {metric}: {old[metric]:.1f} -> {result[metric]:.1f}")
+        for name, value in result["calls"].items():
+            previous = old.get("calls", {}).get(name, 0)
+            if value > previous * (1 + tolerance) and value - previous >= 1:
+                regressions.append(f"{key} {name}: {previous:g} -> {value:g} per run")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", default="1,4,8,12", help="Comma-separated plan lengths; empty to skip.")
+    parser.add_argument("--users", default="100,1000,10000,100000", help="Comma-separated user counts; empty to skip.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--admin-runs", type=int, default=None, help="Runs per admin loader (default --runs).")
+    parser.add_argument("--workers", type=int, default=6, help="PlanPipeline max_workers.")
+    parser.add_argument("--profile", default=None, help="JSON file overriding fakes.DEFAULT_PROFILE.")
+    parser.add_argument("--output", default=None, help="Write the results JSON here.")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, default=None, metavar="PATH")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, default=None, metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative growth before --compare fails.")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore wall-time changes smaller than this.")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    overrides = None
+    if args.profile:
+        with open(args.profile, encoding="utf-8") as f:
+            overrides = json.load(f)
+    service_fakes = fakes.Fakes(overrides)
+    service_fakes.install()
+
+    results: Dict[str, Any] = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "profile": service_fakes.profile,
+        "pipeline": {},
+        "admin": {},
+    }
+    for weeks in [int(w) for w in args.weeks.split(",") if w.strip()]:
+        print(f"plan pipeline, {weeks} week(s):")
+        result = results["pipeline"][f"{weeks}w"] = bench_pipeline(service_fakes, weeks, args.runs, args.workers)
+        print_result("generate + save + reopen", result)
+    for users in [int(u) for u in args.users.split(",") if u.strip()]:
+        loaders = results["admin"][str(users)] = bench_admin(service_fakes, users, args.admin_runs or args.runs,
+                                                             int(service_fakes.profile["seed"]))
+        dataset = loaders["dataset"]
+        print(f"admin loaders, {dataset['users']} users / {dataset['plans']} plans / {dataset['reports']} reports:")
+        for name, result in loaders.items():
+            if name != "dataset":
+                print_result(name, result)
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"results written to {path}")
+
+    if args.compare:
+        baseline: Optional[Dict[str, Any]] = None
+        try:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"no baseline at {args.compare}; run with --save-baseline first")
+            return 1
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        print(f"compared against {args.compare} (recorded {baseline.get('created_at')}): "
+              f"{len(regressions)} regression(s)")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
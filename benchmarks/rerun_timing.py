@@ -0,0 +1,81 @@
+"""Startup / rerun timing benchmark for user_app.py.
+
+Runs the app headlessly with Streamlit's AppTest harness and dummy secrets, so no
+network access is needed: the login page must render without touching OpenAI,
+Firebase, Pinecone or LangChain. Fails (exit code 1) when a budget is exceeded or
+one of those heavy modules gets imported during startup.
+
+    python benchmarks/rerun_timing.py --reruns 20 --max-first-run-ms 1500 --max-rerun-ms 150
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["openai", "firebase_admin", "pinecone", "langchain", "langchain_openai", "langchain_pinecone"]
+
+DUMMY_SECRETS = {
+    "openai": {"api_key": "sk-benchmark"},
+    "serpapi": {"api_key": "serpapi-benchmark"},
+    "youtube": {"api_key": "youtube-benchmark"},
+    "pinecone": {"api_key": "pinecone-benchmark"},
+    "firebase": {"credentials_json": "{}"},
+    "url_cache": {"path": ""},
+    "serpapi_cache": {"path": ""},
+    "plan_cache": {"path": ""},
+}
+
+def build_app(timeout: float) -> AppTest:
+    app = AppTest.from_file(os.path.join(ROOT, "user_app.py"), default_timeout=timeout)
+    for section, values in DUMMY_SECRETS.items():
+        app.secrets[section] = values
+    return app
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--max-first-run-ms", type=float, default=None)
+    parser.add_argument("--max-rerun-ms", type=float, default=None, help="Budget for the median rerun.")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    preloaded = {name for name in HEAVY_MODULES if name in sys.modules}
+    app = build_app(args.timeout)
+
+    start = time.perf_counter()
+    app.run()
+    first_run_ms = (time.perf_counter() - start) * 1000
+    if app.exception:
+        print(f"App raised during startup: {app.exception}")
+        return 1
+
+    rerun_ms = []
+    for _ in range(args.reruns):
+        start = time.perf_counter()
+        app.run()
+        rerun_ms.append((time.perf_counter() - start) * 1000)
+
+    imported = [name for name in HEAVY_MODULES if name in sys.modules and name not in preloaded]
+    median_ms = statistics.median(rerun_ms) if rerun_ms else 0.0
+    p95_ms = sorted(rerun_ms)[int(0.95 * (len(rerun_ms) - 1))] if rerun_ms else 0.0
+    print(f"first run: {first_run_ms:.1f} ms")
+    print(f"reruns:    median {median_ms:.1f} ms, p95 {p95_ms:.1f} ms over {len(rerun_ms)} runs")
+    print(f"heavy modules imported at startup: {', '.join(imported) or 'none'}")
+
+    failed = bool(imported)
+    if args.max_first_run_ms is not None and first_run_ms > args.max_first_run_ms:
+        print(f"FAIL: first run exceeded {args.max_first_run_ms:.0f} ms")
+        failed = True
+    if args.max_rerun_ms is not None and median_ms > args.max_rerun_ms:
+        print(f"FAIL: median rerun exceeded {args.max_rerun_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
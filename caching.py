@@ -0,0 +1,231 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_MISSING = object()
+
+# -----------------------
+# 1. IN-PROCESS LRU WITH TTL (OPTIONALLY PERSISTED TO SQLITE)
+# -----------------------
+class TTLCache:
+    """Thread-safe LRU cache with per-entry TTLs and an optional on-disk SQLite tier.
+
+    The in-memory tier holds at most `max_size` entries; the disk tier (when `path` is set)
+    holds at most `max_disk_entries` and is shared by every process pointing at the same file.
+    Values stored on disk must be JSON-serialisable.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0, path: Optional[str] = None,
+                 max_disk_entries: Optional[int] = None, table: str = "cache"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries or max_size * 10
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self._table = table
+        self._db = None
+        self._writes_since_prune = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            value = self._disk_get(key, now)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._disk_set(key, value, expires_at)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self._table}")
+                self._db.commit()
+
+    def keys(self) -> List[str]:
+        # Unexpired keys from both tiers (the disk tier may hold entries written by other processes).
+        now = time.time()
+        with self._lock:
+            keys = {key for key, (_, expires_at) in self._entries.items() if expires_at > now}
+            if self._db is not None:
+                keys.update(row[0] for row in self._db.execute(
+                    f"SELECT key FROM {self._table} WHERE expires_at > ?", (now,)))
+        return sorted(keys)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remember(self, key: str, value: Any, expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Any:
+        if self._db is None:
+            return _MISSING
+        row = self._db.execute(
+            f"SELECT value, expires_at FROM {self._table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] <= now:
+            return _MISSING
+        self._db.execute(f"UPDATE {self._table} SET accessed_at = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        value = json.loads(row[0])
+        self._remember(key, value, row[1])
+        return value
+
+    def _disk_set(self, key: str, value: Any, expires_at: float):
+        if self._db is None:
+            return
+        self._db.execute(
+            f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), expires_at, time.time())
+        )
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= 100:
+            self._writes_since_prune = 0
+            self._disk_prune()
+        self._db.commit()
+
+    def _disk_prune(self):
+        self._db.execute(f"DELETE FROM {self._table} WHERE expires_at <= ?", (time.time(),))
+        self._db.execute(
+            f"DELETE FROM {self._table} WHERE key IN "
+            f"(SELECT key FROM {self._table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+
+# -----------------------
+# 2. SINGLE-FLIGHT CALL COALESCING
+# -----------------------
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers wait for and share its result."""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        # Returns (value, shared), where shared is True if another caller's in-flight call was reused.
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+# -----------------------
+# 3. READ-THROUGH CACHE WITH COALESCED LOADS
+# -----------------------
+class CoalescingCache:
+    """TTLCache front for an expensive loader: hits are served locally, concurrent misses share one load.
+
+    Empty results ([], {}, "", None) are kept only for `empty_ttl` seconds (0: not cached),
+    so a transient miss is not served for the full TTL.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0, path: Optional[str] = None,
+                 max_disk_entries: Optional[int] = None, table: str = "cache", empty_ttl: float = 0.0):
+        self.cache = TTLCache(max_size=max_size, ttl=ttl, path=path, max_disk_entries=max_disk_entries, table=table)
+        self.empty_ttl = empty_ttl
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def get_or_load(self, key: str, loader: Callable[[], Any],
+                    should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+        # should_cache runs after the loader, on the loading thread; errors are never cached.
+        value = self.cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        def load():
+            loaded = loader()
+            if should_cache(loaded):
+                if loaded:
+                    self.cache.set(key, loaded)
+                elif self.empty_ttl > 0:
+                    self.cache.set(key, loaded, ttl=self.empty_ttl)
+            return loaded
+
+        value, shared = self._flight.do(key, load)
+        if shared:
+            with self._lock:
+                self.coalesced += 1
+        return value
+
+    def invalidate(self, key: str):
+        self.cache.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats["coalesced"] = self.coalesced
+        return stats
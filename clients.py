@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Mapping, Optional
+
+# -----------------------
+# PROCESS-WIDE, LAZILY CREATED SERVICE CLIENTS
+# -----------------------
+# Streamlit re-executes the app script on every interaction, but imported modules
+# survive reruns. Clients built here are created once per process, on first use,
+# and their heavy imports (openai, firebase, pinecone, langchain) only happen then.
+
+INDEX_NAME = "learning-plan-index"
+NAMESPACE = "curated_learning"
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_DIMENSION = 1536
+
+_secrets: Optional[Mapping[str, Any]] = None
+_clients: Dict[str, Any] = {}
+_lock = threading.RLock()
+
+def configure(secrets: Mapping[str, Any]):
+    # Cheap enough to call on every rerun; clients already built keep their configuration.
+    global _secrets
+    _secrets = secrets
+
+def override(name: str, client: Any):
+    # Install a pre-built client (used by benchmarks and scripts to swap in fakes).
+    with _lock:
+        _clients[name] = client
+
+def reset():
+    with _lock:
+        _clients.clear()
+
+def _get(name: str, factory: Callable[[], Any]) -> Any:
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+def _secret(section: str) -> Mapping[str, Any]:
+    if _secrets is None:
+        raise RuntimeError("clients.configure() must be called before using service clients")
+    return _secrets[section]
+
+def get_openai_client():
+    def build():
+        import openai
+        # No SDK retries: openai_limiter retries, so every attempt is rate limited and counted.
+        return openai.OpenAI(api_key=_secret("openai")["api_key"], max_retries=0)
+    return _get("openai", build)
+
+def get_firestore():
+    def build():
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        firebase_creds = _secret("firebase")["credentials_json"]
+        if isinstance(firebase_creds, str):
+            firebase_creds = json.loads(firebase_creds)
+        if firebase_creds and not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(dict(firebase_creds)))
+        return firestore.client()
+    return _get("firestore", build)
+
+def get_pinecone():
+    def build():
+        from pinecone import Pinecone, ServerlessSpec
+        pinecone_config = _secret("pinecone")
+        os.environ["PINECONE_API_KEY"] = pinecone_config["api_key"]
+        pc = Pinecone(api_key=pinecone_config["api_key"])
+        if INDEX_NAME not in pc.list_indexes().names():
+            pc.create_index(
+                name=INDEX_NAME,
+                dimension=EMBEDDING_DIMENSION,  # Must match your embedding model's dimension
+                metric="cosine",
+                spec=ServerlessSpec(
+                    cloud=pinecone_config.get("cloud", "aws"),
+                    region=pinecone_config.get("region", "us-east-1")
+                )
+            )
+        return pc
+    return _get("pinecone", build)
+
+def get_embeddings():
+    # Cached on disk (optional [embedding_cache] secrets section) for both retrieval and ingestion.
+    def build():
+        from langchain_openai import OpenAIEmbeddings
+        from embedding_cache import CachedEmbeddings
+        api_key = _secret("openai")["api_key"]
+        cache_config = _secrets.get("embedding_cache", {})
+        return CachedEmbeddings(
+            OpenAIEmbeddings(openai_api_key=api_key, model=EMBEDDING_MODEL),
+            model=EMBEDDING_MODEL,
+            path=cache_config.get("path", ".cache/embeddings.sqlite3"),
+            max_size=int(cache_config.get("max_size", 2000)),
+            max_disk_entries=int(cache_config.get("max_disk_entries", 50000)),
+            batch_size=int(cache_config.get("batch_size", 256))
+        )
+    return _get("embeddings", build)
+
+def retrieval_backend() -> str:
+    # [retrieval] backend = "pinecone" (default) or "local" (in-process index, see local_vectorstore.py).
+    return _secrets.get("retrieval", {}).get("backend", "pinecone") if _secrets is not None else "pinecone"
+
+def local_index_dir() -> str:
+    return _secrets.get("retrieval", {}).get("local_index_dir", "vector_index") if _secrets is not None else "vector_index"
+
+def get_vectorstore():
+    def build():
+        if retrieval_backend() == "local":
+            from local_vectorstore import LocalVectorStore
+            return LocalVectorStore(local_index_dir(), get_embeddings())
+        from langchain_pinecone import Pinecone as LC_Pinecone
+        get_pinecone()
+        return LC_Pinecone.from_existing_index(
+            index_name=INDEX_NAME,
+            embedding=get_embeddings(),
+            namespace=NAMESPACE
+        )
+    return _get("vectorstore", build)
+
+def get_index():
+    return _get("index", lambda: get_pinecone().Index(INDEX_NAME))
@@ -0,0 +1,70 @@
+import base64
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from caching import TTLCache
+
+# -----------------------
+# DISK-BACKED EMBEDDING CACHE
+# -----------------------
+class CachedEmbeddings(Embeddings):
+    """Wraps a LangChain embeddings object with a size-bounded, SQLite-backed cache.
+
+    Keys are the model name plus a SHA-256 of the text; misses are de-duplicated and
+    embedded in batches of `batch_size`. Vectors are stored as base64 float32.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, path: Optional[str] = None,
+                 max_size: int = 2000, max_disk_entries: int = 50000,
+                 ttl: float = 90 * 24 * 3600.0, batch_size: int = 256):
+        self.embeddings = embeddings
+        self.model = model
+        self.batch_size = batch_size
+        self.cache = TTLCache(max_size=max_size, ttl=ttl, path=path,
+                              max_disk_entries=max_disk_entries, table="embeddings")
+        self._lock = threading.Lock()
+        self.embedded_texts = 0
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+        misses: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in misses:
+                continue
+            cached = self.cache.get(key)
+            if cached is None:
+                misses[key] = text
+            else:
+                vectors[key] = decode_vector(cached)
+        miss_keys = list(misses)
+        for i in range(0, len(miss_keys), self.batch_size):
+            batch = miss_keys[i:i + self.batch_size]
+            for key, vector in zip(batch, self.embeddings.embed_documents([misses[k] for k in batch])):
+                vector = [float(v) for v in vector]
+                vectors[key] = vector
+                self.cache.set(key, encode_vector(vector))
+        with self._lock:
+            self.embedded_texts += len(miss_keys)
+        return [vectors[key] for key in keys]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats["embedded_texts"] = self.embedded_texts
+        return stats
+
+    def _key(self, text: str) -> str:
+        return f"{self.model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+def encode_vector(vector: List[float]) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+def decode_vector(encoded: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(encoded), dtype=np.float32).tolist()
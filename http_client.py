@@ -0,0 +1,160 @@
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+
+# -----------------------
+# SHARED, POOLED HTTP SESSION
+# -----------------------
+# All outbound HTTP (SerpAPI, YouTube, link checks) goes through one requests.Session per
+# process, so repeated calls to the same host reuse kept-alive TCP+TLS connections instead
+# of paying a handshake each time. Idempotent calls are retried on 429/5xx and connection
+# errors with jittered exponential backoff, within a per-call deadline.
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+class DeadlineExceeded(requests.Timeout):
+    pass
+
+_settings: Dict[str, Any] = {
+    "pool_connections": 32,
+    "pool_maxsize": 16,
+    "per_host_limit": 16,
+    "max_retries": 2,
+    "backoff_base": 0.25,
+    "backoff_max": 4.0,
+}
+_session: Optional[requests.Session] = None
+_adapter: Optional[HTTPAdapter] = None
+_lock = threading.Lock()
+_host_slots: Dict[str, threading.BoundedSemaphore] = {}
+_counters: Dict[str, int] = {"requests": 0, "attempts": 0, "retries": 0, "errors": 0, "deadline_exceeded": 0}
+
+def configure(pool_connections: int = 32, pool_maxsize: int = 16, per_host_limit: int = 16,
+              max_retries: int = 2, backoff_base: float = 0.25, backoff_max: float = 4.0):
+    # Safe to call on every Streamlit rerun; pool sizes only change when the session is rebuilt.
+    global _session, _adapter
+    with _lock:
+        pool_changed = (pool_connections, pool_maxsize) != (_settings["pool_connections"], _settings["pool_maxsize"])
+        if per_host_limit != _settings["per_host_limit"]:
+            _host_slots.clear()
+        _settings.update(pool_connections=pool_connections, pool_maxsize=pool_maxsize, per_host_limit=per_host_limit,
+                         max_retries=max_retries, backoff_base=backoff_base, backoff_max=backoff_max)
+        if pool_changed and _session is not None:
+            _session.close()
+            _session = _adapter = None
+
+def get_session() -> requests.Session:
+    global _session, _adapter
+    with _lock:
+        if _session is None:
+            # pool_block stays off: waiting for a free connection is bounded by the per-host
+            # semaphore below, which honours the call's deadline.
+            _adapter = HTTPAdapter(pool_connections=_settings["pool_connections"],
+                                   pool_maxsize=_settings["pool_maxsize"], max_retries=0)
+            _session = requests.Session()
+            _session.mount("https://", _adapter)
+            _session.mount("http://", _adapter)
+        return _session
+
+def _host_slot(host: str) -> threading.BoundedSemaphore:
+    with _lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(_settings["per_host_limit"])
+        return slot
+
+def _count(name: str, n: int = 1):
+    with _lock:
+        _counters[name] += n
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    # Full jitter: uniform in [0, min(max, base * 2^attempt)]; a numeric Retry-After wins.
+    if retry_after:
+        try:
+            return min(float(retry_after), _settings["backoff_max"])
+        except ValueError:
+            pass
+    return random.uniform(0, min(_settings["backoff_max"], _settings["backoff_base"] * (2 ** attempt)))
+
+def request(method: str, url: str, timeout: float = 10.0, deadline: Optional[float] = None,
+            retries: Optional[int] = None, **kwargs) -> requests.Response:
+    """Send one idempotent request through the shared session.
+
+    `timeout` caps each attempt; `deadline` (seconds, default 3 x timeout) caps the whole call,
+    including waits for a host slot and backoff sleeps. Retryable statuses are returned as-is
+    once retries run out; DeadlineExceeded (a requests.Timeout) is raised when time runs out.
+    """
+    retries = _settings["max_retries"] if retries is None else retries
+    expires_at = time.monotonic() + (deadline if deadline is not None else 3 * timeout)
+    slot = _host_slot((urlsplit(url).hostname or "").lower())
+    session = get_session()
+    _count("requests")
+    attempt = 0
+    while True:
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0 or not slot.acquire(timeout=remaining):
+            _count("deadline_exceeded")
+            raise DeadlineExceeded(f"{method} {url}: deadline exceeded after {attempt} attempt(s)")
+        try:
+            _count("attempts")
+            response = session.request(method, url, timeout=min(timeout, max(0.1, expires_at - time.monotonic())),
+                                       **kwargs)
+            error = None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            response, error = None, e
+            _count("errors")
+        finally:
+            slot.release()
+        retryable = error is not None or response.status_code in RETRY_STATUSES
+        if not retryable or attempt >= retries:
+            if error is not None:
+                raise error
+            return response
+        delay = backoff_delay(attempt, response.headers.get("Retry-After") if response is not None else None)
+        if time.monotonic() + delay >= expires_at:
+            if error is not None:
+                raise error
+            return response
+        if response is not None:
+            response.close()
+        attempt += 1
+        _count("retries")
+        current = instrumentation.current_span()
+        if current is not None:
+            current.set(retries=attempt)
+        time.sleep(delay)
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+def head(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("allow_redirects", True)
+    return request("HEAD", url, **kwargs)
+
+def pool_stats() -> Dict[str, Any]:
+    # Counters plus, per host, connections opened vs requests served (the rest reused a connection).
+    with _lock:
+        stats: Dict[str, Any] = dict(_counters)
+        adapter = _adapter
+    hosts = {}
+    if adapter is not None:
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+                "connections": pool.num_connections,
+                "requests": pool.num_requests,
+            }
+    stats["connections_opened"] = sum(h["connections"] for h in hosts.values())
+    stats["connections_reused"] = sum(max(0, h["requests"] - h["connections"]) for h in hosts.values())
+    stats["hosts"] = hosts
+    return stats
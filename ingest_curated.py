@@ -0,0 +1,142 @@
+"""Incremental ingestion of the curated learning-plan guidelines into the vector index.
+
+    python ingest_curated.py [--source curated] [--backend pinecone|local] [--batch-size 64] [--dry-run]
+
+Every chunk is identified by its document path and a hash of its text, so re-running
+the command only embeds chunks that are new or changed, and deletes the vectors of
+chunks that no longer exist. Secrets are read from .streamlit/secrets.toml.
+"""
+import argparse
+import hashlib
+import os
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+import clients
+
+SOURCE_EXTENSIONS = (".md", ".txt")
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# -----------------------
+# 1. LOADING & CHUNKING
+# -----------------------
+def load_documents(source_dir: str) -> Dict[str, str]:
+    documents = {}
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if name.startswith(".") or not name.endswith(SOURCE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, encoding="utf-8") as f:
+                documents[os.path.relpath(path, source_dir).replace(os.sep, "/")] = f.read()
+    return documents
+
+def chunk_documents(documents: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    # Returns {chunk_id: {"text", "source", "chunk_hash"}}; ids are stable for unchanged text.
+    from langchain.text_splitter import CharacterTextSplitter
+    splitter = CharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    chunks = {}
+    for source, text in documents.items():
+        for chunk in splitter.split_text(text):
+            chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:32]
+            chunks[f"{source}#{chunk_hash}"] = {"text": chunk, "source": source, "chunk_hash": chunk_hash}
+    return chunks
+
+def batched(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# -----------------------
+# 2. SYNCING WITH THE INDEX
+# -----------------------
+def existing_chunk_ids(index, namespace: str) -> Set[str]:
+    ids: Set[str] = set()
+    for page in index.list(namespace=namespace):
+        ids.update(page)
+    return ids
+
+def sync_chunks(chunks: Dict[str, Dict[str, Any]], index, embeddings, namespace: str,
+                batch_size: int = 64, dry_run: bool = False, log=print) -> Dict[str, int]:
+    existing = existing_chunk_ids(index, namespace)
+    new_ids = sorted(set(chunks) - existing)
+    stale_ids = sorted(existing - set(chunks))
+    log(f"{len(chunks)} chunks: {len(new_ids)} to embed, {len(stale_ids)} to delete, "
+        f"{len(chunks) - len(new_ids)} unchanged")
+    if dry_run:
+        return {"embedded": 0, "deleted": 0, "unchanged": len(chunks) - len(new_ids)}
+
+    for batch_ids in batched(new_ids, batch_size):
+        vectors = embeddings.embed_documents([chunks[chunk_id]["text"] for chunk_id in batch_ids])
+        index.upsert(
+            vectors=[
+                {"id": chunk_id, "values": values, "metadata": chunks[chunk_id]}
+                for chunk_id, values in zip(batch_ids, vectors)
+            ],
+            namespace=namespace
+        )
+        log(f"  upserted {len(batch_ids)} chunks")
+    for batch_ids in batched(stale_ids, 1000):
+        index.delete(ids=batch_ids, namespace=namespace)
+        log(f"  deleted {len(batch_ids)} chunks")
+    return {"embedded": len(new_ids), "deleted": len(stale_ids), "unchanged": len(chunks) - len(new_ids)}
+
+def sync_local_chunks(chunks: Dict[str, Dict[str, Any]], directory: str, embeddings,
+                      batch_size: int = 64, dry_run: bool = False, log=print) -> Dict[str, int]:
+    # Same incremental contract as sync_chunks, for the in-process index files.
+    import local_vectorstore
+    existing = local_vectorstore.read_index(directory)
+    new_ids = sorted(set(chunks) - set(existing))
+    stale = len(set(existing) - set(chunks))
+    log(f"{len(chunks)} chunks: {len(new_ids)} to embed, {stale} to delete, "
+        f"{len(chunks) - len(new_ids)} unchanged")
+    if dry_run:
+        return {"embedded": 0, "deleted": 0, "unchanged": len(chunks) - len(new_ids)}
+
+    vectors = {chunk_id: existing[chunk_id] for chunk_id in chunks if chunk_id in existing}
+    for batch_ids in batched(new_ids, batch_size):
+        for chunk_id, values in zip(batch_ids, embeddings.embed_documents([chunks[c]["text"] for c in batch_ids])):
+            vectors[chunk_id] = values
+        log(f"  embedded {len(batch_ids)} chunks")
+    chunk_ids = sorted(chunks)
+    local_vectorstore.write_index(
+        directory,
+        [vectors[chunk_id] for chunk_id in chunk_ids],
+        [dict(chunks[chunk_id], id=chunk_id) for chunk_id in chunk_ids]
+    )
+    log(f"  wrote {len(chunk_ids)} vectors to {directory}")
+    return {"embedded": len(new_ids), "deleted": stale, "unchanged": len(chunks) - len(new_ids)}
+
+def main(argv: Iterable[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest curated guideline documents into the vector index.")
+    parser.add_argument("--source", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "curated"))
+    parser.add_argument("--namespace", default=clients.NAMESPACE)
+    parser.add_argument("--backend", choices=["pinecone", "local"], default=None,
+                        help="Defaults to [retrieval] backend from secrets.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    import streamlit as st
+    clients.configure(st.secrets)
+
+    documents = load_documents(args.source)
+    if not documents:
+        print(f"No {'/'.join(SOURCE_EXTENSIONS)} documents found in {args.source}")
+        return 1
+    chunks = chunk_documents(documents)
+    print(f"Loaded {len(documents)} documents from {args.source}")
+    embeddings = clients.get_embeddings()
+    if (args.backend or clients.retrieval_backend()) == "local":
+        sync_local_chunks(chunks, clients.local_index_dir(), embeddings,
+                          batch_size=args.batch_size, dry_run=args.dry_run)
+    else:
+        sync_chunks(chunks, clients.get_index(), embeddings, args.namespace,
+                    batch_size=args.batch_size, dry_run=args.dry_run)
+    if hasattr(embeddings, "stats"):
+        stats = embeddings.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
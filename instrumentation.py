@@ -0,0 +1,312 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# -----------------------
+# TIMED SPANS AROUND EXTERNAL CALLS
+# -----------------------
+# Every outbound call (OpenAI, SerpAPI, YouTube, link checks, vector search, Firestore) runs
+# inside span(stage, dependency). Spans nest through a context variable, so a plan request
+# opened with trace() collects the tree of everything it did, including work on pool threads
+# submitted through bind(). Finished spans also feed per-process histograms that export as
+# Prometheus text or JSON lines.
+
+logger = logging.getLogger("yello.instrumentation")
+
+# Upper bounds in seconds; the last bucket is +Inf.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("yello_span", default=None)
+
+class Span:
+    """One timed operation: its stage, the external dependency it called, outcome and attributes."""
+
+    def __init__(self, stage: str, dependency: Optional[str] = None, parent: Optional["Span"] = None):
+        self.stage = stage
+        self.dependency = dependency
+        self.parent = parent
+        self.outcome = "ok"
+        self.attributes: Dict[str, Any] = {}
+        self.children: List["Span"] = []
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def set(self, **attributes: Any) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._started) * 1000, 1)
+
+    def record_tokens(self, usage: Any):
+        # Accepts an OpenAI usage object (or dict); missing usage is ignored.
+        if usage is None:
+            return
+        get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+        prompt_tokens, completion_tokens = get("prompt_tokens") or 0, get("completion_tokens") or 0
+        self.attributes["prompt_tokens"] = self.attributes.get("prompt_tokens", 0) + prompt_tokens
+        self.attributes["completion_tokens"] = self.attributes.get("completion_tokens", 0) + completion_tokens
+        registry.add_tokens(self.stage, prompt_tokens, completion_tokens)
+
+    def _add_child(self, child: "Span"):
+        with self._lock:
+            self.children.append(child)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            children = list(self.children)
+        return {
+            "stage": self.stage,
+            "dependency": self.dependency,
+            "outcome": self.outcome,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in sorted(children, key=lambda c: c.start)],
+        }
+
+@contextlib.contextmanager
+def span(stage: str, dependency: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    parent = _current.get()
+    current = Span(stage, dependency, parent).set(**attributes)
+    if parent is not None:
+        parent._add_child(current)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        if current.outcome == "ok":
+            current.outcome = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        current.duration = time.perf_counter() - current._started
+        registry.observe(current)
+
+@contextlib.contextmanager
+def trace(name: str, **attributes: Any) -> Iterator[Span]:
+    # Root span for one user-facing request (e.g. one plan generation). On exit the tree is
+    # appended to the JSONL trace file and, if it was slow, to the slow-request log.
+    root = None
+    try:
+        with span(name, **attributes) as root:
+            try:
+                yield root
+            except BaseException as e:
+                root.outcome = type(e).__name__
+                raise
+    finally:
+        # Once span() has exited, so the root span itself is in the exported metrics.
+        if root is not None:
+            _finish_trace(root)
+
+def timed(stage: str, dependency: Optional[str] = None):
+    # Decorator form of span() for functions that are one external call site.
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage, dependency):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    # Runs fn in a copy of the caller's context, so spans opened on a pool thread attach to
+    # the caller's span tree. Use as executor.submit(bind(fn), *args).
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+# -----------------------
+# PER-PROCESS AGGREGATES
+# -----------------------
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        # Upper bound of the bucket holding the q-th observation.
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+class Registry:
+    """Span duration histograms keyed by (stage, dependency, outcome), plus OpenAI token counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}
+        self.tokens: Dict[Tuple[str, str], int] = {}
+        self.gauges: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def observe(self, finished: Span):
+        key = (finished.stage, finished.dependency or "", finished.outcome)
+        with self._lock:
+            self.histograms.setdefault(key, Histogram()).observe(finished.duration or 0.0)
+
+    def add_tokens(self, stage: str, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            for kind, n in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+                self.tokens[(stage, kind)] = self.tokens.get((stage, kind), 0) + n
+
+    def register_gauges(self, name: str, collect: Callable[[], Dict[str, Any]]):
+        # collect() returns {metric: number}; exported as yello_<name>_<metric>.
+        with self._lock:
+            self.gauges[name] = collect
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.tokens.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            histograms = {key: (list(h.counts), h.total, h.count, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                          for key, h in self.histograms.items()}
+            tokens = dict(self.tokens)
+            gauges = dict(self.gauges)
+        return {
+            "time": time.time(),
+            "spans": [
+                {"stage": stage, "dependency": dependency, "outcome": outcome, "count": count,
+                 "sum_seconds": round(total, 4), "p50": p50, "p95": p95, "p99": p99}
+                for (stage, dependency, outcome), (_, total, count, p50, p95, p99) in sorted(histograms.items())
+            ],
+            "tokens": [{"stage": stage, "kind": kind, "total": n} for (stage, kind), n in sorted(tokens.items())],
+            "gauges": {name: _numeric(collect) for name, collect in gauges.items()},
+        }
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP yello_span_duration_seconds Duration of instrumented calls.",
+            "# TYPE yello_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            histograms = {key: (list(h.counts), h.total, h.count) for key, h in self.histograms.items()}
+            tokens = dict(self.tokens)
+            gauges = dict(self.gauges)
+        for (stage, dependency, outcome), (counts, total, count) in sorted(histograms.items()):
+            labels = f'stage="{_escape(stage)}",dependency="{_escape(dependency)}",outcome="{_escape(outcome)}"'
+            cumulative = 0
+            for bound, n in zip(list(BUCKETS) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f'yello_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"yello_span_duration_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"yello_span_duration_seconds_count{{{labels}}} {count}")
+        lines += [
+            "# HELP yello_openai_tokens_total OpenAI tokens used, by stage.",
+            "# TYPE yello_openai_tokens_total counter",
+        ]
+        for (stage, kind), n in sorted(tokens.items()):
+            lines.append(f'yello_openai_tokens_total{{stage="{_escape(stage)}",kind="{kind}"}} {n}')
+        for name, collect in sorted(gauges.items()):
+            for metric, value in sorted(_numeric(collect).items()):
+                lines.append(f"yello_{name}_{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+def _numeric(collect: Callable[[], Dict[str, Any]]) -> Dict[str, float]:
+    try:
+        values = collect()
+    except Exception:
+        return {}
+    return {k: v for k, v in values.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+registry = Registry()
+
+# -----------------------
+# EXPORT
+# -----------------------
+_config: Dict[str, Any] = {
+    "trace_path": None,
+    "slow_log_path": None,
+    "slow_threshold_seconds": 30.0,
+    "prometheus_path": None,
+    "metrics_path": None,
+}
+_export_lock = threading.Lock()
+
+def configure(trace_path: Optional[str] = None, slow_log_path: Optional[str] = None,
+              slow_threshold_seconds: float = 30.0, prometheus_path: Optional[str] = None,
+              metrics_path: Optional[str] = None):
+    # Empty paths disable that export. Cheap enough to call on every rerun.
+    _config.update(
+        trace_path=trace_path or None,
+        slow_log_path=slow_log_path or None,
+        slow_threshold_seconds=slow_threshold_seconds,
+        prometheus_path=prometheus_path or None,
+        metrics_path=metrics_path or None,
+    )
+
+def _append_jsonl(path: str, record: Dict[str, Any]):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _export_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, default=str) + "\n")
+
+def write_prometheus(path: str):
+    # Atomic replace, for node_exporter's textfile collector or any file-based scraper.
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with _export_lock:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(registry.prometheus_text())
+        os.replace(tmp_path, path)
+
+def export_metrics():
+    # Writes whichever aggregate exports are configured; called after every trace.
+    try:
+        if _config["prometheus_path"]:
+            write_prometheus(_config["prometheus_path"])
+        if _config["metrics_path"]:
+            _append_jsonl(_config["metrics_path"], registry.snapshot())
+    except OSError as e:
+        logger.warning("metrics export failed: %s", e)
+
+def _finish_trace(root: Span):
+    tree = root.to_dict()
+    try:
+        if _config["trace_path"]:
+            _append_jsonl(_config["trace_path"], tree)
+        if root.duration is not None and root.duration >= _config["slow_threshold_seconds"]:
+            logger.warning("slow request %s took %.1fs", root.stage, root.duration)
+            if _config["slow_log_path"]:
+                _append_jsonl(_config["slow_log_path"], tree)
+    except OSError as e:
+        logger.warning("trace export failed: %s", e)
+    export_metrics()
+
+def format_tree(tree: Dict[str, Any], indent: int = 0) -> str:
+    # Plain-text rendering of a span tree for the app's trace view.
+    label = tree["stage"] + (f" [{tree['dependency']}]" if tree.get("dependency") else "")
+    details = ", ".join(f"{k}={v}" for k, v in tree.get("attributes", {}).items())
+    line = f"{'  ' * indent}{label}: {tree.get('duration_ms')} ms {tree['outcome']}" + (f" ({details})" if details else "")
+    return "\n".join([line] + [format_tree(child, indent + 1) for child in tree.get("children", [])])
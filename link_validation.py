@@ -0,0 +1,162 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import http_client
+import instrumentation
+from caching import TTLCache
+
+# -----------------------
+# 1. SINGLE LINK CHECKS
+# -----------------------
+def is_youtube_link(url: str) -> bool:
+    return "youtube.com" in url or "youtu.be" in url
+
+def check_link(url: str) -> bool:
+    if is_youtube_link(url):
+        return "watch?v=" in url or "youtu.be/" in url
+    key = normalize_url(url)
+    cache = url_cache
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["valid"]
+    valid, status = check_link_status(url)
+    ttl = cache_ttl(valid, status)
+    if cache is not None and ttl > 0:
+        cache.set(key, {"valid": valid, "status": status, "checked_at": time.time()}, ttl=ttl)
+    return valid
+
+def cache_ttl(valid: bool, status: Optional[int]) -> float:
+    # Only a definite client error is a broken link; timeouts, connection errors (status None),
+    # 408/429 and 5xx may pass on the next check, so they are kept for transient_ttl at most.
+    if valid:
+        return valid_ttl
+    if status is not None and 400 <= status < 500 and status not in (408, 429):
+        return invalid_ttl
+    return transient_ttl
+
+def check_link_status(url: str) -> Tuple[bool, Optional[int]]:
+    # Uncached network check; the status is None when the request itself failed. Requests to
+    # one host are capped process-wide by http_client's per-host slots.
+    with instrumentation.span("link_check", "http", host=(urlsplit(url).hostname or "").lower()) as call:
+        try:
+            r = http_client.head(url, timeout=3, deadline=6)
+            if r.status_code == 200:
+                call.set(status=200)
+                return True, 200
+            # Only the status matters, so don't download the body.
+            r = http_client.get(url, timeout=5, deadline=8, stream=True)
+            r.close()
+            call.set(status=r.status_code)
+            call.outcome = "ok" if r.status_code == 200 else "broken"
+            return r.status_code == 200, r.status_code
+        except Exception as e:
+            call.outcome = type(e).__name__
+            return False, None
+
+# -----------------------
+# 2. URL VALIDITY CACHE
+# -----------------------
+# Process-wide, optionally backed by SQLite so results survive restarts and are
+# shared between worker processes. Broken links (4xx) are cached too, for a shorter time;
+# failures that may be transient for a few minutes at most (0 disables that).
+url_cache: Optional[TTLCache] = None
+valid_ttl = 7 * 24 * 3600.0
+invalid_ttl = 6 * 3600.0
+transient_ttl = 300.0
+_cache_lock = threading.Lock()
+
+def configure_cache(path: Optional[str] = None, max_size: int = 10000, max_disk_entries: int = 100000,
+                    valid_ttl_seconds: float = valid_ttl, invalid_ttl_seconds: float = invalid_ttl,
+                    transient_ttl_seconds: float = transient_ttl) -> TTLCache:
+    # Safe to call on every Streamlit rerun: the cache is only built once per process.
+    global url_cache, valid_ttl, invalid_ttl, transient_ttl
+    with _cache_lock:
+        valid_ttl = valid_ttl_seconds
+        invalid_ttl = invalid_ttl_seconds
+        transient_ttl = transient_ttl_seconds
+        if url_cache is None:
+            url_cache = TTLCache(
+                max_size=max_size,
+                ttl=valid_ttl_seconds,
+                path=path,
+                max_disk_entries=max_disk_entries,
+                table="url_validity"
+            )
+    return url_cache
+
+def normalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        netloc += f":{parts.port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+# -----------------------
+# 3. CONCURRENT VALIDATION PASSES
+# -----------------------
+def check_links(urls: List[str], max_workers: int = 8, deadline: float = 15.0,
+                initializer: Optional[Callable[[], None]] = None) -> List[bool]:
+    # Results are returned in input order; links not checked before the deadline count as invalid.
+    results = [False] * len(urls)
+    if not urls:
+        return results
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)), initializer=initializer)
+    try:
+        futures = {executor.submit(instrumentation.bind(check_link), url): i for i, url in enumerate(urls)}
+        done, _ = wait(futures, timeout=deadline)
+        for future in done:
+            results[futures[future]] = future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def validate_resources(resources: List[Dict[str, Any]],
+                       fallback_search: Optional[Callable[[Dict[str, Any]], List[Dict[str, str]]]] = None,
+                       max_workers: int = 16, deadline: float = 20.0,
+                       initializer: Optional[Callable[[], None]] = None) -> List[Dict[str, Any]]:
+    """Check every resource link concurrently, replacing broken ones with a fallback search result.
+
+    Resources are updated in place, in their original order, once the pass finishes or the
+    deadline expires; anything still running at the deadline keeps its original link.
+    """
+    if not resources:
+        return resources
+    expires_at = time.monotonic() + deadline
+
+    def resolve(resource: Dict[str, Any]) -> Optional[str]:
+        if check_link(resource.get("link", "")):
+            return None
+        if fallback_search is None or time.monotonic() >= expires_at:
+            return None
+        fallback = fallback_search(resource)
+        if fallback and fallback[0].get("link"):
+            new_link = fallback[0]["link"]
+            if time.monotonic() < expires_at and check_link(new_link):
+                return new_link
+        return None
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(resources)), initializer=initializer)
+    try:
+        futures = {executor.submit(instrumentation.bind(resolve), resource): i for i, resource in enumerate(resources)}
+        done, _ = wait(futures, timeout=deadline)
+        replacements = {}
+        for future in done:
+            try:
+                new_link = future.result()
+            except Exception:
+                continue
+            if new_link:
+                replacements[futures[future]] = new_link
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    for i in sorted(replacements):
+        resources[i]["link"] = replacements[i]
+    return resources
@@ -0,0 +1,86 @@
+import json
+import os
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+MATRIX_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.jsonl"
+
+# -----------------------
+# IN-PROCESS VECTOR INDEX
+# -----------------------
+class LocalVectorStore:
+    """Cosine top-k search over a memory-mapped matrix of unit-normalised embeddings.
+
+    Exposes the same `similarity_search(query, k)` call as the LangChain Pinecone store.
+    Row i of embeddings.npy corresponds to line i of metadata.jsonl, whose "text" field
+    becomes the returned document's page_content.
+    """
+
+    def __init__(self, directory: str, embedding):
+        self.directory = directory
+        self.embedding = embedding
+        self.matrix = np.load(os.path.join(directory, MATRIX_FILE), mmap_mode="r")
+        self.metadata = read_metadata(directory)
+        if len(self.metadata) != self.matrix.shape[0]:
+            raise ValueError(f"{directory}: {self.matrix.shape[0]} vectors but {len(self.metadata)} metadata rows")
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Any]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Any]:
+        from langchain_core.documents import Document
+        scores = self.search_by_vector(self.embedding.embed_query(query), k)
+        return [
+            (Document(page_content=self.metadata[i].get("text", ""), metadata=self.metadata[i]), score)
+            for i, score in scores
+        ]
+
+    def search_by_vector(self, vector: Sequence[float], k: int = 4) -> List[Any]:
+        # Returns [(row, score)] for the k most similar rows, best first.
+        n = self.matrix.shape[0]
+        if n == 0 or k <= 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = self.matrix @ query
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+def read_metadata(directory: str) -> List[Dict[str, Any]]:
+    path = os.path.join(directory, METADATA_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def read_index(directory: str) -> Dict[str, Any]:
+    # Returns {chunk_id: vector} for an existing index, or {} if there is none yet.
+    matrix_path = os.path.join(directory, MATRIX_FILE)
+    if not os.path.exists(matrix_path):
+        return {}
+    matrix = np.load(matrix_path)
+    return {meta["id"]: matrix[i] for i, meta in enumerate(read_metadata(directory))}
+
+def write_index(directory: str, vectors: List[Sequence[float]], metadata: List[Dict[str, Any]]):
+    # Rows are normalised on write so search is a single matrix-vector product. Files are
+    # swapped in atomically so a running app never maps a half-written matrix.
+    os.makedirs(directory, exist_ok=True)
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(metadata), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+    matrix_tmp = os.path.join(directory, MATRIX_FILE + ".tmp")
+    metadata_tmp = os.path.join(directory, METADATA_FILE + ".tmp")
+    with open(matrix_tmp, "wb") as f:
+        np.save(f, matrix)
+    with open(metadata_tmp, "w", encoding="utf-8") as f:
+        for meta in metadata:
+            f.write(json.dumps(meta) + "\n")
+    os.replace(matrix_tmp, os.path.join(directory, MATRIX_FILE))
+    os.replace(metadata_tmp, os.path.join(directory, METADATA_FILE))
@@ -0,0 +1,168 @@
+"""One-off Firestore data migrations.
+
+    python migrations.py --list
+    python migrations.py <name> [--dry-run]
+
+Every migration is idempotent and safe to re-run. Secrets are read from
+.streamlit/secrets.toml.
+"""
+import argparse
+import sys
+from typing import Any, Callable, Dict, Iterable
+
+import clients
+from progress_buffer import PROGRESS_SCHEMA_VERSION
+
+MIGRATIONS: Dict[str, Callable[..., Dict[str, int]]] = {}
+DESCRIPTIONS: Dict[str, str] = {}
+
+def migration(name: str, description: str):
+    def register(fn):
+        MIGRATIONS[name] = fn
+        DESCRIPTIONS[name] = description
+        return fn
+    return register
+
+class BatchWriter:
+    # Groups updates into Firestore batches (max 500 writes each).
+    def __init__(self, db, dry_run: bool = False, size: int = 400):
+        self.db = db
+        self.dry_run = dry_run
+        self.size = size
+        self.batch = None
+        self.pending = 0
+        self.written = 0
+
+    def update(self, ref, data: Dict[str, Any]):
+        self._add("update", ref, data)
+
+    def set(self, ref, data: Dict[str, Any]):
+        self._add("set", ref, data)
+
+    def delete(self, ref):
+        self._add("delete", ref)
+
+    def _add(self, op: str, ref, *args):
+        if self.dry_run:
+            self.written += 1
+            return
+        if self.batch is None:
+            self.batch = self.db.batch()
+        getattr(self.batch, op)(ref, *args)
+        self.pending += 1
+        if self.pending >= self.size:
+            self.commit()
+
+    def commit(self):
+        if self.batch is not None and self.pending:
+            self.batch.commit()
+            self.written += self.pending
+        self.batch = None
+        self.pending = 0
+
+# -----------------------
+# PROGRESS: FIELD-PATH LAYOUT
+# -----------------------
+@migration("progress-field-paths", "Normalise plan progress maps for field-path updates.")
+def migrate_progress_field_paths(db, dry_run: bool = False) -> Dict[str, int]:
+    # Progress is now updated one field path at a time (progress.<week_key>.<item_id>), which
+    # needs `progress` and every week entry to be maps of booleans. Older documents could hold
+    # null, non-map weeks or non-boolean values; normalise them and stamp the schema version.
+    writer = BatchWriter(db, dry_run)
+    scanned = 0
+    for plan_doc in db.collection_group("learning_plans").select(["progress", "progress_schema"]).stream():
+        scanned += 1
+        data = plan_doc.to_dict() or {}
+        if data.get("progress_schema", 0) >= PROGRESS_SCHEMA_VERSION:
+            continue
+        progress = data.get("progress")
+        normalized = {
+            week_key: {item_id: bool(value) for item_id, value in items.items()}
+            for week_key, items in (progress.items() if isinstance(progress, dict) else [])
+            if isinstance(items, dict)
+        }
+        writer.update(plan_doc.reference, {"progress": normalized, "progress_schema": PROGRESS_SCHEMA_VERSION})
+    writer.commit()
+    return {"scanned": scanned, "updated": writer.written}
+
+# -----------------------
+# ADMIN SEARCH FIELDS
+# -----------------------
+@migration("lowercase-search-fields", "Backfill users.email_lower and learning_plans.title_lower for admin search.")
+def backfill_lowercase_search_fields(db, dry_run: bool = False) -> Dict[str, int]:
+    # The admin listings order by these fields, so documents without them are invisible there.
+    writer = BatchWriter(db, dry_run)
+    scanned = 0
+    for user_doc in db.collection("users").select(["email", "email_lower"]).stream():
+        scanned += 1
+        data = user_doc.to_dict() or {}
+        email_lower = (data.get("email") or user_doc.id).lower()
+        if data.get("email_lower") != email_lower:
+            writer.update(user_doc.reference, {"email_lower": email_lower})
+    for plan_doc in db.collection_group("learning_plans").select(["title", "title_lower"]).stream():
+        scanned += 1
+        data = plan_doc.to_dict() or {}
+        title_lower = (data.get("title") or "").lower()
+        if data.get("title_lower") != title_lower:
+            writer.update(plan_doc.reference, {"title_lower": title_lower})
+    writer.commit()
+    return {"scanned": scanned, "updated": writer.written}
+
+# -----------------------
+# ADMIN STATISTICS
+# -----------------------
+@migration("rebuild-admin-stats", "Backfill or rebuild the materialized admin statistics documents.")
+def rebuild_admin_stats(db, dry_run: bool = False) -> Dict[str, int]:
+    import admin_stats
+    return admin_stats.rebuild(db, dry_run=dry_run)
+
+# -----------------------
+# PLAN STORAGE: METADATA + WEEK SUBDOCUMENTS
+# -----------------------
+@migration("plan-storage-v2", "Split legacy JSON-string plans into metadata and per-week documents.")
+def migrate_plan_storage_v2(db, dry_run: bool = False, compress: bool = True) -> Dict[str, int]:
+    # Week documents are queued before the parent update that removes the legacy "plan" string,
+    # so an interrupted run leaves every plan readable and a re-run simply rewrites its weeks.
+    import datetime
+    import json5
+    from firebase_admin import firestore
+    import plan_storage
+
+    writer = BatchWriter(db, dry_run)
+    scanned = migrated = 0
+    for plan_doc in db.collection_group("learning_plans").select(["plan", "storage_version"]).stream():
+        scanned += 1
+        data = plan_doc.to_dict() or {}
+        if data.get("storage_version", 1) >= plan_storage.STORAGE_VERSION:
+            continue
+        plan = json5.loads(data.get("plan") or "{}")
+        parent, week_docs = plan_storage.plan_documents(plan_doc.reference, plan, {
+            "plan": firestore.DELETE_FIELD,
+            "updated_at": datetime.datetime.utcnow().isoformat(),
+        }, compress=compress)
+        for week_ref, week_data in week_docs:
+            writer.set(week_ref, week_data)
+        writer.update(plan_doc.reference, parent)
+        migrated += 1
+    writer.commit()
+    return {"scanned": scanned, "migrated": migrated, "writes": writer.written}
+
+def main(argv: Iterable[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a Firestore data migration.")
+    parser.add_argument("name", nargs="?", choices=sorted(MIGRATIONS))
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args(argv)
+    if args.list or not args.name:
+        for name in sorted(MIGRATIONS):
+            print(f"{name}: {DESCRIPTIONS[name]}")
+        return 0
+
+    import streamlit as st
+    clients.configure(st.secrets)
+    result = MIGRATIONS[args.name](clients.get_firestore(), dry_run=args.dry_run)
+    print(f"{args.name}{' (dry run)' if args.dry_run else ''}: " + ", ".join(f"{k}={v}" for k, v in result.items()))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
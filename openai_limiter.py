@@ -0,0 +1,354 @@
+import heapq
+import itertools
+import math
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import instrumentation
+
+# -----------------------
+# PROCESS-WIDE OPENAI RATE LIMITING
+# -----------------------
+# Every OpenAI call from every session goes through one AdaptiveLimiter per process:
+#   - token buckets for requests/minute and tokens/minute. A call reserves its estimated
+#     prompt tokens plus max_tokens (the same worst case OpenAI counts against the limit);
+#     the unused part goes back to the bucket once the real usage is known;
+#   - an AIMD concurrency limit: +1 slot per `limit` fast calls, halved on a 429, and cut
+#     by 10% when calls are slower than the latency target (at most once per interval);
+#   - a priority lane: waiting plan calls always go before enrichment calls, and
+#     enrichment calls leave `plan_reserve` slots free for plan calls;
+#   - a shared cooldown after a 429 (Retry-After, or jittered backoff), after which the
+#     call is queued again, up to `max_retries` times (connection errors and 5xx before
+#     any streamed output are retried the same way, after a short backoff);
+#   - failed calls: a client timeout halves the limit like a 429 (without the cooldown) and
+#     a 5xx counts as a slow call. Connection errors give back the whole reservation;
+#     timeouts and 5xx keep the prompt part, which the server may already have counted.
+
+PLAN = 0
+ENRICHMENT = 1
+PRIORITY_NAMES = {PLAN: "plan", ENRICHMENT: "enrichment"}
+
+class LimiterTimeout(Exception):
+    pass
+
+def estimate_prompt_tokens(messages: Sequence[Dict[str, str]]) -> int:
+    # ~4 characters per token plus a few tokens of framing per message.
+    return sum(len(m.get("content") or "") // 4 + 4 for m in messages) + 3
+
+def estimate_tokens(messages: Sequence[Dict[str, str]], max_tokens: int) -> int:
+    return estimate_prompt_tokens(messages) + max_tokens
+
+def is_rate_limit(error: BaseException) -> bool:
+    # openai.RateLimitError without importing openai here.
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+def failure_kind(error: BaseException) -> str:
+    # "timeout", "connection", "server" (5xx) or "other", without importing openai/httpx here.
+    names = [cls.__name__ for cls in type(error).__mro__]
+    if any("Timeout" in name for name in names):
+        return "timeout"
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int) and status >= 500:
+        return "server"
+    if any("Connection" in name for name in names):
+        return "connection"
+    return "other"
+
+def retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) / (1000.0 if name.endswith("-ms") else 1.0)
+            except ValueError:
+                pass
+    return None
+
+class TokenBucket:
+    # Not thread-safe on its own; AdaptiveLimiter guards it. The level may go negative
+    # when a call used more than it reserved.
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float, now: float):
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+class Permit:
+    """One admitted call. Report the first streamed token and the usage while it runs."""
+
+    def __init__(self, limiter: "AdaptiveLimiter", priority: int, reserved_tokens: int, waited: float,
+                 prompt_tokens: int = 0):
+        self.limiter = limiter
+        self.priority = priority
+        self.reserved_tokens = reserved_tokens
+        self.prompt_tokens = prompt_tokens
+        self.waited = waited
+        self.used_tokens: Optional[int] = None
+        self._started = time.monotonic()
+        self._first_token: Optional[float] = None
+        self._released = False
+
+    def first_token(self):
+        if self._first_token is None:
+            self._first_token = time.monotonic() - self._started
+
+    def record_usage(self, usage: Any):
+        if usage is None:
+            return
+        get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+        self.used_tokens = (self.used_tokens or 0) + (get("prompt_tokens") or 0) + (get("completion_tokens") or 0)
+
+    def record_partial(self, completion_chars: int):
+        # For streams closed before the usage chunk: prompt estimate plus what was streamed.
+        if self.used_tokens is None:
+            self.used_tokens = self.prompt_tokens + completion_chars // 4
+
+    def latency(self) -> float:
+        # Time to first token for streams (independent of the answer's length), else the whole call.
+        return self._first_token if self._first_token is not None else time.monotonic() - self._started
+
+class AdaptiveLimiter:
+    def __init__(self, rpm: float = 500, tpm: float = 30000, min_concurrency: int = 1, max_concurrency: int = 16,
+                 initial_concurrency: int = 4, latency_target: float = 10.0, plan_reserve: int = 1,
+                 max_retries: int = 2, adjust_interval: float = 5.0):
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: List[Tuple[int, int]] = []
+        self._in_flight = 0
+        self._cooldown_until = 0.0
+        self._consecutive_throttles = 0
+        self._last_decrease = 0.0
+        self._counters = {"acquired": 0, "throttled": 0, "retried": 0, "wait_timeouts": 0, "waited": 0,
+                          "failed": 0, "timeouts": 0,
+                          "limit_increases": 0, "limit_decreases": 0}
+        self._wait_seconds = 0.0
+        self.configure(rpm, tpm, min_concurrency, max_concurrency, initial_concurrency, latency_target,
+                       plan_reserve, max_retries, adjust_interval)
+
+    def configure(self, rpm: float = 500, tpm: float = 30000, min_concurrency: int = 1, max_concurrency: int = 16,
+                  initial_concurrency: int = 4, latency_target: float = 10.0, plan_reserve: int = 1,
+                  max_retries: int = 2, adjust_interval: float = 5.0):
+        # Safe to call on every rerun: buckets are only rebuilt when their rate changes, and
+        # the learned concurrency limit is kept (clamped to the new bounds).
+        with self._cond:
+            if getattr(self, "rpm", None) is None or self.rpm.capacity != rpm:
+                self.rpm = TokenBucket(rpm)
+            if getattr(self, "tpm", None) is None or self.tpm.capacity != tpm:
+                self.tpm = TokenBucket(tpm)
+            self.min_concurrency = max(1, min_concurrency)
+            self.max_concurrency = max(self.min_concurrency, max_concurrency)
+            current = getattr(self, "limit", float(initial_concurrency))
+            self.limit = float(min(self.max_concurrency, max(self.min_concurrency, current)))
+            self.latency_target = latency_target
+            self.plan_reserve = plan_reserve
+            self.max_retries = max_retries
+            self.adjust_interval = adjust_interval
+            self._cond.notify_all()
+
+    # -----------------------
+    # ADMISSION
+    # -----------------------
+    def acquire(self, priority: int, tokens: int, timeout: Optional[float] = None, prompt_tokens: int = 0) -> Permit:
+        started = time.monotonic()
+        expires_at = started + timeout if timeout is not None else None
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._admission_wait(ticket, tokens, now)
+                    if wait <= 0:
+                        break
+                    if expires_at is not None:
+                        if now >= expires_at:
+                            self._counters["wait_timeouts"] += 1
+                            raise LimiterTimeout(f"OpenAI limiter: no capacity within {timeout:.1f}s")
+                        wait = min(wait, expires_at - now)
+                    self._cond.wait(None if math.isinf(wait) else wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            self.rpm.take(1, now)
+            self.tpm.take(tokens, now)
+            self._in_flight += 1
+            waited = now - started
+            self._counters["acquired"] += 1
+            if waited > 0.001:
+                self._counters["waited"] += 1
+                self._wait_seconds += waited
+        return Permit(self, priority, tokens, waited, prompt_tokens)
+
+    def _admission_wait(self, ticket: Tuple[int, int], tokens: int, now: float) -> float:
+        # Seconds until this ticket may start (inf: until another call finishes); 0 = admit.
+        if self._waiting[0] != ticket:
+            return math.inf
+        if now < self._cooldown_until:
+            return self._cooldown_until - now
+        slots = max(1, int(self.limit))
+        if ticket[0] != PLAN:
+            slots = max(1, slots - self.plan_reserve)
+        if self._in_flight >= slots:
+            return math.inf
+        return max(self.rpm.wait_time(1, now), self.tpm.wait_time(tokens, now))
+
+    # -----------------------
+    # FEEDBACK
+    # -----------------------
+    def release(self, permit: Permit, throttled: bool = False, error: Optional[BaseException] = None,
+                retry_after_seconds: Optional[float] = None):
+        if permit._released:
+            return
+        permit._released = True
+        with self._cond:
+            now = time.monotonic()
+            self._in_flight -= 1
+            if throttled:
+                # A rejected call used no completion tokens; the request itself still counts.
+                self.tpm.give_back(permit.reserved_tokens, now)
+                self._counters["throttled"] += 1
+                self._consecutive_throttles += 1
+                backoff = retry_after_seconds if retry_after_seconds is not None else \
+                    random.uniform(0.5, 1.0) * min(30.0, 2 ** self._consecutive_throttles)
+                self._cooldown_until = max(self._cooldown_until, now + backoff)
+                self._decrease(0.5, now)
+            elif error is not None:
+                kind = failure_kind(error)
+                self._counters["failed"] += 1
+                if permit.used_tokens is not None:
+                    self.tpm.give_back(permit.reserved_tokens - permit.used_tokens, now)
+                elif kind == "timeout" or kind == "server":
+                    self.tpm.give_back(permit.reserved_tokens - permit.prompt_tokens, now)
+                else:
+                    self.tpm.give_back(permit.reserved_tokens, now)
+                if kind == "timeout":
+                    self._counters["timeouts"] += 1
+                    self._decrease(0.5, now)
+                elif kind == "server":
+                    self._decrease(0.9, now)
+            else:
+                self._consecutive_throttles = 0
+                if permit.used_tokens is not None:
+                    self.tpm.give_back(permit.reserved_tokens - permit.used_tokens, now)
+                if permit.latency() > self.latency_target:
+                    self._decrease(0.9, now)
+                elif self.limit < self.max_concurrency:
+                    self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+                    self._counters["limit_increases"] += 1
+            self._cond.notify_all()
+
+    def _decrease(self, factor: float, now: float):
+        # Calls that were already in flight report the same overload; act on it once.
+        if now - self._last_decrease < self.adjust_interval:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_concurrency), self.limit * factor)
+        self._counters["limit_decreases"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            self.rpm._refill(now)
+            self.tpm._refill(now)
+            stats: Dict[str, Any] = dict(self._counters)
+            for priority, name in PRIORITY_NAMES.items():
+                stats[f"queued_{name}"] = sum(1 for p, _ in self._waiting if p == priority)
+            stats.update(
+                in_flight=self._in_flight,
+                concurrency_limit=round(self.limit, 2),
+                rpm_available=round(self.rpm.level, 1),
+                tpm_available=round(self.tpm.level, 1),
+                cooling_down=1 if now < self._cooldown_until else 0,
+                wait_seconds_total=round(self._wait_seconds, 3),
+            )
+            return stats
+
+# -----------------------
+# MODULE-LEVEL LIMITER
+# -----------------------
+_limiter = AdaptiveLimiter()
+
+def configure(rpm: float = 500, tpm: float = 30000, min_concurrency: int = 1, max_concurrency: int = 16,
+              initial_concurrency: int = 4, latency_target: float = 10.0, plan_reserve: int = 1,
+              max_retries: int = 2, adjust_interval: float = 5.0):
+    # Safe to call on every Streamlit rerun.
+    _limiter.configure(rpm, tpm, min_concurrency, max_concurrency, initial_concurrency, latency_target,
+                       plan_reserve, max_retries, adjust_interval)
+
+def get_limiter() -> AdaptiveLimiter:
+    return _limiter
+
+def stats() -> Dict[str, Any]:
+    return _limiter.stats()
+
+def call(priority: int, messages: Sequence[Dict[str, str]], max_tokens: int, request: Callable[[Permit], Any],
+         timeout: Optional[float] = None) -> Any:
+    """Run request(permit) once the limiter admits it, retrying after 429s and transient errors.
+
+    The OpenAI client is built with max_retries=0 (see clients.py), so every HTTP attempt
+    goes through the buckets, the cooldown and the concurrency limit here.
+
+    `request` makes the OpenAI call and should call permit.first_token() when a stream starts
+    and permit.record_usage(usage) with the reported usage (or permit.record_partial() for a
+    stream closed before its usage chunk). `timeout` caps the total time
+    spent queued (LimiterTimeout); the call itself is bounded by the client's own timeout.
+    """
+    prompt_tokens = estimate_prompt_tokens(messages)
+    tokens = prompt_tokens + max_tokens
+    expires_at = time.monotonic() + timeout if timeout is not None else None
+    attempt = 0
+    while True:
+        remaining = None if expires_at is None else max(0.0, expires_at - time.monotonic())
+        permit = _limiter.acquire(priority, tokens, remaining, prompt_tokens)
+        current = instrumentation.current_span()
+        if current is not None:
+            current.set(queue_wait_ms=round(current.attributes.get("queue_wait_ms", 0) + permit.waited * 1000, 1))
+        try:
+            result = request(permit)
+        except Exception as e:
+            if is_rate_limit(e):
+                _limiter.release(permit, throttled=True, retry_after_seconds=retry_after(e))
+                backoff = 0.0
+            else:
+                _limiter.release(permit, error=e)
+                # Connection errors and 5xx are retried only before any output was streamed;
+                # timeouts never are, since the caller's deadline has been spent.
+                if failure_kind(e) not in ("connection", "server") or permit._first_token is not None:
+                    raise
+                backoff = random.uniform(0.5, 1.0) * min(8.0, 2 ** attempt)
+            if attempt >= _limiter.max_retries:
+                raise
+            if expires_at is not None:
+                if time.monotonic() + backoff >= expires_at:
+                    raise
+            attempt += 1
+            with _limiter._cond:
+                _limiter._counters["retried"] += 1
+            if current is not None:
+                current.set(retries=attempt)
+            time.sleep(backoff)
+            continue
+        _limiter.release(permit)
+        return result
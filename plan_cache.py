@@ -0,0 +1,132 @@
+import copy
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from caching import TTLCache
+
+# Words that don't change what a learner is asking for ("Data Science basics" == "data science").
+GOAL_FILLER_WORDS = {
+    "a", "an", "the", "to", "of", "for", "in", "and", "with", "on",
+    "learn", "how", "basic", "basics", "intro", "introduction", "introductory",
+    "fundamental", "fundamentals", "beginner", "beginners", "course", "guide", "101", "getting", "started",
+}
+
+def normalize_goal(goal: str) -> str:
+    tokens = re.findall(r"[a-z0-9+#]+", goal.lower())
+    meaningful = [t for t in tokens if t not in GOAL_FILLER_WORDS] or tokens
+    return " ".join(sorted(set(meaningful)))
+
+def version_tokens(normalized_goal: str) -> Set[str]:
+    # Tokens carrying a number ("3", "python3", "es6", "c++11"): goals that differ in one are
+    # different subjects ("Python 2" vs "Python 3", "Algebra 1" vs "Algebra 2").
+    return {t for t in normalized_goal.split() if any(c.isdigit() for c in t)}
+
+def request_params_key(background_level: str, weekly_time: int, timeline: str, resource_types: List[str]) -> str:
+    types = ",".join(sorted(r.strip().lower() for r in resource_types))
+    return f"{background_level.strip().lower()}|{int(weekly_time)}|{timeline.strip().lower()}|{types}"
+
+def plan_cache_key(goal: str, background_level: str, weekly_time: int, timeline: str, resource_types: List[str]) -> str:
+    return f"{normalize_goal(goal)}|{request_params_key(background_level, weekly_time, timeline, resource_types)}"
+
+# -----------------------
+# FULLY ENRICHED PLAN CACHE
+# -----------------------
+class PlanCache:
+    """Caches finished plans by normalized request; every read returns a private deep copy.
+
+    Exact hits match on the normalized goal plus the other request fields. Failing that, a
+    near-duplicate goal with identical other fields and the same numeric/version tokens is
+    accepted when the Jaccard similarity of the goal words is at least `similarity_threshold`
+    (0 disables the fuzzy lookup). Goals stored on disk, including by other processes, are
+    indexed too; the index is reloaded from the disk tier at most every `index_refresh` seconds.
+    """
+
+    def __init__(self, max_size: int = 500, ttl: float = 7 * 24 * 3600.0, path: Optional[str] = None,
+                 max_disk_entries: Optional[int] = None, similarity_threshold: float = 0.9,
+                 index_refresh: float = 60.0):
+        self.cache = TTLCache(max_size=max_size, ttl=ttl, path=path, max_disk_entries=max_disk_entries, table="plans")
+        self.similarity_threshold = similarity_threshold
+        self.index_refresh = index_refresh
+        self._goals_by_params: Dict[str, Set[str]] = {}
+        self._indexed_at = 0.0
+        self._lock = threading.Lock()
+        self.similar_hits = 0
+        if similarity_threshold:
+            self._refresh_index()
+
+    def get(self, goal: str, background_level: str, weekly_time: int, timeline: str,
+            resource_types: List[str]) -> Optional[Dict[str, Any]]:
+        params = request_params_key(background_level, weekly_time, timeline, resource_types)
+        normalized = normalize_goal(goal)
+        plan = self.cache.get(f"{normalized}|{params}")
+        if plan is not None:
+            return copy.deepcopy(plan)
+        similar_goal = self._find_similar_goal(normalized, params)
+        if similar_goal is None:
+            return None
+        plan = self.cache.get(f"{similar_goal}|{params}")
+        if plan is None:
+            return None
+        with self._lock:
+            self.similar_hits += 1
+        plan = copy.deepcopy(plan)
+        plan["goal"] = goal
+        return plan
+
+    def put(self, goal: str, background_level: str, weekly_time: int, timeline: str,
+            resource_types: List[str], plan: Dict[str, Any]):
+        params = request_params_key(background_level, weekly_time, timeline, resource_types)
+        normalized = normalize_goal(goal)
+        self.cache.set(f"{normalized}|{params}", copy.deepcopy(plan))
+        with self._lock:
+            self._goals_by_params.setdefault(params, set()).add(normalized)
+
+    def invalidate_key(self, key: str):
+        self.cache.delete(key)
+        goal, _, params = key.partition("|")
+        with self._lock:
+            self._goals_by_params.get(params, set()).discard(goal)
+
+    def invalidate(self, goal: str, background_level: str, weekly_time: int, timeline: str, resource_types: List[str]):
+        self.invalidate_key(plan_cache_key(goal, background_level, weekly_time, timeline, resource_types))
+
+    def clear(self):
+        self.cache.clear()
+        with self._lock:
+            self._goals_by_params.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.cache.stats()
+        stats["similar_hits"] = self.similar_hits
+        return stats
+
+    def _refresh_index(self):
+        goals_by_params: Dict[str, Set[str]] = {}
+        for key in self.cache.keys():
+            goal, _, params = key.partition("|")
+            goals_by_params.setdefault(params, set()).add(goal)
+        with self._lock:
+            for params, goals in goals_by_params.items():
+                self._goals_by_params.setdefault(params, set()).update(goals)
+            self._indexed_at = time.monotonic()
+
+    def _find_similar_goal(self, normalized: str, params: str) -> Optional[str]:
+        if not self.similarity_threshold:
+            return None
+        if time.monotonic() - self._indexed_at > self.index_refresh:
+            self._refresh_index()
+        with self._lock:
+            candidates = list(self._goals_by_params.get(params, ()))
+        best_goal, best_score = None, self.similarity_threshold
+        tokens = set(normalized.split())
+        versions = version_tokens(normalized)
+        for candidate in candidates:
+            candidate_tokens = set(candidate.split())
+            if not tokens or version_tokens(candidate) != versions:
+                continue
+            score = len(tokens & candidate_tokens) / len(tokens | candidate_tokens)
+            if score >= best_score:
+                best_goal, best_score = candidate, score
+        return best_goal
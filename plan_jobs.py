@@ -0,0 +1,348 @@
+import datetime
+import hashlib
+import logging
+import os
+import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import plan_storage
+from plan_pipeline import PlanPipeline
+from plan_schema import expected_week_count
+
+# -----------------------
+# BACKGROUND PLAN GENERATION JOBS
+# -----------------------
+# plan_jobs/<job_id>   {user, cache_key, params, status, open, progress, result, error,
+#                       warnings, plan_id, worker, created_at, updated_at}
+#
+# A job runs on a bounded, process-wide worker pool instead of the Streamlit script thread,
+# so reruns, closed tabs and script timeouts don't throw the work away. The job document
+# is the durable record: the app polls it, and once the status is "done" attach() moves
+# the result into the user's learning_plans in one transaction. Jobs for the same request
+# (same plan_cache_key) share one in-flight generation. Records still "open" are picked up
+# again on the user's next login. Every process refreshes updated_at on its queued and
+# running records every `heartbeat_seconds`; records whose worker stopped doing so for
+# `stale_seconds` (e.g. the process restarted) are resubmitted when polled. submit() never
+# overwrites a record that is finished but not yet attached, or still active elsewhere.
+
+logger = logging.getLogger("yello.plan_jobs")
+
+JOBS_COLLECTION = "plan_jobs"
+QUEUED, RUNNING, DONE, FAILED, ATTACHED = "queued", "running", "done", "failed", "attached"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+MAX_WARNINGS = 20
+
+class QueueFull(Exception):
+    pass
+
+def job_id_for(user: str, cache_key: str) -> str:
+    # One record per user and request, so a double click or a second tab reuses it.
+    return hashlib.sha1(f"{user}\n{cache_key}".encode("utf-8")).hexdigest()[:20]
+
+def _now() -> str:
+    return datetime.datetime.utcnow().isoformat()
+
+def _age_seconds(timestamp: Optional[str]) -> float:
+    try:
+        return (datetime.datetime.utcnow() - datetime.datetime.fromisoformat(timestamp)).total_seconds()
+    except (TypeError, ValueError):
+        return float("inf")
+
+class _Generation:
+    # One in-flight pipeline run and the job records waiting on it.
+    def __init__(self, cache_key: str, params: Dict[str, Any]):
+        self.cache_key = cache_key
+        self.params = params
+        self.job_ids: List[str] = []
+        self.status = QUEUED
+        self.progress: Dict[str, Any] = {
+            "weeks_done": 0,
+            "weeks_expected": expected_week_count(params.get("timeline", "")),
+            "preview": [],
+        }
+        self.result: Optional[Dict[str, Any]] = None
+        # Enriched weeks so far, for local pollers to render; only the preview is written out.
+        self.weeks: List[Dict[str, Any]] = []
+        self.error: Optional[str] = None
+        self.warnings: List[str] = []
+        # Serializes this generation's record writes, so a late joiner never overwrites "done".
+        self.write_lock = threading.Lock()
+
+    def fields(self) -> Dict[str, Any]:
+        fields = {
+            "status": self.status,
+            "open": self.status != FAILED,
+            "progress": dict(self.progress, preview=list(self.progress["preview"])),
+            "warnings": list(self.warnings),
+            "updated_at": _now(),
+        }
+        if self.result is not None:
+            fields["result"] = self.result
+        if self.error is not None:
+            fields["error"] = self.error
+        return fields
+
+class PlanJobQueue:
+    """Process-wide pool of plan generations with durable Firestore job records.
+
+    At most `workers` generations run at once and `max_queued` more may wait; submit()
+    raises QueueFull beyond that. `heartbeat_seconds` must be well below `stale_seconds`. Submissions that join an in-flight generation for the
+    same request don't count against the limit. `pipeline_factory(on_error)` builds the
+    PlanPipeline for one run; it must not depend on a Streamlit script context.
+    """
+
+    def __init__(self, db, pipeline_factory: Callable[[Callable[[str], None]], PlanPipeline],
+                 workers: int = 2, max_queued: int = 8, stale_seconds: float = 300.0, compress: bool = True,
+                 heartbeat_seconds: float = 60.0):
+        self.db = db
+        self.pipeline_factory = pipeline_factory
+        self.workers = workers
+        self.capacity = workers + max_queued
+        self.stale_seconds = stale_seconds
+        self.compress = compress
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan-job")
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Generation] = {}
+        self._jobs: Dict[str, _Generation] = {}
+        self._traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._counters = {"submitted": 0, "deduplicated": 0, "rejected": 0, "resumed": 0,
+                          "completed": 0, "failed": 0, "kept_existing": 0}
+        self.heartbeat_seconds = heartbeat_seconds
+        self._stopped = threading.Event()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="plan-job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def job_ref(self, job_id: str):
+        return self.db.collection(JOBS_COLLECTION).document(job_id)
+
+    # -----------------------
+    # SUBMISSION
+    # -----------------------
+    def submit(self, user: str, params: Dict[str, Any], cache_key: str) -> str:
+        # params are PlanPipeline.generate() keyword arguments; returns the job id to poll.
+        job_id = job_id_for(user, cache_key)
+        with self._lock:
+            generation = self._inflight.get(cache_key)
+            if generation is not None and job_id in generation.job_ids:
+                return job_id
+            start = generation is None
+            if start:
+                if len(self._inflight) >= self.capacity:
+                    self._counters["rejected"] += 1
+                    raise QueueFull(f"{self.capacity} plan generations are already running or queued")
+                generation = self._inflight[cache_key] = _Generation(cache_key, params)
+            generation.job_ids.append(job_id)
+            self._jobs[job_id] = generation
+        with generation.write_lock:
+            record = {"user": user, "cache_key": cache_key, "params": params, "plan_id": None,
+                      "worker": self.worker_id, "created_at": _now()}
+            record.update(generation.fields())
+            claimed = self._claim(job_id, record)
+        with self._lock:
+            if not claimed:
+                # The record is finished but not attached yet, or another worker is on it: poll that.
+                generation.job_ids.remove(job_id)
+                self._jobs.pop(job_id, None)
+                if start:
+                    self._inflight.pop(cache_key, None)
+                self._counters["kept_existing"] += 1
+                return job_id
+            if not start:
+                self._counters["deduplicated"] += 1
+            self._counters["submitted"] += 1
+        if start:
+            self._executor.submit(self._run, generation)
+        return job_id
+
+    def _claim(self, job_id: str, record: Dict[str, Any]) -> bool:
+        # Writes a new job record unless the existing one must be kept; one transaction, so two
+        # processes submitting the same request don't both start it.
+        from firebase_admin import firestore
+        job_ref = self.job_ref(job_id)
+
+        @firestore.transactional
+        def run(transaction) -> bool:
+            existing = job_ref.get(transaction=transaction).to_dict() or {}
+            status = existing.get("status")
+            if status == DONE or (status in ACTIVE_STATUSES and not self._is_stale(existing)):
+                return False
+            transaction.set(job_ref, record)
+            return True
+
+        return run(self.db.transaction())
+
+    def _is_stale(self, record: Dict[str, Any]) -> bool:
+        return _age_seconds(record.get("updated_at")) > self.stale_seconds
+
+    # -----------------------
+    # WORKER
+    # -----------------------
+    def _run(self, generation: _Generation):
+        def on_error(message: str):
+            if len(generation.warnings) < MAX_WARNINGS:
+                generation.warnings.append(message)
+
+        def on_week(week: Dict[str, Any]):
+            generation.progress["weeks_done"] += 1
+            generation.weeks.append(week)
+            generation.progress["preview"].append(
+                {"week_number": week.get("week_number"), "objective": week.get("objective", "")})
+            self._write(generation)
+
+        generation.status = RUNNING
+        self._write(generation)
+        pipeline = None
+        try:
+            pipeline = self.pipeline_factory(on_error)
+            plan = pipeline.generate(on_week=on_week, **generation.params)
+        except Exception as e:
+            logger.exception("plan job %s failed", generation.cache_key)
+            plan, generation.error = {}, f"Plan generation failed: {e}"
+        if pipeline is not None and pipeline.last_trace is not None:
+            self._keep_trace(generation, pipeline.last_trace)
+
+        with generation.write_lock:
+            if plan.get("weeks"):
+                # Same zlib+json encoding as stored weeks; decoded once, by attach().
+                generation.result = plan_storage.encode_week(plan, self.compress)
+                generation.status = DONE
+            else:
+                generation.error = generation.error or (generation.warnings[-1] if generation.warnings
+                                                        else "Plan generation returned no weeks.")
+                generation.status = FAILED
+            with self._lock:
+                self._inflight.pop(generation.cache_key, None)
+                for job_id in generation.job_ids:
+                    self._jobs.pop(job_id, None)
+                self._counters["completed" if generation.status == DONE else "failed"] += 1
+            self._write_records(generation)
+
+    def _write(self, generation: _Generation):
+        with generation.write_lock:
+            self._write_records(generation)
+
+    def _heartbeat_loop(self):
+        # Refreshes updated_at on every queued or running record, so waiting in this process's
+        # queue never looks like a dead worker to another process.
+        while not self._stopped.wait(self.heartbeat_seconds):
+            with self._lock:
+                generations = list(self._inflight.values())
+            for generation in generations:
+                with generation.write_lock:
+                    # Once done, the record may already be attached; it must not be rewritten.
+                    if generation.status in ACTIVE_STATUSES:
+                        self._write_records(generation)
+
+    def close(self):
+        self._stopped.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _write_records(self, generation: _Generation):
+        # Caller holds generation.write_lock. A failed progress write is retried by the next one.
+        fields = generation.fields()
+        try:
+            batch = self.db.batch()
+            for job_id in list(generation.job_ids):
+                batch.set(self.job_ref(job_id), fields, merge=True)
+            batch.commit()
+        except Exception as e:
+            logger.warning("could not update plan job records for %s: %s", generation.cache_key, e)
+
+    def _keep_trace(self, generation: _Generation, trace: Dict[str, Any]):
+        with self._lock:
+            for job_id in generation.job_ids:
+                self._traces[job_id] = trace
+                self._traces.move_to_end(job_id)
+            while len(self._traces) > 100:
+                self._traces.popitem(last=False)
+
+    # -----------------------
+    # POLLING AND ATTACHING
+    # -----------------------
+    def poll(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # The job's current record. Jobs running in this process are answered from memory;
+        # others are read from Firestore, and resubmitted if their worker has gone quiet.
+        record = self._local_record(job_id)
+        if record is not None:
+            return record
+        snapshot = self.job_ref(job_id).get()
+        if not snapshot.exists:
+            return None
+        record = snapshot.to_dict() or {}
+        if record.get("status") in ACTIVE_STATUSES and self._is_stale(record):
+            try:
+                self.submit(record["user"], record["params"], record["cache_key"])
+            except QueueFull:
+                return record
+            local = self._local_record(job_id)
+            if local is not None:
+                with self._lock:
+                    self._counters["resumed"] += 1
+            return local or record
+        return record
+
+    def _local_record(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            generation = self._jobs.get(job_id)
+        if generation is None:
+            return None
+        fields = generation.fields()
+        fields.pop("result", None)
+        fields.update(params=dict(generation.params), weeks=list(generation.weeks))
+        return fields
+
+    def attach(self, job_id: str, plans_ref, fields: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Optional[str]:
+        """Move a finished job's plan into plans_ref (the user's learning_plans); returns the plan id.
+
+        Runs in one transaction, so two tabs polling the same job attach it once; the loser
+        gets the winner's plan id. Returns None while the job isn't done. `fields(plan)` gives
+        the plan document's extra fields (title, updated_at, ...); cache_key comes from the job.
+        """
+        import admin_stats
+        from firebase_admin import firestore
+        job_ref = self.job_ref(job_id)
+        attached: Dict[str, Any] = {}
+
+        @firestore.transactional
+        def run(transaction) -> Optional[str]:
+            record = job_ref.get(transaction=transaction).to_dict() or {}
+            if record.get("status") != DONE:
+                return record.get("plan_id")
+            plan = plan_storage.decode_week(record["result"])
+            plan_ref = plans_ref.document()
+            plan_doc, week_docs = plan_storage.plan_documents(plan_ref, plan, dict(fields(plan), cache_key=record.get("cache_key")),
+                                                              compress=self.compress)
+            admin_stats.create_plan(self.db, plan_ref, plan_doc, child_docs=week_docs, transaction=transaction)
+            transaction.update(job_ref, {"status": ATTACHED, "open": False, "plan_id": plan_ref.id,
+                                         "result": firestore.DELETE_FIELD, "updated_at": _now()})
+            attached.update(plan_ref=plan_ref, plan_doc=plan_doc, weeks=plan["weeks"])
+            return plan_ref.id
+
+        plan_id = run(self.db.transaction())
+        if attached:
+            plan_storage.StoredPlan(self.db, attached["plan_ref"], attached["plan_doc"]).prime(attached["weeks"])
+        return plan_id
+
+    def open_job(self, user: str) -> Optional[str]:
+        # The user's newest job that is still running or waiting to be attached, if any.
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        # Two equality filters, served by Firestore's single-field indexes (no composite index).
+        docs = (self.db.collection(JOBS_COLLECTION)
+                .where(filter=FieldFilter("user", "==", user)).where(filter=FieldFilter("open", "==", True))
+                .select(["updated_at"]).stream())
+        records = sorted(((doc.to_dict() or {}).get("updated_at") or "", doc.id) for doc in docs)
+        return records[-1][1] if records else None
+
+    def trace(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._traces.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = len(self._inflight)
+            return dict(self._counters, running=min(in_flight, self.workers),
+                        queued=max(0, in_flight - self.workers), capacity=self.capacity)
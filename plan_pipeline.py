@@ -0,0 +1,528 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import clients
+import http_client
+import instrumentation
+import link_validation
+import openai_limiter
+from caching import CoalescingCache, SingleFlight
+from plan_cache import PlanCache
+from plan_schema import (PLAN_RESPONSE_FORMAT, WEEKS_RESPONSE_FORMAT, continuation_prompt, expected_week_count,
+                         generation_stats, is_complete_week, missing_week_numbers, repair_plan)
+from plan_stream import PlanStreamParser, parse_json_object
+from task_graph import TaskGraph
+
+# -----------------------
+# PLAN GENERATION PIPELINE
+# -----------------------
+# Streamlit-free, so it can run from the app, a worker thread or a benchmark. Errors that
+# don't stop the plan are passed to on_error; the app shows them with st.error.
+#
+#   retrieval ─┐
+#              ├─> generation (streamed) ─> per week: video ─┐
+#   context  ──┘                                 fallback ──┼─> merge
+#                                                links    ──┘
+#
+# Weeks are enriched while later weeks are still streaming, so wall time is bounded by the
+# critical path: max(retrieval, context) + generation + the slowest stage of the last week.
+
+SERPAPI_URL = "https://serpapi.com/search"
+YOUTUBE_SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
+SYSTEM_PROMPT = "You create detailed, personalized learning plans with clear weekly outcomes, detailed overviews, and gamified insights."
+
+DEFAULT_STAGE_TIMEOUTS = {
+    "retrieval": 10.0,
+    "context": 15.0,
+    "generation": 180.0,
+    "video": 30.0,
+    "fallback": 30.0,
+    "links": 25.0,
+}
+
+def resource_type_key(resource_type: str) -> str:
+    # The form picks plural types ("Videos") and resources are typed singular ("video").
+    key = resource_type.strip().lower()
+    return key[:-1] if key.endswith("s") and not key.endswith("ss") else key
+
+def normalize_search_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def build_prompt(goal: str, background_level: str, weekly_time: int, timeline: str, resource_types: List[str],
+                 context_text: str, extra_context: str) -> str:
+    return f"""
+Return ONLY a valid JSON object (with no markdown formatting or extra text) that adheres exactly to the following schema.
+Ensure that all strings are properly escaped.
+Context: {context_text}
+Extra Context: {extra_context}
+User Resource Preference: {', '.join(resource_types)}
+
+You are an advanced learning coach. A user wants to learn about {goal}.
+They are a(n) {background_level} and can dedicate {weekly_time} hours per week, with a timeline of {timeline}.
+
+For each week, provide:
+- An objective.
+- A detailed_overview that explains the plan for the week.
+- Detailed outcomes describing what the user will achieve by the end of the week.
+- Gamified insights (for example, "better than 80% of your peers").
+
+Also, include relevant resources and action items that match the user's preferred resource types: {', '.join(resource_types)}.
+
+The JSON schema is:
+{{
+  "goal": string,
+  "timeline": string,
+  "background_level": string,
+  "weekly_time": number,
+  "weeks": [
+    {{
+      "week_number": number,
+      "objective": string,
+      "detailed_overview": string,
+      "outcomes": string,
+      "gamified_insights": string,
+      "resources": [
+        {{
+          "name": string,
+          "link": string,
+          "type": string
+        }}
+      ],
+      "action_items": [
+        {{
+          "description": string,
+          "due_by": string
+        }}
+      ]
+    }}
+  ]
+}}
+"""
+
+class PlanPipeline:
+    """Turns one plan request into a fully enriched plan.
+
+    Caches are shared across pipelines (pass the process-wide instances); the pipeline itself
+    is cheap and is created per request with that request's callbacks. `initializer` runs in
+    every worker thread (the app uses it to attach the Streamlit script context).
+    """
+
+    def __init__(self, serpapi_api_key: str, youtube_api_key: str, search_cache: CoalescingCache,
+                 plan_cache: Optional[PlanCache] = None, max_workers: int = 6,
+                 link_check_workers: int = 16, link_check_deadline: float = 20.0,
+                 max_tokens: int = 1700, max_continuations: int = 2,
+                 stage_timeouts: Optional[Dict[str, float]] = None,
+                 on_error: Optional[Callable[[str], None]] = None,
+                 initializer: Optional[Callable[[], None]] = None):
+        self.serpapi_api_key = serpapi_api_key
+        self.youtube_api_key = youtube_api_key
+        self.search_cache = search_cache
+        self.plan_cache = plan_cache
+        self.max_workers = max_workers
+        self.link_check_workers = link_check_workers
+        self.link_check_deadline = link_check_deadline
+        self.max_tokens = max_tokens
+        self.max_continuations = max_continuations
+        self.stage_timeouts = dict(DEFAULT_STAGE_TIMEOUTS, **(stage_timeouts or {}))
+        self.on_error = on_error or (lambda message: None)
+        self.initializer = initializer
+        self.cancelled = threading.Event()
+        self.last_trace: Optional[Dict[str, Any]] = None
+        self._videos = SingleFlight()
+        self._video_results: Dict[str, str] = {}
+
+    def stage_error(self, stage: str, error: BaseException):
+        self.on_error(f"{stage} step skipped: {error}")
+
+    # -----------------------
+    # EXTERNAL LOOKUPS
+    # -----------------------
+    def fetch_serpapi_results(self, query: str, num_results: int) -> Tuple[List[Dict[str, str]], bool]:
+        # Returns (results, complete); complete is False if link checks ran into their deadline,
+        # in which case unchecked links were dropped and the results shouldn't be cached.
+        params = {
+            "engine": "google",
+            "q": query,
+            "api_key": self.serpapi_api_key,
+            "num": num_results
+        }
+        with instrumentation.span("search", "serpapi", query=query) as call:
+            resp = http_client.get(SERPAPI_URL, params=params, timeout=10, deadline=20)
+            data = resp.json()
+            call.set(status=resp.status_code)
+            if "error" in data:
+                raise RuntimeError(data["error"])
+        results_list, complete = [], True
+        if "organic_results" in data:
+            items = [item for item in data["organic_results"][:num_results] if item.get("link")]
+            started = time.monotonic()
+            valid = link_validation.check_links(
+                [item["link"] for item in items],
+                max_workers=self.link_check_workers,
+                deadline=self.link_check_deadline
+            )
+            complete = time.monotonic() - started < self.link_check_deadline
+            for item, is_valid in zip(items, valid):
+                link_url = item["link"]
+                title = item.get("title", "Resource")
+                if is_valid:
+                    res_type = "video" if link_validation.is_youtube_link(link_url) else "article"
+                    results_list.append({
+                        "name": title[:70],
+                        "link": link_url,
+                        "type": res_type
+                    })
+        return results_list, complete
+
+    def serpapi_search(self, query: str, num_results: int = 3) -> List[Dict[str, str]]:
+        normalized_query = normalize_search_query(query)
+        try:
+            partial = []
+
+            def load() -> List[Dict[str, str]]:
+                results, complete = self.fetch_serpapi_results(normalized_query, num_results)
+                if not complete:
+                    partial.append(True)
+                return results
+
+            results_list = self.search_cache.get_or_load(
+                f"{num_results}:{normalized_query}",
+                load,
+                should_cache=lambda results: not partial
+            )
+            # Callers edit resources in place, so never hand out the cached dicts themselves.
+            return [dict(result) for result in results_list]
+        except Exception as e:
+            self.on_error(f"SerpAPI error: {e}")
+            return []
+
+    def retrieve_guidelines(self, goal: str, background_level: str) -> str:
+        retrieval_query = f"learning plan guidelines for {goal}, level: {background_level}"
+        with instrumentation.span("vector_search", clients.retrieval_backend()):
+            context_docs = clients.get_vectorstore().similarity_search(retrieval_query, k=3)
+        return "\n\n".join([doc.page_content if hasattr(doc, "page_content") else doc for doc in context_docs])
+
+    def retrieve_context_for_goal(self, goal: str) -> str:
+        results = self.serpapi_search(f"overview of {goal}", num_results=1)
+        if results:
+            return results[0].get("name", "")
+        return ""
+
+    def get_youtube_videos(self, query: str, max_results: int = 10) -> List[Dict[str, str]]:
+        params = {
+            "part": "snippet",
+            "q": query,
+            "type": "video",
+            "maxResults": max_results,
+            "key": self.youtube_api_key
+        }
+        try:
+            with instrumentation.span("video_search", "youtube") as call:
+                resp = http_client.get(YOUTUBE_SEARCH_URL, params=params, timeout=10, deadline=20)
+                data = resp.json()
+                call.set(status=resp.status_code, results=len(data.get("items", [])))
+            videos = []
+            for item in data.get("items", []):
+                title = item["snippet"]["title"]
+                video_id = item["id"]["videoId"]
+                video_link = f"https://www.youtube.com/watch?v={video_id}"
+                videos.append({"title": title, "link": video_link})
+            return videos
+        except Exception as e:
+            self.on_error(f"YouTube API error: {e}")
+            return []
+
+    def score_videos_with_gpt(self, videos: List[Dict[str, str]], topic: str) -> str:
+        video_list_str = "\n".join([f"{i+1}. {v['title']} - {v['link']}" for i, v in enumerate(videos)])
+        prompt = f"Return only the link of the most relevant video for the topic '{topic}' from the list:\n{video_list_str}"
+        try:
+            with instrumentation.span("video_scoring", "openai") as call:
+                messages = [
+                    {"role": "system", "content": "You are an expert at evaluating video relevance."},
+                    {"role": "user", "content": prompt}
+                ]
+
+                def request(permit: openai_limiter.Permit):
+                    response = clients.get_openai_client().chat.completions.create(
+                        model="gpt-4o",
+                        messages=messages,
+                        max_tokens=50,
+                        temperature=0.2,
+                    )
+                    permit.record_usage(getattr(response, "usage", None))
+                    return response
+
+                # Enrichment lane: never delays a plan call waiting for the same capacity.
+                response = openai_limiter.call(openai_limiter.ENRICHMENT, messages, 50, request,
+                                               timeout=self.stage_timeouts["video"])
+                call.record_tokens(getattr(response, "usage", None))
+            result = response.choices[0].message.content.strip()
+            url_match = re.search(r'(https?://[^\s]+)', result)
+            if url_match:
+                return url_match.group(1)
+        except Exception as e:
+            self.on_error(f"Error scoring videos with GPT: {e}")
+        return ""
+
+    def find_best_video(self, topic: str) -> str:
+        # Weeks sharing an objective share one search.
+        def search() -> str:
+            videos = self.get_youtube_videos(topic, max_results=10)
+            if videos:
+                return self.score_videos_with_gpt(videos, topic)
+            return ""
+        best_video = self._video_results.get(topic)
+        if best_video is None:
+            best_video = self._video_results[topic] = self._videos.do(topic, search)[0]
+        return best_video
+
+    def validate_resources(self, resources: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # One concurrent pass over the resources, including fallback lookups for broken links.
+        link_validation.validate_resources(
+            resources,
+            fallback_search=lambda resource: self.serpapi_search(f"{resource.get('name', '')} {resource.get('type', '')}", num_results=1),
+            max_workers=self.link_check_workers,
+            deadline=self.link_check_deadline,
+            initializer=self.initializer
+        )
+        return resources
+
+    def missing_type_resources(self, week: Dict[str, Any], goal: str, desired_types: List[str],
+                               existing_types: List[str]) -> List[Dict[str, str]]:
+        found = []
+        present = {resource_type_key(t) for t in existing_types}
+        for desired_type in desired_types:
+            if resource_type_key(desired_type) not in present:
+                query = f"{goal} {week.get('objective', '')} {desired_type}"
+                found.extend(self.serpapi_search(query, num_results=1))
+        return found
+
+    # -----------------------
+    # PER-WEEK ENRICHMENT
+    # -----------------------
+    def enrich_week(self, week: Dict[str, Any], goal: str, desired_types: List[str], executor) -> Dict[str, Any]:
+        # Best video, fallback searches for missing resource types and link checks of the
+        # model's own resources run side by side; merge appends the new resources.
+        topic = week.get("objective", "").strip()
+        model_resources = week.setdefault("resources", [])
+        existing_types = [res.get("type", "").lower() for res in model_resources]
+        if topic:
+            # The video stage runs alongside the fallback searches and supplies this week's video,
+            # so the fallback doesn't search for one too.
+            existing_types.append("video")
+
+        def merge(best_video: str, fallback: List[Dict[str, str]], _validated) -> Dict[str, Any]:
+            if best_video:
+                model_resources.append({
+                    "name": f"Best Video for {week.get('objective', '')}",
+                    "link": best_video,
+                    "type": "video"
+                })
+            model_resources.extend(fallback)
+            return week
+
+        timeouts = self.stage_timeouts
+        # Each week gets its own cancel event: a failed week must not stop the others or the
+        # generation stream, which watch self.cancelled (set only by an external cancel).
+        if self.cancelled.is_set():
+            return week
+        graph = TaskGraph(executor, cancelled=threading.Event(),
+                          on_error=lambda stage, e: self.stage_error(f"Week {week.get('week_number', '?')} {stage}", e))
+        graph.add("video", lambda: self.find_best_video(topic) if topic else "", timeout=timeouts["video"], default="")
+        graph.add("fallback", lambda: self.missing_type_resources(week, goal, desired_types, existing_types),
+                  timeout=timeouts["fallback"], default=[])
+        graph.add("links", lambda: self.validate_resources(list(model_resources)), timeout=timeouts["links"], default=None)
+        graph.add("merge", merge, deps=("video", "fallback", "links"))
+        try:
+            with instrumentation.span("week", week_number=week.get("week_number")):
+                return graph.run()["merge"]
+        except Exception as e:
+            self.on_error(f"Error enriching week {week.get('week_number', '?')}: {e}")
+            return week
+
+    # -----------------------
+    # FULL PIPELINE
+    # -----------------------
+    def generate(self, goal: str, background_level: str, weekly_time: int, timeline: str, resource_types: List[str],
+                 on_week: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        # Each week is enriched as soon as the model finishes writing it; with on_week set, it is
+        # passed to on_week (in week order, on the calling thread) while later weeks are still
+        # being generated. Returns {} if no usable plan could be produced. The request's span
+        # tree is left in last_trace.
+        with instrumentation.trace("plan_request", timeline=timeline) as root:
+            plan_dict = self._generate(goal, background_level, weekly_time, timeline, resource_types, on_week)
+            root.set(weeks=len(plan_dict.get("weeks", [])))
+            if not plan_dict:
+                root.outcome = "failed"
+        self.last_trace = root.to_dict()
+        return plan_dict
+
+    def _generate(self, goal: str, background_level: str, weekly_time: int, timeline: str, resource_types: List[str],
+                  on_week: Optional[Callable[[Dict[str, Any]], None]]) -> Dict[str, Any]:
+        if self.plan_cache is not None:
+            with instrumentation.span("plan_cache") as lookup:
+                cached_plan = self.plan_cache.get(goal, background_level, weekly_time, timeline, resource_types)
+                lookup.outcome = "hit" if cached_plan is not None else "miss"
+            if cached_plan is not None:
+                return cached_plan
+
+        desired_types = [r.lower() for r in resource_types]
+        stage_workers = 3 * self.max_workers + 2
+        # Not `with` blocks: their exit waits for every thread, including stages that already
+        # timed out, so end-to-end time would no longer be bounded by the stage timeouts.
+        stage_executor = ThreadPoolExecutor(max_workers=stage_workers, initializer=self.initializer)
+        week_executor = ThreadPoolExecutor(max_workers=self.max_workers, initializer=self.initializer)
+        try:
+            context = TaskGraph(stage_executor, on_error=self.stage_error)
+            context.add("retrieval", lambda: self.retrieve_guidelines(goal, background_level),
+                        timeout=self.stage_timeouts["retrieval"], default="")
+            context.add("context", lambda: self.retrieve_context_for_goal(goal),
+                        timeout=self.stage_timeouts["context"], default="")
+            context_results = context.run()
+            prompt = build_prompt(goal, background_level, weekly_time, timeline, resource_types,
+                                  context_results["retrieval"], context_results["context"])
+
+            plan_dict = self._generate_weeks(prompt, goal, background_level, weekly_time, timeline, resource_types,
+                                             lambda week: week_executor.submit(instrumentation.bind(self.enrich_week), week, goal,
+                                                                               desired_types, stage_executor),
+                                             on_week)
+        finally:
+            week_executor.shutdown(wait=False, cancel_futures=True)
+            stage_executor.shutdown(wait=False, cancel_futures=True)
+        if not plan_dict:
+            return {}
+        if self.plan_cache is not None and plan_dict.get("weeks"):
+            self.plan_cache.put(goal, background_level, weekly_time, timeline, resource_types, plan_dict)
+        return plan_dict
+
+    def _generate_weeks(self, prompt: str, goal: str, background_level: str, weekly_time: int, timeline: str,
+                        resource_types: List[str], submit_week: Callable[[Dict[str, Any]], Any],
+                        on_week: Optional[Callable[[Dict[str, Any]], None]]) -> Dict[str, Any]:
+        parser = PlanStreamParser()
+        weeks: List[Dict[str, Any]] = []
+        pending = []
+        wanted_numbers: Optional[List[int]] = None
+        continuation_calls = 0
+        deadline = time.monotonic() + self.stage_timeouts["generation"]
+
+        def accept_weeks(completed: List[Dict[str, Any]]):
+            # Called after every streamed chunk with the weeks that chunk completed.
+            for week in completed:
+                if not is_complete_week(week) or (wanted_numbers and week.get("week_number") not in wanted_numbers):
+                    continue
+                weeks.append(week)
+                pending.append(submit_week(week))
+            while on_week is not None and pending and pending[0].done():
+                on_week(pending.pop(0).result())
+
+        def stream_completion(stage: str, user_prompt: str, response_format: Dict[str, Any],
+                              stream_parser: PlanStreamParser) -> Optional[str]:
+            # Streams one structured completion through stream_parser; returns the finish reason.
+            # Running out of generation time is treated like truncation: finished weeks are kept.
+            with instrumentation.span(stage, "openai") as call:
+                messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user_prompt}]
+
+                def request(permit: openai_limiter.Permit) -> Optional[str]:
+                    stream = clients.get_openai_client().chat.completions.create(
+                        model="gpt-4o",
+                        messages=messages,
+                        max_tokens=self.max_tokens,
+                        temperature=0.2,
+                        response_format=response_format,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        timeout=max(1.0, deadline - time.monotonic())
+                    )
+                    finish_reason = None
+                    first_token = None
+                    streamed = len(stream_parser.text)
+                    try:
+                        for chunk in stream:
+                            if self.cancelled.is_set() or time.monotonic() > deadline:
+                                stream.close()
+                                permit.record_partial(len(stream_parser.text) - streamed)
+                                call.outcome = "timeout"
+                                self.on_error("Plan generation ran out of time; keeping the weeks finished so far.")
+                                return "length"
+                            # With include_usage, the last chunk carries the token counts and no choices.
+                            call.record_tokens(getattr(chunk, "usage", None))
+                            permit.record_usage(getattr(chunk, "usage", None))
+                            if not chunk.choices:
+                                continue
+                            choice = chunk.choices[0]
+                            finish_reason = choice.finish_reason or finish_reason
+                            if choice.delta.content:
+                                if first_token is None:
+                                    permit.first_token()
+                                    first_token = call.elapsed_ms()
+                                    call.set(first_token_ms=first_token)
+                                accept_weeks(stream_parser.feed(choice.delta.content))
+                    except Exception:
+                        # Failed mid-stream: the limiter only gets back what wasn't generated.
+                        if first_token is not None:
+                            permit.record_partial(len(stream_parser.text) - streamed)
+                        raise
+                    call.set(finish_reason=finish_reason, chars=len(stream_parser.text), weeks=len(stream_parser.weeks))
+                    return finish_reason
+
+                # Plan lane: queued ahead of enrichment calls; waiting counts against the deadline.
+                return openai_limiter.call(openai_limiter.PLAN, messages, self.max_tokens, request,
+                                           timeout=max(0.0, deadline - time.monotonic()))
+
+        try:
+            finish_reason = stream_completion("generation", prompt, PLAN_RESPONSE_FORMAT, parser)
+        except Exception as e:
+            generation_stats.record("failed")
+            self.on_error("Error calling OpenAI API: " + str(e))
+            return {}
+
+        # A complete, parseable response is used as-is; anything else keeps the weeks that
+        # finished streaming and asks the model for just the missing ones.
+        plan_dict = parse_json_object(parser.text.strip())
+        repaired = finish_reason == "length" or plan_dict is None
+        if repaired:
+            plan_dict = repair_plan(parser.text, weeks)
+            if plan_dict is None:
+                generation_stats.record("failed")
+                self.on_error("The generated plan was incomplete and could not be repaired. Please try again.")
+                return {}
+        if not weeks:
+            accept_weeks([w for w in plan_dict.get("weeks", []) if is_complete_week(w)])
+
+        expected_weeks = expected_week_count(timeline)
+        missing = missing_week_numbers(weeks, expected_weeks)
+        truncated = repaired and expected_weeks is None
+        while (missing or truncated) and continuation_calls < self.max_continuations \
+                and time.monotonic() < deadline and not self.cancelled.is_set():
+            wanted_numbers = missing or None
+            found = len(weeks)
+            continuation = continuation_prompt(goal, background_level, weekly_time, timeline, resource_types,
+                                               weeks, missing)
+            try:
+                finish_reason = stream_completion("continuation", continuation, WEEKS_RESPONSE_FORMAT, PlanStreamParser())
+            except Exception as e:
+                self.on_error("Could not complete the remaining weeks: " + str(e))
+                break
+            continuation_calls += 1
+            if len(weeks) == found:
+                break
+            missing = missing_week_numbers(weeks, expected_weeks)
+            truncated = finish_reason == "length" and expected_weeks is None
+
+        for future in pending:
+            week = future.result()
+            if on_week is not None:
+                on_week(week)
+
+        weeks.sort(key=lambda w: w.get("week_number") if isinstance(w.get("week_number"), int) else 0)
+        plan_dict["weeks"] = weeks
+        plan_dict.setdefault("goal", goal)
+        plan_dict.setdefault("timeline", timeline)
+        plan_dict.setdefault("background_level", background_level)
+        plan_dict.setdefault("weekly_time", weekly_time)
+        generation_stats.record("continued" if continuation_calls else "repaired" if repaired else "clean",
+                                continuation_calls)
+        return plan_dict
@@ -0,0 +1,192 @@
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from plan_stream import parse_json_object
+
+# -----------------------
+# STRUCTURED-OUTPUT SCHEMA
+# -----------------------
+# Passed to the Chat Completions API as response_format so the model can only emit a plan
+# of this shape. Strict mode requires every property to be listed and required, and keeps
+# properties in this order, so the header fields always stream before the weeks.
+
+RESOURCE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "link": {"type": "string"},
+        "type": {"type": "string"},
+    },
+    "required": ["name", "link", "type"],
+    "additionalProperties": False,
+}
+
+ACTION_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "description": {"type": "string"},
+        "due_by": {"type": "string"},
+    },
+    "required": ["description", "due_by"],
+    "additionalProperties": False,
+}
+
+WEEK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "week_number": {"type": "integer"},
+        "objective": {"type": "string"},
+        "detailed_overview": {"type": "string"},
+        "outcomes": {"type": "string"},
+        "gamified_insights": {"type": "string"},
+        "resources": {"type": "array", "items": RESOURCE_SCHEMA},
+        "action_items": {"type": "array", "items": ACTION_ITEM_SCHEMA},
+    },
+    "required": ["week_number", "objective", "detailed_overview", "outcomes", "gamified_insights",
+                 "resources", "action_items"],
+    "additionalProperties": False,
+}
+
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "goal": {"type": "string"},
+        "timeline": {"type": "string"},
+        "background_level": {"type": "string"},
+        "weekly_time": {"type": "number"},
+        "weeks": {"type": "array", "items": WEEK_SCHEMA},
+    },
+    "required": ["goal", "timeline", "background_level", "weekly_time", "weeks"],
+    "additionalProperties": False,
+}
+
+# Continuation calls only return the weeks that are still missing.
+WEEKS_SCHEMA = {
+    "type": "object",
+    "properties": {"weeks": {"type": "array", "items": WEEK_SCHEMA}},
+    "required": ["weeks"],
+    "additionalProperties": False,
+}
+
+def response_format(schema: Dict[str, Any], name: str) -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+PLAN_RESPONSE_FORMAT = response_format(PLAN_SCHEMA, "learning_plan")
+WEEKS_RESPONSE_FORMAT = response_format(WEEKS_SCHEMA, "learning_plan_weeks")
+
+# -----------------------
+# LOCAL REPAIR OF TRUNCATED OUTPUT
+# -----------------------
+_CLOSERS = {"{": "}", "[": "]"}
+
+def close_truncated_json(text: str, max_attempts: int = 64) -> Optional[Dict[str, Any]]:
+    # Cuts the text back to the last point where a value closed and appends the missing
+    # closing brackets. Returns the outermost object, or None if nothing usable remains.
+    stack: List[str] = []
+    cut_points = []
+    in_string = escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                break
+            cut_points.append((i + 1, "".join(_CLOSERS[c] for c in reversed(stack))))
+    for end, closers in reversed(cut_points[-max_attempts:]):
+        value = parse_json_object(text[:end].rstrip().rstrip(",") + closers)
+        if value is not None:
+            return value
+    return None
+
+def is_complete_week(week: Any) -> bool:
+    return isinstance(week, dict) and all(key in week for key in WEEK_SCHEMA["required"])
+
+def repair_plan(text: str, completed_weeks: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    # completed_weeks are the weeks the stream parser saw close; any partially written
+    # week at the end of a truncated response is dropped rather than guessed at.
+    plan = close_truncated_json(text) or {}
+    weeks = [week for week in completed_weeks if is_complete_week(week)]
+    if not weeks:
+        return None
+    plan["weeks"] = weeks
+    return plan
+
+def expected_week_count(timeline: str) -> Optional[int]:
+    # "12 weeks" -> 12; self-paced timelines have no fixed length.
+    match = re.match(r"\s*(\d+)\s*week", timeline or "", re.IGNORECASE)
+    return int(match.group(1)) if match else None
+
+def missing_week_numbers(weeks: List[Dict[str, Any]], expected: Optional[int]) -> List[int]:
+    if not expected:
+        return []
+    present = {week.get("week_number") for week in weeks}
+    return [n for n in range(1, expected + 1) if n not in present]
+
+def continuation_prompt(goal: str, background_level: str, weekly_time: int, timeline: str,
+                        resource_types: List[str], weeks: List[Dict[str, Any]],
+                        missing: Optional[List[int]]) -> str:
+    covered = "\n".join(f"- Week {w.get('week_number')}: {w.get('objective', '')}" for w in weeks)
+    if missing:
+        wanted = "weeks " + ", ".join(str(n) for n in missing)
+    else:
+        wanted = f"the remaining weeks, starting at week {len(weeks) + 1}"
+    return f"""
+You are continuing a learning plan that was cut off. A user wants to learn about {goal}.
+They are a(n) {background_level} and can dedicate {weekly_time} hours per week, with a timeline of {timeline}.
+Preferred resource types: {', '.join(resource_types)}.
+
+Weeks already written:
+{covered}
+
+Write ONLY {wanted}, continuing naturally from the weeks above without repeating them.
+Each week needs an objective, a detailed_overview, outcomes, gamified_insights, resources and action_items.
+"""
+
+# -----------------------
+# GENERATION OUTCOME METRICS
+# -----------------------
+class GenerationStats:
+    """Process-wide counters for how plan generations ended.
+
+    A generation is "clean" when the first response parsed as-is, "repaired" when a truncated
+    or malformed response was salvaged locally, "continued" when missing weeks were fetched
+    with a follow-up call, and "failed" when nothing usable came back and the user has to
+    regenerate the whole plan.
+    """
+
+    OUTCOMES = ("clean", "repaired", "continued", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {outcome: 0 for outcome in self.OUTCOMES}
+        self._continuation_calls = 0
+
+    def record(self, outcome: str, continuation_calls: int = 0):
+        with self._lock:
+            self._counts[outcome] += 1
+            self._continuation_calls += continuation_calls
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self._counts.values())
+            return dict(
+                self._counts,
+                generations=total,
+                continuation_calls=self._continuation_calls,
+                full_regeneration_rate=self._counts["failed"] / total if total else 0.0,
+            )
+
+generation_stats = GenerationStats()
@@ -0,0 +1,114 @@
+import json
+import zlib
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import instrumentation
+from caching import TTLCache
+
+# -----------------------
+# STRUCTURED PLAN STORAGE
+# -----------------------
+# Version 2 layout:
+#   users/<email>/learning_plans/<plan_id>              metadata only (goal, timeline, ..., week_count)
+#   users/<email>/learning_plans/<plan_id>/weeks/<nnn>  {"encoding": "zlib+json" | "json", "data": ...}
+#
+# Legacy (version 1) plans keep the whole plan as a JSON string in the "plan" field;
+# they are still readable and `python migrations.py plan-storage-v2` converts them.
+
+STORAGE_VERSION = 2
+WEEKS_COLLECTION = "weeks"
+META_FIELDS = ("goal", "timeline", "background_level", "weekly_time")
+
+# Parsed weeks are immutable and shared by every session in the process.
+_week_cache = TTLCache(max_size=2000, ttl=24 * 3600.0)
+
+def configure_week_cache(max_size: int):
+    _week_cache.max_size = max_size
+
+def week_cache_stats() -> Dict[str, Any]:
+    return _week_cache.stats()
+
+def freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def week_ref(plan_ref, index: int):
+    return plan_ref.collection(WEEKS_COLLECTION).document(f"{index:03d}")
+
+def week_refs(plan_ref, week_count: int) -> List[Any]:
+    return [week_ref(plan_ref, i) for i in range(week_count)]
+
+def encode_week(week: Dict[str, Any], compress: bool = True) -> Dict[str, Any]:
+    data = json.dumps(week, separators=(",", ":"))
+    if compress:
+        return {"encoding": "zlib+json", "data": zlib.compress(data.encode("utf-8"), 6)}
+    return {"encoding": "json", "data": data}
+
+def decode_week(doc: Dict[str, Any]) -> Dict[str, Any]:
+    if doc.get("encoding") == "zlib+json":
+        return json.loads(zlib.decompress(doc["data"]).decode("utf-8"))
+    return json.loads(doc.get("data") or "{}")
+
+def plan_documents(plan_ref, plan: Dict[str, Any], fields: Dict[str, Any],
+                   compress: bool = True) -> Tuple[Dict[str, Any], List[Tuple[Any, Dict[str, Any]]]]:
+    # Returns (parent document, [(week_ref, week document)]) for a freshly generated plan.
+    weeks = plan.get("weeks", [])
+    parent = {field: plan.get(field) for field in META_FIELDS}
+    parent.update(fields)
+    parent["week_count"] = len(weeks)
+    parent["storage_version"] = STORAGE_VERSION
+    return parent, [(week_ref(plan_ref, i), encode_week(week, compress)) for i, week in enumerate(weeks)]
+
+# -----------------------
+# LAZY READS
+# -----------------------
+class StoredPlan:
+    """A saved plan's metadata plus on-demand access to its weeks."""
+
+    def __init__(self, db, plan_ref, data: Dict[str, Any]):
+        self.db = db
+        self.plan_ref = plan_ref
+        self.updated_at = data.get("updated_at")
+        self._legacy_weeks: Optional[Tuple[Any, ...]] = None
+        if data.get("storage_version", 1) >= STORAGE_VERSION:
+            self.meta = {field: data.get(field) for field in META_FIELDS}
+            self.week_count = int(data.get("week_count") or 0)
+        else:
+            plan = json.loads(data.get("plan") or "{}")
+            self.meta = {field: plan.get(field) for field in META_FIELDS}
+            self._legacy_weeks = freeze(plan.get("weeks", []))
+            self.week_count = len(self._legacy_weeks)
+
+    def weeks(self, start: int = 0, stop: Optional[int] = None) -> List[Mapping[str, Any]]:
+        # Weeks not already in the shared cache are fetched together in one round trip.
+        stop = self.week_count if stop is None else min(stop, self.week_count)
+        if self._legacy_weeks is not None:
+            return list(self._legacy_weeks[start:stop])
+        keys = {i: f"{self.plan_ref.path}@{self.updated_at}#{i}" for i in range(start, stop)}
+        weeks = {i: _week_cache.get(key) for i, key in keys.items()}
+        missing = [i for i, week in weeks.items() if week is None]
+        if missing:
+            with instrumentation.span("plan_weeks", "firestore", weeks=len(missing)):
+                snapshots = list(self.db.get_all([week_ref(self.plan_ref, i) for i in missing]))
+            for snapshot in snapshots:
+                i = int(snapshot.id)
+                week = freeze(decode_week(snapshot.to_dict() or {})) if snapshot.exists else MappingProxyType({})
+                _week_cache.set(keys[i], week)
+                weeks[i] = week
+        return [weeks[i] for i in range(start, stop)]
+
+    def prime(self, weeks: List[Dict[str, Any]]):
+        # Seed the shared cache with weeks we already hold (e.g. right after saving the plan).
+        for i, week in enumerate(weeks):
+            _week_cache.set(f"{self.plan_ref.path}@{self.updated_at}#{i}", freeze(week))
+
+@instrumentation.timed("plan_load", "firestore")
+def load_plan(db, plan_ref) -> Optional[StoredPlan]:
+    snapshot = plan_ref.get()
+    if not snapshot.exists:
+        return None
+    return StoredPlan(db, plan_ref, snapshot.to_dict() or {})
@@ -0,0 +1,75 @@
+import json
+from typing import Any, Dict, List, Optional
+
+import json5
+
+# -----------------------
+# INCREMENTAL PLAN JSON PARSER
+# -----------------------
+class PlanStreamParser:
+    """Incrementally scans a streamed plan JSON document and yields each week object once it is complete.
+
+    Only the top-level "weeks" array is tracked; everything else is left for a full parse of
+    the finished text. Feed it raw text chunks as they arrive from the model.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.weeks: List[Dict[str, Any]] = []
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_key: Optional[str] = None
+        self._weeks_depth: Optional[int] = None
+        self._week_start = -1
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        # Returns the week objects completed by this chunk, in document order.
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._stack[0] == "{":
+                        self._last_key = text[self._string_start + 1:i]
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if (ch == "[" and self._weeks_depth is None and len(self._stack) == 1
+                        and self._last_key == "weeks"):
+                    self._weeks_depth = len(self._stack) + 1
+                if ch == "{" and self._weeks_depth is not None and len(self._stack) == self._weeks_depth:
+                    self._week_start = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._week_start >= 0 and len(self._stack) == self._weeks_depth:
+                    week = parse_json_object(text[self._week_start:i + 1])
+                    self._week_start = -1
+                    if week is not None:
+                        self.weeks.append(week)
+                        completed.append(week)
+        self._pos = len(text)
+        return completed
+
+def parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        value = json.loads(text)
+    except Exception:
+        try:
+            value = json5.loads(text)
+        except Exception:
+            return None
+    return value if isinstance(value, dict) else None
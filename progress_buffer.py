@@ -0,0 +1,120 @@
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+import instrumentation
+
+# Documents at this version hold progress as {week_key: {item_id: bool}} (see migrations.py).
+PROGRESS_SCHEMA_VERSION = 2
+
+_SIMPLE_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def field_path(*parts: str) -> str:
+    # Firestore field path; segments that aren't plain identifiers are backtick-quoted.
+    quoted = []
+    for part in parts:
+        if _SIMPLE_FIELD_NAME.match(part):
+            quoted.append(part)
+        else:
+            quoted.append("`" + part.replace("\\", "\\\\").replace("`", "\\`") + "`")
+    return ".".join(quoted)
+
+# -----------------------
+# WRITE-BEHIND CHECKLIST PROGRESS
+# -----------------------
+class ProgressBuffer:
+    """One session's view of a plan's checklist progress, written back lazily.
+
+    The progress map is read once when the plan is opened. Checkbox changes update it in
+    memory and are remembered as dirty items; a debounce timer writes them back in a single
+    Firestore update once clicks stop for `debounce_seconds`. Each write only sets the changed
+    booleans by field path (progress.<week_key>.<item_id>), so it needs no prior read and
+    cannot clobber items changed from another tab. Call flush() before anything
+    that must see the saved state (logout, switching plans).
+    """
+
+    def __init__(self, plan_ref, progress: Optional[Dict[str, Dict[str, bool]]] = None,
+                 debounce_seconds: float = 2.0):
+        self.plan_ref = plan_ref
+        self.plan_id = plan_ref.id
+        self.progress: Dict[str, Dict[str, bool]] = {
+            k: dict(v) for k, v in (progress or {}).items() if isinstance(v, dict)
+        }
+        self.debounce_seconds = debounce_seconds
+        self._dirty: Dict[Tuple[str, str], bool] = {}
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self.writes = 0
+
+    @classmethod
+    @instrumentation.timed("progress_load", "firestore")
+    def load(cls, plan_ref, debounce_seconds: float = 2.0) -> "ProgressBuffer":
+        plan_doc = plan_ref.get(field_paths=["progress"]).to_dict() or {}
+        return cls(plan_ref, plan_doc.get("progress") or {}, debounce_seconds)
+
+    def get(self, week_key: str, item_id: str) -> bool:
+        with self._lock:
+            return bool(self.progress.get(week_key, {}).get(item_id, False))
+
+    def set(self, week_key: str, item_id: str, value: bool):
+        value = bool(value)
+        with self._lock:
+            if self.get(week_key, item_id) == value:
+                return
+            self.progress.setdefault(week_key, {})[item_id] = value
+            self._dirty[(week_key, item_id)] = value
+            self._schedule_flush()
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._dirty)
+
+    def flush(self):
+        with self._lock:
+            self._cancel_timer()
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            try:
+                self._write(dirty)
+                self.writes += 1
+            except Exception:
+                # Keep the changes for the next attempt; newer clicks win over the failed batch.
+                dirty.update(self._dirty)
+                self._dirty = dirty
+                raise
+
+    def close(self):
+        self.flush()
+
+    def discard(self):
+        # Drop pending changes without writing them (e.g. the plan was deleted).
+        with self._lock:
+            self._cancel_timer()
+            self._dirty = {}
+
+    @instrumentation.timed("progress_write", "firestore")
+    def _write(self, dirty: Dict[Tuple[str, str], bool]):
+        self.plan_ref.update({
+            field_path("progress", week_key, item_id): value
+            for (week_key, item_id), value in dirty.items()
+        })
+
+    def _schedule_flush(self):
+        self._cancel_timer()
+        self._timer = threading.Timer(self.debounce_seconds, self._flush_quietly)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception:
+            # Retried on the next change or explicit flush.
+            pass
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -0,0 +1,112 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import instrumentation
+
+# -----------------------
+# DEPENDENCY GRAPH OF STAGES ON A THREAD POOL
+# -----------------------
+REQUIRED = object()
+# How often run() looks for queued stages that have started, so their timeouts are enforced.
+START_POLL_SECONDS = 0.05
+
+class StageTimeout(Exception):
+    pass
+
+class StageFailed(Exception):
+    def __init__(self, stage: str, cause: BaseException):
+        super().__init__(f"stage {stage!r} failed: {cause}")
+        self.stage = stage
+        self.cause = cause
+
+class TaskGraph:
+    """Runs named stages on an executor as soon as their dependencies have finished.
+
+    Each stage is called with its dependencies' results, in the order the dependencies were
+    listed, so wall time follows the critical path rather than the sum of the stages. A stage
+    that raises or overruns its timeout resolves to its default if it has one (and on_error
+    is told why); a stage without a default cancels the graph instead: stages not yet started
+    are dropped, `cancelled` is set so running stages can stop early, and run() raises
+    StageFailed. A stage's timeout counts from when it starts running, not from when it was
+    queued on the executor. Threads cannot be interrupted, so a timed-out stage keeps running
+    in the background and its late result is ignored.
+    """
+
+    def __init__(self, executor, cancelled: Optional[threading.Event] = None,
+                 on_error: Optional[Callable[[str, BaseException], None]] = None):
+        self.executor = executor
+        self.cancelled = cancelled or threading.Event()
+        self.on_error = on_error
+        self._stages: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...], Optional[float], Any]] = {}
+
+    def add(self, name: str, fn: Callable[..., Any], deps: Sequence[str] = (),
+            timeout: Optional[float] = None, default: Any = REQUIRED) -> "TaskGraph":
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"stage {name!r} depends on unknown stage {dep!r}")
+        self._stages[name] = (fn, tuple(deps), timeout, default)
+        return self
+
+    def run(self) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        waiting = dict(self._stages)
+        running: Dict[Any, Tuple[str, Optional[float]]] = {}
+        # Stage name -> monotonic start time, written by the worker thread as the stage begins.
+        started: Dict[str, float] = {}
+        try:
+            while waiting or running:
+                if self.cancelled.is_set():
+                    raise StageFailed(next(iter(running.values()))[0] if running else "graph",
+                                      RuntimeError("cancelled"))
+                for name, (fn, deps, timeout, _) in list(waiting.items()):
+                    if all(dep in results for dep in deps):
+                        del waiting[name]
+                        future = self.executor.submit(instrumentation.bind(self._run_stage), name, fn,
+                                                      [results[dep] for dep in deps], started)
+                        running[future] = (name, timeout)
+                deadlines, unstarted = [], False
+                for name, timeout in running.values():
+                    if timeout:
+                        if name in started:
+                            deadlines.append(started[name] + timeout)
+                        else:
+                            unstarted = True
+                wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                if unstarted:
+                    wait_for = START_POLL_SECONDS if wait_for is None else min(wait_for, START_POLL_SECONDS)
+                done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+                now = time.monotonic()
+                for future, (name, timeout) in list(running.items()):
+                    deadline = started[name] + timeout if timeout and name in started else None
+                    if future in done:
+                        del running[future]
+                        try:
+                            results[name] = future.result()
+                        except Exception as e:
+                            results[name] = self._fallback(name, e)
+                    elif deadline is not None and now >= deadline:
+                        del running[future]
+                        future.cancel()
+                        results[name] = self._fallback(name, StageTimeout(f"{name} timed out"))
+        except BaseException:
+            self.cancelled.set()
+            for future in running:
+                future.cancel()
+            raise
+        return results
+
+    @staticmethod
+    def _run_stage(name: str, fn: Callable[..., Any], args: Sequence[Any], started: Dict[str, float]) -> Any:
+        started[name] = time.monotonic()
+        with instrumentation.span(name):
+            return fn(*args)
+
+    def _fallback(self, name: str, error: BaseException) -> Any:
+        default = self._stages[name][3]
+        if default is REQUIRED:
+            raise StageFailed(name, error) from error
+        if self.on_error is not None:
+            self.on_error(name, error)
+        return default
@@ -1,14 +1,20 @@
 import streamlit as st
-import openai
-import json5
-import json
-import re
-import requests
 import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
-from typing import Dict, Any, List
-import os
+from typing import Dict, Any, List, Optional
+
+import admin_stats
+import caching
+import clients
+import http_client
+import instrumentation
+import link_validation
+import openai_limiter
+import plan_jobs
+import plan_storage
+from plan_cache import PlanCache, plan_cache_key
+from plan_pipeline import DEFAULT_STAGE_TIMEOUTS, PlanPipeline
+from plan_schema import generation_stats
+from progress_buffer import PROGRESS_SCHEMA_VERSION, ProgressBuffer
 
 
 # -----------------------
@@ -19,221 +25,133 @@ st.set_page_config(page_title="Yello - Personalised Learning Plan Generator", la
 def rerun():
     st.rerun()
 
-# Set Pinecone API key in environment.
-os.environ["PINECONE_API_KEY"] = st.secrets["pinecone"]["api_key"]
-
 # Load API keys from secrets.
-OPENAI_API_KEY = st.secrets["openai"]["api_key"]
 SERPAPI_API_KEY = st.secrets["serpapi"]["api_key"]
 
-# Set the global OpenAI API key.
-openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
-
-# -----------------------
-# 2. FIREBASE INITIALIZATION
-# -----------------------
-firebase_creds_str = st.secrets["firebase"]["credentials_json"]
-if isinstance(firebase_creds_str, str):
-    firebase_creds = json.loads(firebase_creds_str)
-else:
-    firebase_creds = firebase_creds_str
-
-if firebase_creds and not firebase_admin._apps:
-    cred = credentials.Certificate(firebase_creds)
-    firebase_admin.initialize_app(cred)
-
-db = firestore.client()
-
-# -----------------------
-# 3. INITIALIZE PINECONE & CURATED CONTENT
-# -----------------------
-import pinecone
-from pinecone import Pinecone, ServerlessSpec
-
-pc = Pinecone(api_key=st.secrets["pinecone"]["api_key"])
-pinecone_cloud = st.secrets["pinecone"].get("cloud", "aws")
-pinecone_region = st.secrets["pinecone"].get("region", "us-east-1")
-spec = ServerlessSpec(cloud=pinecone_cloud, region=pinecone_region)
-
-index_name = "learning-plan-index"
-if index_name not in pc.list_indexes().names():
-    pc.create_index(
-        name=index_name,
-        dimension=1536,  # Must match your embedding model's dimension
-        metric="cosine",
-        spec=spec
-    )
-
-curated_document = """
-High Quality Learning Plan Guidelines:
-
-1. **Define Clear Objectives:**  
-   Determine what you want to learn, why you want to learn it, and what the end goal looks like.
-
-2. **Break Down Topics:**  
-   Divide your learning into smaller, manageable topics and arrange them in a logical order.
+# OpenAI, Firebase, Pinecone and LangChain clients are built lazily, once per process (see clients.py).
+clients.configure(st.secrets)
+
+# Link validation limits (optional [link_validation] secrets section).
+link_validation_config = st.secrets.get("link_validation", {})
+LINK_CHECK_WORKERS = int(link_validation_config.get("max_workers", 16))
+LINK_CHECK_DEADLINE = float(link_validation_config.get("deadline_seconds", 20))
+
+# Pooled keep-alive HTTP session for SerpAPI, YouTube and link checks (optional [http] secrets section);
+# per_host_limit is the one per-host concurrency cap for all of them.
+http_config = st.secrets.get("http", {})
+http_client.configure(
+    pool_connections=int(http_config.get("pool_connections", 32)),
+    pool_maxsize=int(http_config.get("pool_maxsize", 16)),
+    per_host_limit=int(http_config.get("per_host_limit", 16)),
+    max_retries=int(http_config.get("max_retries", 2)),
+    backoff_base=float(http_config.get("backoff_base_seconds", 0.25)),
+    backoff_max=float(http_config.get("backoff_max_seconds", 4))
+)
 
-3. **Weekly Structure:**  
-   Create a blueprint that allocates specific topics and action items for each week, including resource recommendations.
+# Process-wide OpenAI rate limits and adaptive concurrency (optional [openai_limits] secrets section).
+# rpm/tpm should match the account's OpenAI tier.
+openai_limits_config = st.secrets.get("openai_limits", {})
+openai_limiter.configure(
+    rpm=float(openai_limits_config.get("requests_per_minute", 500)),
+    tpm=float(openai_limits_config.get("tokens_per_minute", 30000)),
+    min_concurrency=int(openai_limits_config.get("min_concurrency", 1)),
+    max_concurrency=int(openai_limits_config.get("max_concurrency", 16)),
+    initial_concurrency=int(openai_limits_config.get("initial_concurrency", 4)),
+    latency_target=float(openai_limits_config.get("latency_target_seconds", 10)),
+    plan_reserve=int(openai_limits_config.get("plan_reserve", 1)),
+    max_retries=int(openai_limits_config.get("max_retries", 2))
+)
 
-4. **Mix Learning Methods:**  
-   Use a combination of videos, articles, projects, and interactive activities to reinforce understanding.
+# Shared URL validity cache (optional [url_cache] secrets section).
+url_cache_config = st.secrets.get("url_cache", {})
+link_validation.configure_cache(
+    path=url_cache_config.get("path", ".cache/url_validity.sqlite3"),
+    max_size=int(url_cache_config.get("max_size", 10000)),
+    max_disk_entries=int(url_cache_config.get("max_disk_entries", 100000)),
+    valid_ttl_seconds=float(url_cache_config.get("valid_ttl_seconds", 7 * 24 * 3600)),
+    invalid_ttl_seconds=float(url_cache_config.get("invalid_ttl_seconds", 6 * 3600)),
+    transient_ttl_seconds=float(url_cache_config.get("transient_ttl_seconds", 300))
+)
 
-5. **Set Measurable Milestones:**  
-   Establish clear milestones and action items with deadlines to track progress.
+# Structured plan generation limits (optional [generation] secrets section).
+generation_config = st.secrets.get("generation", {})
+GENERATION_MAX_TOKENS = int(generation_config.get("max_tokens", 1700))
+GENERATION_MAX_CONTINUATIONS = int(generation_config.get("max_continuations", 2))
+
+# Per-stage pipeline timeouts in seconds (optional [pipeline] secrets section, keyed by stage name).
+STAGE_TIMEOUTS = {
+    stage: float(st.secrets.get("pipeline", {}).get(f"{stage}_timeout", default))
+    for stage, default in DEFAULT_STAGE_TIMEOUTS.items()
+}
+
+# Spans, metrics export and the trace view (optional [instrumentation] secrets section).
+instrumentation_config = st.secrets.get("instrumentation", {})
+instrumentation.configure(
+    trace_path=instrumentation_config.get("trace_path", ""),
+    slow_log_path=instrumentation_config.get("slow_log_path", ".cache/slow_requests.jsonl"),
+    slow_threshold_seconds=float(instrumentation_config.get("slow_threshold_seconds", 30)),
+    prometheus_path=instrumentation_config.get("prometheus_path", ""),
+    metrics_path=instrumentation_config.get("metrics_path", "")
+)
+TRACE_VIEW = bool(instrumentation_config.get("trace_view", False))
 
-6. **Review and Iterate:**  
-   Periodically review your plan, update it based on progress, and adjust methods as needed.
-"""
+# Saved plan layout and lazy week loading (optional [plan_storage] secrets section).
+plan_storage_config = st.secrets.get("plan_storage", {})
+PLAN_STORAGE_COMPRESS = bool(plan_storage_config.get("compress", True))
+WEEKS_PER_PAGE = int(plan_storage_config.get("weeks_per_page", 4))
+plan_storage.configure_week_cache(int(plan_storage_config.get("week_cache_size", 2000)))
 
-from langchain.text_splitter import CharacterTextSplitter
-splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-docs = splitter.split_text(curated_document)
+# Background generation pool (optional [plan_jobs] secrets section).
+plan_jobs_config = st.secrets.get("plan_jobs", {})
+JOB_POLL_SECONDS = float(plan_jobs_config.get("poll_seconds", 2))
 
 # -----------------------
-# 4. EMBEDDINGS & VECTORSTORE SETUP
-# -----------------------
-from langchain_openai import OpenAIEmbeddings
-embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY, model="text-embedding-ada-002")
-
-from langchain_pinecone import Pinecone as LC_Pinecone
-vectorstore = LC_Pinecone.from_existing_index(
-    index_name=index_name,
-    embedding=embeddings,
-    namespace="curated_learning"
-)
-
+# 2. HELPER FUNCTIONS
 # -----------------------
-# 5. HELPER FUNCTIONS
-# -----------------------
-def extract_json(text: str) -> str:
-    # Extract the first occurrence of JSON (from the first { to the last })
-    json_match = re.search(r'(\{.*\})', text, re.DOTALL)
-    if json_match:
-        return json_match.group(1).strip()
-    return ""
+@st.cache_resource
+def get_serpapi_cache() -> caching.CoalescingCache:
+    # One cache per process, shared by every session (optional [serpapi_cache] secrets section).
+    serpapi_cache_config = st.secrets.get("serpapi_cache", {})
+    return caching.CoalescingCache(
+        max_size=int(serpapi_cache_config.get("max_size", 2000)),
+        ttl=float(serpapi_cache_config.get("ttl_seconds", 24 * 3600)),
+        path=serpapi_cache_config.get("path", ".cache/serpapi.sqlite3"),
+        max_disk_entries=int(serpapi_cache_config.get("max_disk_entries", 20000)),
+        table="serpapi_results",
+        # Searches with no usable results are retried after this instead of the full TTL.
+        empty_ttl=float(serpapi_cache_config.get("empty_ttl_seconds", 600))
+    )
 
-def clean_gpt_response(response_text: str) -> str:
-    return response_text.strip()
+@st.cache_resource
+def get_plan_cache() -> PlanCache:
+    # Fully enriched plans, shared across sessions (optional [plan_cache] secrets section).
+    plan_cache_config = st.secrets.get("plan_cache", {})
+    return PlanCache(
+        max_size=int(plan_cache_config.get("max_size", 500)),
+        ttl=float(plan_cache_config.get("ttl_seconds", 7 * 24 * 3600)),
+        path=plan_cache_config.get("path", ".cache/plans.sqlite3"),
+        max_disk_entries=int(plan_cache_config.get("max_disk_entries", 5000)),
+        similarity_threshold=float(plan_cache_config.get("similarity_threshold", 0.9))
+    )
 
-def link_is_valid(url: str) -> bool:
-    try:
-        if "youtube.com" in url or "youtu.be" in url:
-            return "watch?v=" in url or "youtu.be/" in url
-        r = requests.head(url, timeout=3, allow_redirects=True)
-        if r.status_code == 200:
-            return True
-        r = requests.get(url, timeout=5)
-        return r.status_code == 200
-    except Exception:
-        return False
-
-def serpapi_search(query: str, num_results: int = 3) -> List[Dict[str, str]]:
-    url = "https://serpapi.com/search"
-    params = {
-        "engine": "google",
-        "q": query,
-        "api_key": SERPAPI_API_KEY,
-        "num": num_results
-    }
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        data = resp.json()
-        results_list = []
-        if "organic_results" in data:
-            for item in data["organic_results"][:num_results]:
-                link_url = item.get("link")
-                title = item.get("title", "Resource")
-                if link_url and link_is_valid(link_url):
-                    res_type = "video" if ("youtube.com" in link_url or "youtu.be" in link_url) else "article"
-                    results_list.append({
-                        "name": title[:70],
-                        "link": link_url,
-                        "type": res_type
-                    })
-        return results_list
-    except Exception as e:
-        st.error(f"SerpAPI error: {e}")
-        return []
-
-def retrieve_context_for_goal(goal: str) -> str:
-    results = serpapi_search(f"overview of {goal}", num_results=1)
-    if results:
-        return results[0].get("name", "")
-    return ""
-
-def get_youtube_videos(query: str, max_results: int = 10) -> List[Dict[str, str]]:
-    youtube_api_key = st.secrets["youtube"]["api_key"]
-    url = "https://www.googleapis.com/youtube/v3/search"
-    params = {
-        "part": "snippet",
-        "q": query,
-        "type": "video",
-        "maxResults": max_results,
-        "key": youtube_api_key
-    }
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        data = resp.json()
-        videos = []
-        for item in data.get("items", []):
-            title = item["snippet"]["title"]
-            video_id = item["id"]["videoId"]
-            video_link = f"https://www.youtube.com/watch?v={video_id}"
-            videos.append({"title": title, "link": video_link})
-        return videos
-    except Exception as e:
-        st.error(f"YouTube API error: {e}")
-        return []
+def serpapi_cache_stats() -> Dict[str, Any]:
+    return get_serpapi_cache().stats()
 
-def score_videos_with_gpt(videos: List[Dict[str, str]], topic: str) -> str:
-    video_list_str = "\n".join([f"{i+1}. {v['title']} - {v['link']}" for i, v in enumerate(videos)])
-    prompt = f"Return only the link of the most relevant video for the topic '{topic}' from the list:\n{video_list_str}"
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert at evaluating video relevance."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=50,
-            temperature=0.2,
-        )
-        result = response.choices[0].message.content.strip()
-        url_match = re.search(r'(https?://[^\s]+)', result)
-        if url_match:
-            return url_match.group(1)
-    except Exception as e:
-        st.error(f"Error scoring videos with GPT: {e}")
-    return ""
-
-def add_best_youtube_videos(plan: Dict[str, Any]) -> Dict[str, Any]:
-    for week in plan.get("weeks", []):
-        topic = week.get("objective", "")
-        if topic:
-            videos = get_youtube_videos(topic, max_results=10)
-            if videos:
-                best_video = score_videos_with_gpt(videos, topic)
-                if best_video:
-                    week["resources"].append({
-                        "name": f"Best Video for {topic}",
-                        "link": best_video,
-                        "type": "video"
-                    })
-    return plan
-
-def validate_links_in_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
-    for week in plan.get("weeks", []):
-        for resource in week.get("resources", []):
-            if not link_is_valid(resource["link"]):
-                fallback = serpapi_search(f"{resource.get('name', '')} {resource.get('type', '')}", num_results=1)
-                if fallback and fallback[0].get("link"):
-                    new_link = fallback[0]["link"]
-                    if link_is_valid(new_link):
-                        resource["link"] = new_link
-    return plan
+# Exported alongside the span histograms (see instrumentation.py).
+instrumentation.registry.register_gauges("generation", generation_stats.stats)
+instrumentation.registry.register_gauges("serpapi_cache", serpapi_cache_stats)
+instrumentation.registry.register_gauges("plan_cache", lambda: get_plan_cache().stats())
+instrumentation.registry.register_gauges("week_cache", plan_storage.week_cache_stats)
+instrumentation.registry.register_gauges("http_pool", http_client.pool_stats)
+instrumentation.registry.register_gauges("openai_limiter", openai_limiter.stats)
+instrumentation.registry.register_gauges("plan_jobs", lambda: get_plan_jobs().stats())
 
+@instrumentation.timed("report_issue", "firestore")
 def report_issue(plan_id: str, description: str):
+    # A reported plan should not be handed to the next user asking for the same thing.
+    plan_doc = learning_plans_ref.document(plan_id).get(field_paths=["cache_key"]).to_dict() or {}
+    if plan_doc.get("cache_key"):
+        get_plan_cache().invalidate_key(plan_doc["cache_key"])
     report_data = {
         "email": st.session_state.get("email", "unknown"),
         "plan_id": plan_id,
@@ -244,7 +162,7 @@ def report_issue(plan_id: str, description: str):
     st.success("Issue reported successfully!")
 
 # -----------------------
-# 6. THEME CSS
+# 3. THEME CSS
 # -----------------------
 def get_theme_css() -> str:
     return """
@@ -263,19 +181,44 @@ def get_theme_css() -> str:
 st.markdown(get_theme_css(), unsafe_allow_html=True)
 
 # -----------------------
-# 7. DISPLAY WEEK WITH PROGRESS (CHECKLIST, GAMIFIED INSIGHTS, & UPDATED FORMAT)
+# 4. DISPLAY WEEK WITH PROGRESS (CHECKLIST, GAMIFIED INSIGHTS, & UPDATED FORMAT)
 # -----------------------
-def display_week_with_progress(week: Dict[str, Any], week_index: int, weekly_time: int):
+def get_progress_buffer(plan_id: str) -> ProgressBuffer:
+    # One buffer per session, for the plan being viewed; switching plans flushes the old one.
+    buffer = st.session_state.get("progress_buffer")
+    if buffer is not None and buffer.plan_id != plan_id:
+        buffer.close()
+        buffer = None
+    if buffer is None:
+        debounce_seconds = float(st.secrets.get("progress", {}).get("debounce_seconds", 2))
+        buffer = ProgressBuffer.load(learning_plans_ref.document(plan_id), debounce_seconds)
+        st.session_state["progress_buffer"] = buffer
+    return buffer
+
+def flush_progress():
+    buffer = st.session_state.get("progress_buffer")
+    if buffer is not None:
+        try:
+            buffer.close()
+        except Exception as e:
+            st.error(f"Could not save your progress: {e}")
+
+def display_week_preview(week: Dict[str, Any], weekly_time: int):
+    # Read-only rendering used while the plan is still being generated (no checklist, nothing saved yet).
+    st.markdown("<div class='week-box'>", unsafe_allow_html=True)
+    st.markdown(f"### Week {week.get('week_number', '?')}: {week.get('objective', 'No Objective')}")
+    st.markdown(f"**Estimated Time: {weekly_time} hrs**")
+    if "detailed_overview" in week:
+        st.markdown(f"**Detailed Overview:** {week['detailed_overview']}")
+    if "outcomes" in week:
+        st.markdown(f"**Outcomes:** {week['outcomes']}")
+    for resource in week.get("resources", []):
+        st.markdown(f"- [{resource.get('name', 'Resource')}]({resource.get('link', '#')})")
+    st.markdown("</div>", unsafe_allow_html=True)
+
+def display_week_with_progress(week: Dict[str, Any], week_index: int, weekly_time: int, progress: ProgressBuffer):
     week_key = f"week_{week_index}_progress"
-    plan_id = st.session_state["selected_plan_id"]
-    
-    plan_doc = learning_plans_ref.document(plan_id).get().to_dict() or {}
-    progress = plan_doc.get("progress", {})
-    if week_key in progress:
-        st.session_state[week_key] = progress[week_key]
-    else:
-        if week_key not in st.session_state:
-            st.session_state[week_key] = {}
+    plan_id = progress.plan_id
     
     st.markdown("<div class='week-box'>", unsafe_allow_html=True)
     st.markdown(f"### Week {week.get('week_number', '?')}: {week.get('objective', 'No Objective')}")
@@ -321,13 +264,11 @@ def display_week_with_progress(week: Dict[str, Any], week_index: int, weekly_tim
     
     st.markdown("#### Checklist")
     for (item_id, label) in tasks:
-        if item_id not in st.session_state[week_key]:
-            st.session_state[week_key][item_id] = False
-        new_value = st.checkbox(label, value=st.session_state[week_key][item_id], key=f"{week_key}_{item_id}")
-        st.session_state[week_key][item_id] = new_value
+        new_value = st.checkbox(label, value=progress.get(week_key, item_id), key=f"{plan_id}_{week_key}_{item_id}")
+        progress.set(week_key, item_id, new_value)
 
     total_items = len(tasks)
-    completed_items = sum(1 for v in st.session_state[week_key].values() if v)
+    completed_items = sum(1 for (item_id, _) in tasks if progress.get(week_key, item_id))
     completion_pct = (completed_items / total_items * 100) if total_items > 0 else 0
     st.progress(completion_pct / 100.0)
     st.write(f"{completion_pct:.0f}% Completed")
@@ -338,119 +279,62 @@ def display_week_with_progress(week: Dict[str, Any], week_index: int, weekly_tim
             break
     
     st.markdown("</div>", unsafe_allow_html=True)
-    
-    plan_ref = learning_plans_ref.document(plan_id)
-    current_doc = plan_ref.get().to_dict() or {}
-    progress = current_doc.get("progress", {})
-    progress[week_key] = st.session_state[week_key]
-    plan_ref.update({"progress": progress})
 
 # -----------------------
-# 8. LEARNING PLAN GENERATION WITH RAG (PINECONE RETRIEVAL)
+# 5. LEARNING PLAN GENERATION WITH RAG (PINECONE RETRIEVAL)
 # -----------------------
-def generate_learning_plan(goal: str, background_level: str, weekly_time: int, timeline: str, resource_types: List[str]) -> Dict[str, Any]:
-    retrieval_query = f"learning plan guidelines for {goal}, level: {background_level}"
-    context_docs = vectorstore.similarity_search(retrieval_query, k=3)
-    context_text = "\n\n".join([doc.page_content if hasattr(doc, "page_content") else doc for doc in context_docs])
-    extra_context = retrieve_context_for_goal(goal)
-    
-    resource_types_lower = [r.lower() for r in resource_types]
-    
-    # Revised prompt: instruct GPT to output only a valid JSON object.
-    prompt = f"""
-Return ONLY a valid JSON object (with no markdown formatting or extra text) that adheres exactly to the following schema.
-Ensure that all strings are properly escaped.
-Context: {context_text}
-Extra Context: {extra_context}
-User Resource Preference: {', '.join(resource_types)}
-
-You are an advanced learning coach. A user wants to learn about {goal}.
-They are a(n) {background_level} and can dedicate {weekly_time} hours per week, with a timeline of {timeline}.
-
-For each week, provide:
-- An objective.
-- A detailed_overview that explains the plan for the week.
-- Detailed outcomes describing what the user will achieve by the end of the week.
-- Gamified insights (for example, "better than 80% of your peers").
-
-Also, include relevant resources and action items that match the user's preferred resource types: {', '.join(resource_types)}.
-
-The JSON schema is:
-{{
-  "goal": string,
-  "timeline": string,
-  "background_level": string,
-  "weekly_time": number,
-  "weeks": [
-    {{
-      "week_number": number,
-      "objective": string,
-      "detailed_overview": string,
-      "outcomes": string,
-      "gamified_insights": string,
-      "resources": [
-        {{
-          "name": string,
-          "link": string,
-          "type": string
-        }}
-      ],
-      "action_items": [
-        {{
-          "description": string,
-          "due_by": string
-        }}
-      ]
-    }}
-  ]
-}}
-"""
-    try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You create detailed, personalized learning plans with clear weekly outcomes, detailed overviews, and gamified insights."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=1700,
-            temperature=0.2
+@st.cache_resource
+def get_plan_jobs() -> plan_jobs.PlanJobQueue:
+    # One worker pool per process, shared by every session. Pipelines run off the script
+    # thread, so they get no Streamlit context: their errors are kept on the job record.
+    search_cache, plan_cache = get_serpapi_cache(), get_plan_cache()
+    youtube_config = st.secrets["youtube"]
+
+    def pipeline_factory(on_error) -> PlanPipeline:
+        return PlanPipeline(
+            serpapi_api_key=SERPAPI_API_KEY,
+            youtube_api_key=youtube_config["api_key"],
+            search_cache=search_cache,
+            plan_cache=plan_cache,
+            max_workers=int(youtube_config.get("max_workers", 6)),
+            link_check_workers=LINK_CHECK_WORKERS,
+            link_check_deadline=LINK_CHECK_DEADLINE,
+            max_tokens=GENERATION_MAX_TOKENS,
+            max_continuations=GENERATION_MAX_CONTINUATIONS,
+            stage_timeouts=STAGE_TIMEOUTS,
+            on_error=on_error
         )
-        raw_response = response.choices[0].message.content
-        st.write("DEBUG: Raw GPT Response:", raw_response)
-        cleaned_response = clean_gpt_response(raw_response)
-        try:
-            plan_dict = json.loads(cleaned_response)
-        except Exception as e:
-            st.error("JSON parsing error with json.loads: " + str(e))
-            st.write("DEBUG: Response for JSON parsing:", cleaned_response)
-            try:
-                import json5
-                plan_dict = json5.loads(cleaned_response)
-                st.write("DEBUG: Successfully parsed with json5.")
-            except Exception as e2:
-                st.error("JSON parsing also failed with json5: " + str(e2))
-                return {}
-    except Exception as e:
-        st.error("Error calling OpenAI API: " + str(e))
-        return {}
-    
-    plan_dict = add_best_youtube_videos(plan_dict)
-    
-    desired_types = [r.lower() for r in resource_types]
-    for week in plan_dict.get("weeks", []):
-        existing_types = [res.get("type", "").lower() for res in week.get("resources", [])]
-        for desired_type in desired_types:
-            if desired_type not in existing_types:
-                query = f"{goal} {week.get('objective', '')} {desired_type}"
-                fallback = serpapi_search(query, num_results=1)
-                if fallback:
-                    week["resources"].extend(fallback)
-    plan_dict = validate_links_in_plan(plan_dict)
-    st.write("DEBUG: Final Learning Plan JSON:", json.dumps(plan_dict, indent=2))
-    return plan_dict
+
+    return plan_jobs.PlanJobQueue(
+        clients.get_firestore(),
+        pipeline_factory,
+        workers=int(plan_jobs_config.get("workers", 2)),
+        max_queued=int(plan_jobs_config.get("max_queued", 8)),
+        stale_seconds=float(plan_jobs_config.get("stale_seconds", 300)),
+        heartbeat_seconds=float(plan_jobs_config.get("heartbeat_seconds", 60)),
+        compress=PLAN_STORAGE_COMPRESS
+    )
+
+def new_plan_fields(plan: Dict[str, Any]) -> Dict[str, Any]:
+    # Extra fields of a freshly attached plan document (attach() adds cache_key).
+    return {
+        "title": plan["goal"],
+        "title_lower": plan["goal"].lower(),
+        "rating": None,
+        "progress": {},
+        "progress_schema": PROGRESS_SCHEMA_VERSION,
+        "updated_at": datetime.datetime.utcnow().isoformat()
+    }
+
+def show_trace_view():
+    # Opt-in ([instrumentation] trace_view = true): span tree of this session's last generation.
+    trace_tree = st.session_state.get("last_trace")
+    if TRACE_VIEW and trace_tree:
+        with st.expander("Generation trace"):
+            st.code(instrumentation.format_tree(trace_tree), language=None)
 
 # -----------------------
-# 9. SESSION STATE INITIALIZATION
+# 6. SESSION STATE INITIALIZATION
 # -----------------------
 if "user" not in st.session_state:
     st.session_state["user"] = None
@@ -460,15 +344,19 @@ if "create_plan" not in st.session_state:
     st.session_state["create_plan"] = False
 if "selected_plan" not in st.session_state:
     st.session_state["selected_plan"] = None
-if "loading" not in st.session_state:
-    st.session_state["loading"] = False
+if "plan_job" not in st.session_state:
+    st.session_state["plan_job"] = None
+if "plan_job_checked" not in st.session_state:
+    st.session_state["plan_job_checked"] = False
 if "selected_plan_id" not in st.session_state:
     st.session_state["selected_plan_id"] = None
 if "submitted_ratings" not in st.session_state:
     st.session_state["submitted_ratings"] = {}
+if "plan_index" not in st.session_state:
+    st.session_state["plan_index"] = None
 
 # -----------------------
-# 10. AUTHENTICATION FUNCTIONS & UI
+# 7. AUTHENTICATION FUNCTIONS & UI
 # -----------------------
 def sign_up(email: str, password: str, confirm_password: str, phone: str):
     if password != confirm_password:
@@ -483,16 +371,17 @@ def sign_up(email: str, password: str, confirm_password: str, phone: str):
     try:
         user_data = {
             "email": email,
+            "email_lower": email.lower(),
             "phone": phone,
             "password": password,
             "time_spent": 0,
             "created_at": datetime.datetime.utcnow().isoformat()
         }
+        db = clients.get_firestore()
         user_ref = db.collection("users").document(email)
-        if user_ref.get().exists:
+        if not admin_stats.create_user(db, user_ref, user_data):
             st.error("A user with this email already exists. Please log in.")
             return None
-        user_ref.set(user_data)
         st.success(f"Account created for {email}. Please log in.")
         return email
     except Exception as e:
@@ -501,7 +390,8 @@ def sign_up(email: str, password: str, confirm_password: str, phone: str):
 
 def log_in(email: str, password: str):
     try:
-        user_doc = db.collection("users").document(email).get()
+        with instrumentation.span("login", "firestore"):
+            user_doc = clients.get_firestore().collection("users").document(email).get()
         if user_doc.exists:
             user_data = user_doc.to_dict()
             stored_password = user_data.get("password", "")
@@ -534,83 +424,190 @@ if not st.session_state["user"]:
     st.stop()
 
 # -----------------------
-# 11. SIDEBAR (Plan Management)
+# 8. SIDEBAR (Plan Management)
 # -----------------------
 st.sidebar.markdown("<h2><i class='material-icons icon'>folder</i> Your Learning Plans</h2>", unsafe_allow_html=True)
 
+db = clients.get_firestore()
 user_ref = db.collection("users").document(st.session_state["user"])
 learning_plans_ref = user_ref.collection("learning_plans")
-existing_plans = list(learning_plans_ref.stream())
-if len(existing_plans) >= 5:
+
+def load_plan_index() -> List[Dict[str, Any]]:
+    # Lightweight per-session listing of the user's plans; plan bodies are never downloaded here.
+    if st.session_state.get("plan_index") is None:
+        plan_index = []
+        with instrumentation.span("plan_index", "firestore"):
+            for doc in learning_plans_ref.select(["title", "rating", "updated_at"]).stream():
+                data = doc.to_dict() or {}
+                plan_index.append({
+                    "id": doc.id,
+                    "title": data.get("title", "Unnamed Plan"),
+                    "rating": data.get("rating"),
+                    "updated_at": data.get("updated_at"),
+                })
+        st.session_state["plan_index"] = plan_index
+    return st.session_state["plan_index"]
+
+def invalidate_plan_index():
+    st.session_state["plan_index"] = None
+
+def get_stored_plan(plan_id: str) -> Optional[plan_storage.StoredPlan]:
+    # Plan metadata is reused until the index reports a newer updated_at; weeks load on demand.
+    entry = next((p for p in load_plan_index() if p["id"] == plan_id), None)
+    if entry is None:
+        return None
+    cached = st.session_state.get("stored_plan")
+    if cached is not None and cached.plan_ref.id == plan_id and cached.updated_at == entry["updated_at"]:
+        return cached
+    stored_plan = plan_storage.load_plan(db, learning_plans_ref.document(plan_id))
+    st.session_state["stored_plan"] = stored_plan
+    return stored_plan
+
+def finish_plan_job(job_id: str):
+    st.session_state["plan_job"] = None
+    st.session_state["last_trace"] = get_plan_jobs().trace(job_id)
+    invalidate_plan_index()
+
+# A job left running (or finished but not yet attached) by an earlier session is picked up once per login.
+if not st.session_state["plan_job_checked"]:
+    st.session_state["plan_job_checked"] = True
+    st.session_state["plan_job"] = get_plan_jobs().open_job(st.session_state["user"])
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_plan_job():
+    # Polls this session's generation job, rerunning only this panel until the job finishes.
+    job_id = st.session_state.get("plan_job")
+    if not job_id:
+        return
+    jobs = get_plan_jobs()
+    record = jobs.poll(job_id) or {}
+    status = record.get("status")
+    if status in (plan_jobs.DONE, plan_jobs.ATTACHED):
+        plan_id = jobs.attach(job_id, learning_plans_ref, new_plan_fields)
+        if plan_id is None:
+            return  # the record hasn't caught up with the worker yet; try again next poll
+        finish_plan_job(job_id)
+        flush_progress()
+        st.session_state["selected_plan_id"] = plan_id
+        st.session_state["create_plan"] = False
+        rerun()
+    elif status in plan_jobs.ACTIVE_STATUSES:
+        progress = record.get("progress") or {}
+        done, expected = progress.get("weeks_done", 0), progress.get("weeks_expected")
+        if status == plan_jobs.QUEUED:
+            label = "Waiting for a free slot to generate your plan..."
+        elif expected:
+            label = f"Generating your tailored learning plan... {done} of {expected} weeks ready"
+        else:
+            label = f"Generating your tailored learning plan... {done} weeks ready"
+        st.progress(min(1.0, done / expected) if expected else 0.0, text=label)
+        # Full weeks when the job runs in this process; other workers' records carry only objectives.
+        weekly_time = (record.get("params") or {}).get("weekly_time", "N/A")
+        if record.get("weeks"):
+            for week in record["weeks"]:
+                display_week_preview(week, weekly_time)
+        else:
+            for week in progress.get("preview", []):
+                st.markdown(f"- Week {week.get('week_number', '?')}: {week.get('objective', '')}")
+    else:
+        finish_plan_job(job_id)
+        st.session_state["plan_job_error"] = record.get("error") or "Plan generation failed or returned empty. Please try again."
+        rerun()
+
+plan_index = load_plan_index()
+if len(plan_index) >= 5:
     st.sidebar.error("Plan limit reached (5 plans maximum). Please delete an existing plan to create a new one.")
 
-if st.sidebar.button("Create New Learning Plan") and len(existing_plans) < 5:
+if st.sidebar.button("Create New Learning Plan") and len(plan_index) < 5:
+    flush_progress()
     st.session_state["create_plan"] = True
     st.session_state["selected_plan"] = None
+    st.session_state["selected_plan_id"] = None
     rerun()
 
 st.sidebar.markdown('<div class="sidebar-divider"></div>', unsafe_allow_html=True)
 st.sidebar.subheader("Saved Learning Plans")
 
-def load_saved_plans():
-    return learning_plans_ref.stream()
-
-for doc in load_saved_plans():
-    plan_data = doc.to_dict()
-    full_title = plan_data.get("title", "Unnamed Plan")
+for entry in plan_index:
+    full_title = entry["title"]
     short_title_words = full_title.split()[:3]
     short_title = " ".join(short_title_words)
     if len(full_title.split()) > 3:
         short_title += "..."
-    plan_id = doc.id
+    plan_id = entry["id"]
     col1, col2 = st.sidebar.columns([4, 1])
     with col1:
         if st.button(short_title, key=f"view_{plan_id}"):
-            st.session_state["selected_plan"] = json.loads(plan_data.get("plan", "{}"))
+            flush_progress()
+            st.session_state["selected_plan"] = None
             st.session_state["selected_plan_id"] = plan_id
             st.session_state["create_plan"] = False
             rerun()
     with col2:
         if st.button("🗑️", key=f"del_{plan_id}", help="Delete Plan"):
-            learning_plans_ref.document(plan_id).delete()
+            buffer = st.session_state.get("progress_buffer")
+            if buffer is not None and buffer.plan_id == plan_id:
+                buffer.discard()
+                st.session_state.pop("progress_buffer")
+            plan_ref = learning_plans_ref.document(plan_id)
+            admin_stats.delete_plan(db, plan_ref, child_refs=lambda data: plan_storage.week_refs(
+                plan_ref, int(data.get("week_count") or 0)))
+            invalidate_plan_index()
+            if st.session_state.get("selected_plan_id") == plan_id:
+                st.session_state["selected_plan"] = None
+                st.session_state["selected_plan_id"] = None
             rerun()   
          
 st.sidebar.markdown('<div class="sidebar-divider"></div>', unsafe_allow_html=True)
 if st.sidebar.button("Logout"):
+    flush_progress()
     st.session_state.clear()
     rerun()
 
 # -----------------------
-# 12. MAIN CONTENT AREA (Plan Viewer / Creator)
+# 9. MAIN CONTENT AREA (Plan Viewer / Creator)
 # -----------------------
 st.markdown("<h1><i class='material-icons icon'>dashboard</i> Yello Personalised Learning Plan Generator</h1>", unsafe_allow_html=True)
+show_plan_job()
+job_error = st.session_state.pop("plan_job_error", None)
+if job_error:
+    st.error(job_error)
+    show_trace_view()
 
-if st.session_state.get("selected_plan_id"):
-    doc = learning_plans_ref.document(st.session_state["selected_plan_id"]).get()
-    if doc.exists:
-        st.session_state["selected_plan"] = json.loads(doc.to_dict().get("plan", "{}"))
+stored_plan = get_stored_plan(st.session_state["selected_plan_id"]) if st.session_state.get("selected_plan_id") else None
+st.session_state["selected_plan"] = stored_plan.meta if stored_plan else None
 
-if st.session_state["selected_plan"]:
-    plan = st.session_state["selected_plan"]
+if stored_plan:
+    plan = stored_plan.meta
     plan_id = st.session_state["selected_plan_id"]
+    plan_entry = next((p for p in plan_index if p["id"] == plan_id), {})
     st.subheader(f"Learning Plan: {plan.get('goal', 'No Title')}")
     st.markdown(f"<p class='small-muted'><strong>Duration:</strong> {plan.get('timeline', 'N/A')}</p>", unsafe_allow_html=True)
     st.markdown(f"<p class='small-muted'><strong>Background Level:</strong> {plan.get('background_level', 'N/A')}</p>", unsafe_allow_html=True)
     st.markdown(f"<p class='small-muted'><strong>Weekly Time Available:</strong> {plan.get('weekly_time', 'N/A')} hrs</p>", unsafe_allow_html=True)
     
     weekly_time_val = plan.get("weekly_time", 0)
-    for idx, week in enumerate(plan.get("weeks", [])):
-        display_week_with_progress(week, idx, weekly_time_val)
+    progress_buffer = get_progress_buffer(plan_id)
+    visible_weeks_key = f"visible_weeks_{plan_id}"
+    visible_weeks = st.session_state.get(visible_weeks_key, WEEKS_PER_PAGE)
+    for idx, week in enumerate(stored_plan.weeks(0, visible_weeks)):
+        display_week_with_progress(week, idx, weekly_time_val, progress_buffer)
+    if visible_weeks < stored_plan.week_count:
+        remaining = stored_plan.week_count - visible_weeks
+        if st.button(f"Show more weeks ({remaining} remaining)", key=f"more_weeks_{plan_id}"):
+            st.session_state[visible_weeks_key] = visible_weeks + WEEKS_PER_PAGE
+            rerun()
+    show_trace_view()
     
-    if plan.get("rating") is None:
+    if plan_entry.get("rating") is None:
         rating = st.slider("Your Rating (1-5)", 1, 5, 3, key=f"rating_{plan_id}")
         if st.button("Submit Rating", key=f"submit_rating_{plan_id}"):
-            learning_plans_ref.document(plan_id).update({"rating": rating})
-            st.session_state["selected_plan"]["rating"] = rating
+            admin_stats.submit_rating(db, learning_plans_ref.document(plan_id), rating)
+            invalidate_plan_index()
             st.success("Thank you for your feedback!")
             rerun()
     else:
-        st.write(f"Rating submitted: {plan.get('rating')}/5")
+        st.write(f"Rating submitted: {plan_entry.get('rating')}/5")
     
     st.markdown("### Report an Issue")
     issue_key = f"issue_{plan_id}"
@@ -638,31 +635,20 @@ elif st.session_state["create_plan"]:
     resource_options = ["Videos", "Articles", "Podcasts", "Books", "Courses"]
     chosen_resources = st.multiselect("Which types of resources do you want in your plan?", resource_options, default=["Videos", "Articles"])
     
-    if st.button("Generate Learning Plan"):
+    if st.button("Generate Learning Plan", disabled=bool(st.session_state.get("plan_job"))):
         if not subject:
             st.error("Please specify what you want to learn.")
         else:
-            st.session_state["loading"] = True
-            rerun()
-    if st.session_state["loading"]:
-        with st.spinner("Generating your tailored learning plan..."):
-            plan_data = generate_learning_plan(subject, background_level, weekly_time, timeline, chosen_resources)
-            if plan_data and plan_data.get("weeks"):
-                st.session_state["selected_plan"] = plan_data
-                new_plan_ref = learning_plans_ref.document()
-                st.session_state["selected_plan_id"] = new_plan_ref.id
-                st.session_state["create_plan"] = False
-                st.session_state["loading"] = False
-                new_plan_ref.set({
-                    "title": plan_data["goal"],
-                    "plan": json.dumps(plan_data),
-                    "rating": None,
-                    "progress": {}
-                })
-                st.success("Learning plan generated and saved!")
-                rerun()
+            try:
+                st.session_state["plan_job"] = get_plan_jobs().submit(
+                    st.session_state["user"],
+                    {"goal": subject, "background_level": background_level, "weekly_time": weekly_time,
+                     "timeline": timeline, "resource_types": chosen_resources},
+                    plan_cache_key(subject, background_level, weekly_time, timeline, chosen_resources)
+                )
+            except plan_jobs.QueueFull:
+                st.error("Lots of plans are being generated right now. Please try again in a minute.")
             else:
-                st.session_state["loading"] = False
-                st.error("Plan generation failed or returned empty. Please try again.")
+                rerun()
 else:
     st.write("No learning plan selected. Create a new plan or select one from the sidebar.")